@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CustomUser, Node, Edge, Map, HashTag
+from .models import CustomUser, Node, Edge, Map, HashTag, MapOperation, MapAutosaveBuffer
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
@@ -46,4 +46,23 @@ class MapAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
     filter_horizontal = ('hashtags',)
 
+@admin.register(MapOperation)
+class MapOperationAdmin(admin.ModelAdmin):
+    """
+    Административная панель для просмотра журнала операций карт.
+    
+    Настройки отображения и фильтрации операций.
+    """
+    list_display = ('id', 'map', 'seq', 'op_type', 'author', 'created_at', 'applied_at', 'error')
+    list_filter = ('op_type', 'applied_at')
+    readonly_fields = ('created_at',)
+
+@admin.register(MapAutosaveBuffer)
+class MapAutosaveBufferAdmin(admin.ModelAdmin):
+    """
+    Административная панель для просмотра буферов автосохранения карт.
+    """
+    list_display = ('id', 'map', 'edits', 'buffered_at', 'updated_at')
+    readonly_fields = ('updated_at',)
+
 admin.site.register(HashTag)
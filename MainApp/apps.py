@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MainappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'MainApp'
+
+    def ready(self):
+        # Подключение обработчиков сигналов
+        from . import public_cache, representations, snapshots, tiles  # noqa: F401
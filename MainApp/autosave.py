@@ -0,0 +1,333 @@
+import copy
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import MapAutosaveBuffer
+from .serializers import MapSerializer
+from .validators import coerce_id
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 30
+DEFAULT_MAX_EDITS = 200
+
+# Основные поля карты, которые можно менять через автосохранение
+MAP_FIELDS = ('title', 'description', 'center_latitude', 'center_longitude')
+
+
+def get_flush_interval():
+    """Возвращает время в секундах, после которого буфер сбрасывается по таймеру."""
+    return getattr(settings, 'MAP_AUTOSAVE_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+
+
+def get_max_edits():
+    """Возвращает число изменений, после которого буфер сбрасывается сразу."""
+    return getattr(settings, 'MAP_AUTOSAVE_MAX_EDITS', DEFAULT_MAX_EDITS)
+
+
+def _resolve_flushed_nodes(edge_data, node_ids):
+    """
+    Заменяет временные ID уже сохраненных узлов в ребре на ID из базы
+    и приводит ID узлов к int.
+    """
+    edge_data = dict(edge_data)
+    for key in ('node1', 'node2'):
+        if edge_data.get(key) is not None:
+            edge_data[key] = coerce_id(edge_data[key])
+        temp_id = edge_data.get(f'{key}_temp_id')
+        if temp_id is not None and str(temp_id) in node_ids:
+            del edge_data[f'{key}_temp_id']
+            edge_data[key] = node_ids[str(temp_id)]
+    return edge_data
+
+
+def _merge_edge(target, edge_data):
+    """Сливает поля ребра; новая ссылка на узел заменяет старую любого вида."""
+    for key in ('node1', 'node2'):
+        if key in edge_data:
+            target.pop(f'{key}_temp_id', None)
+        if f'{key}_temp_id' in edge_data:
+            target.pop(key, None)
+    target.update(edge_data)
+
+
+def _new_edge_key(edge_data):
+    """Ключ нового ребра: временный ID ребра или пара ссылок на его узлы."""
+    if edge_data.get('temp_id') is not None:
+        return f"edge:{edge_data['temp_id']}"
+    refs = []
+    for key in ('node1', 'node2'):
+        if edge_data.get(f'{key}_temp_id') is not None:
+            refs.append(f"temp:{edge_data[f'{key}_temp_id']}")
+        else:
+            refs.append(f"id:{edge_data.get(key)}")
+    return '|'.join(refs)
+
+
+def merge_changes(changes, delta, node_ids=None):
+    """
+    Сливает изменения автосохранения с уже накопленными.
+
+    Правки одного объекта объединяются по полям, побеждает последнее
+    значение. Удаление узла отменяет накопленные правки узла и ребра,
+    которые на него ссылаются; новый узел удаляется по временному ID
+    (deleted_node_temp_ids) и тогда не создается при сбросе. Новые узлы, уже сохраненные предыдущим
+    сбросом буфера, по temp_id превращаются в изменения сохраненных узлов.
+
+    Args:
+        changes (dict): Накопленный набор изменений (не изменяется)
+        delta (dict): Проверенные изменения из MapAutosaveSerializer
+        node_ids (dict): ID сохраненных узлов по временному ID
+
+    Returns:
+        dict: Новый набор изменений
+    """
+    node_ids = node_ids or {}
+    merged = copy.deepcopy(changes)
+    map_fields = merged.setdefault('map', {})
+    new_nodes = merged.setdefault('new_nodes', {})
+    changed_nodes = merged.setdefault('changed_nodes', {})
+    deleted_node_ids = merged.setdefault('deleted_node_ids', [])
+    new_edges = merged.setdefault('new_edges', {})
+    changed_edges = merged.setdefault('changed_edges', {})
+    deleted_edge_ids = merged.setdefault('deleted_edge_ids', [])
+
+    for field in MAP_FIELDS:
+        if field in delta:
+            map_fields[field] = delta[field]
+
+    def change_node(node_id, fields):
+        if node_id not in deleted_node_ids:
+            changed_nodes.setdefault(str(node_id), {}).update(fields)
+
+    for temp_id, fields in delta.get('new_nodes', []):
+        if str(temp_id) in node_ids:
+            change_node(node_ids[str(temp_id)], fields)
+        else:
+            new_nodes.setdefault(str(temp_id), {'temp_id': temp_id}).update(fields)
+
+    for node_id, fields in delta.get('changed_nodes', {}).items():
+        change_node(node_id, fields)
+
+    def drop_edges_of(refers):
+        for edges in (new_edges, changed_edges):
+            for key in [key for key, edge in edges.items() if refers(edge)]:
+                del edges[key]
+
+    # Новый узел, удаленный до сброса буфера, не создается вовсе
+    deleted_ids = list(delta.get('deleted_node_ids', []))
+    for temp_id in delta.get('deleted_node_temp_ids', []):
+        if str(temp_id) in node_ids:
+            deleted_ids.append(node_ids[str(temp_id)])
+            continue
+        new_nodes.pop(str(temp_id), None)
+        drop_edges_of(lambda edge: temp_id in (coerce_id(edge.get('node1_temp_id')), coerce_id(edge.get('node2_temp_id'))))
+
+    for node_id in deleted_ids:
+        changed_nodes.pop(str(node_id), None)
+        if node_id not in deleted_node_ids:
+            deleted_node_ids.append(node_id)
+        drop_edges_of(lambda edge: node_id in (edge.get('node1'), edge.get('node2')))
+
+    for edge_data in delta.get('new_edges', []):
+        edge_data = _resolve_flushed_nodes(edge_data, node_ids)
+        _merge_edge(new_edges.setdefault(_new_edge_key(edge_data), {}), edge_data)
+
+    for edge_data in delta.get('changed_edges', []):
+        edge_id = coerce_id(edge_data.get('id'))
+        if edge_id is None or edge_id in deleted_edge_ids:
+            continue
+        edge_data = _resolve_flushed_nodes(edge_data, node_ids)
+        edge_data['id'] = edge_id
+        _merge_edge(changed_edges.setdefault(str(edge_id), {}), edge_data)
+
+    for edge_id in delta.get('deleted_edge_ids', []):
+        changed_edges.pop(str(edge_id), None)
+        if edge_id not in deleted_edge_ids:
+            deleted_edge_ids.append(edge_id)
+
+    return merged
+
+
+def changes_to_payload(changes):
+    """Преобразует накопленный набор изменений в данные PATCH-запроса карты."""
+    payload = dict(changes.get('map', {}))
+    if changes.get('new_nodes'):
+        payload['new_nodes'] = list(changes['new_nodes'].values())
+    if changes.get('changed_nodes'):
+        payload['changed_nodes'] = [
+            dict(fields, id=int(node_id)) for node_id, fields in changes['changed_nodes'].items()
+        ]
+    if changes.get('deleted_node_ids'):
+        payload['deleted_node_ids'] = list(changes['deleted_node_ids'])
+    if changes.get('new_edges'):
+        payload['new_edges'] = list(changes['new_edges'].values())
+    if changes.get('changed_edges'):
+        payload['changed_edges'] = list(changes['changed_edges'].values())
+    if changes.get('deleted_edge_ids'):
+        payload['deleted_edge_ids'] = list(changes['deleted_edge_ids'])
+    return payload
+
+
+def buffer_changes(map_instance, delta):
+    """
+    Добавляет изменения автосохранения в буфер карты.
+
+    Запись в буфер - одна строка на карту, независимо от числа правок.
+    Если накоплено MAP_AUTOSAVE_MAX_EDITS изменений, буфер сразу сбрасывается.
+
+    Args:
+        map_instance (Map): Карта
+        delta (dict): Проверенные изменения из MapAutosaveSerializer
+
+    Returns:
+        MapAutosaveBuffer: Буфер карты после слияния
+    """
+    with transaction.atomic():
+        buffer, _ = MapAutosaveBuffer.objects.select_for_update().get_or_create(map=map_instance)
+        buffer.changes = merge_changes(buffer.changes, delta, buffer.node_ids)
+        buffer.edits += 1
+        if buffer.buffered_at is None:
+            buffer.buffered_at = timezone.now()
+        buffer.save()
+    if buffer.edits >= get_max_edits() and flush_pending_autosave(map_instance):
+        buffer.refresh_from_db()
+    return buffer
+
+
+def flush_autosave(map_id, forget_ids=False):
+    """
+    Сбрасывает буфер автосохранения карты в таблицы Node/Edge.
+
+    Накопленные изменения применяются одним PATCH-обновлением
+    (MapSerializer, MapBulkWriter) под блокировкой строки буфера. Если
+    изменения не проходят проверку, запись в карту откатывается, а
+    изменения переносятся в rejected_changes вместе с ошибкой: буфер
+    очищается и принимает новые правки, а клиент узнает об отклоненных
+    изменениях при следующем запросе (pop_rejected_autosave).
+
+    Args:
+        map_id (int): ID карты
+        forget_ids (bool): Очистить соответствие временных ID после сброса.
+            Используется при явном сохранении, когда клиент получает
+            соответствие в ответе и больше не ссылается на временные ID.
+
+    Returns:
+        dict: ID сохраненных узлов по временному ID (пустой, если буфера нет)
+
+    Raises:
+        ValidationError: Накопленные изменения не прошли проверку
+    """
+    error = None
+    with transaction.atomic():
+        buffer = (
+            MapAutosaveBuffer.objects
+            .select_for_update()
+            .select_related('map')
+            .filter(map_id=map_id)
+            .first()
+        )
+        if buffer is None:
+            return {}
+        if buffer.changes:
+            try:
+                with transaction.atomic():
+                    serializer = MapSerializer(buffer.map, data=changes_to_payload(buffer.changes), partial=True)
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+            except serializers.ValidationError as e:
+                error = e
+                logger.error(f"Карта ID: {map_id}: изменения автосохранения отклонены: {e.detail}")
+                buffer.rejected_changes = buffer.changes
+                buffer.error = e.detail
+            else:
+                for temp_id, node in (getattr(serializer, '_client_index_map', None) or {}).items():
+                    buffer.node_ids[str(temp_id)] = getattr(node, 'id', node)
+                logger.info(f"Карта ID: {map_id}: сброшен буфер автосохранения, изменений: {buffer.edits}")
+        node_ids = dict(buffer.node_ids)
+        buffer.changes = {}
+        buffer.edits = 0
+        buffer.buffered_at = None
+        if forget_ids:
+            buffer.node_ids = {}
+        buffer.save()
+    if error is not None:
+        raise error
+    return node_ids
+
+
+def pop_rejected_autosave(map_instance):
+    """
+    Возвращает и забывает изменения, отклоненные при сбросе буфера.
+
+    Returns:
+        dict: {'error', 'details', 'rejected'} или None, если отклоненных изменений нет
+    """
+    with transaction.atomic():
+        buffer = (
+            MapAutosaveBuffer.objects
+            .select_for_update()
+            .filter(map=map_instance, error__isnull=False)
+            .first()
+        )
+        if buffer is None:
+            return None
+        rejected = {
+            'error': 'Изменения автосохранения не прошли проверку и не записаны',
+            'details': buffer.error,
+            'rejected': changes_to_payload(buffer.rejected_changes),
+        }
+        buffer.rejected_changes = {}
+        buffer.error = None
+        buffer.save(update_fields=['rejected_changes', 'error', 'updated_at'])
+    return rejected
+
+
+def flush_pending_autosave(map_instance):
+    """
+    Сбрасывает буфер карты перед чтением или записью, если в нем есть изменения.
+
+    Ошибки проверки не прерывают запрос: отклоненные изменения убираются
+    из буфера (flush_autosave) и возвращаются клиенту при следующем
+    запросе автосохранения.
+
+    Returns:
+        bool: True, если изменения из буфера записаны в карту
+    """
+    if not MapAutosaveBuffer.objects.filter(map=map_instance, buffered_at__isnull=False).exists():
+        return False
+    try:
+        flush_autosave(map_instance.id)
+    except serializers.ValidationError:
+        return False
+    return True
+
+
+def flush_due_autosaves(max_age=None):
+    """
+    Сбрасывает буферы, изменения в которых ждут дольше max_age секунд.
+
+    Args:
+        max_age (float): Возраст первого несброшенного изменения
+            (по умолчанию MAP_AUTOSAVE_FLUSH_INTERVAL)
+
+    Returns:
+        int: Количество сброшенных буферов, включая буферы с отклоненными изменениями
+    """
+    max_age = get_flush_interval() if max_age is None else max_age
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    map_ids = MapAutosaveBuffer.objects.filter(buffered_at__lte=cutoff).values_list('map_id', flat=True)
+    flushed = 0
+    for map_id in list(map_ids):
+        try:
+            flush_autosave(map_id)
+        except serializers.ValidationError:
+            # Изменения перенесены в rejected_changes, буфер очищен
+            pass
+        flushed += 1
+    return flushed
@@ -0,0 +1,407 @@
+import hashlib
+import json
+import logging
+
+from django.db.models import Q
+from rest_framework import serializers
+
+from .models import Map, Node, Edge, MapTombstone
+
+logger = logging.getLogger(__name__)
+
+# Поля узла и ребра, которые можно изменять через API карты
+NODE_WRITE_FIELDS = ('name', 'latitude', 'longitude', 'description', 'z_coordinate')
+EDGE_WRITE_FIELDS = ('node1', 'node2', 'description', 'style')
+
+DEFAULT_EDGE_STYLE = {
+    'color': '#1DA1F2',
+    'width': 3,
+    'lineStyle': 'solid'
+}
+
+
+def content_hash(values):
+    """
+    Возвращает хеш содержимого строки узла или ребра.
+
+    Args:
+        values (dict): Значения полей
+
+    Returns:
+        str: Шестнадцатеричный хеш, не зависящий от порядка полей
+    """
+    payload = json.dumps(values, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _normalize_node(fields):
+    """Приводит поля узла к виду, в котором клиент и база сравнимы между собой."""
+    normalized = dict(fields)
+    for key in ('latitude', 'longitude'):
+        if normalized.get(key) is not None:
+            normalized[key] = float(normalized[key])
+    if 'description' in normalized:
+        normalized['description'] = normalized['description'] or ''
+    if 'z_coordinate' in normalized:
+        normalized['z_coordinate'] = float(normalized['z_coordinate'] or 0)
+    return normalized
+
+
+def _normalize_edge(fields):
+    """Приводит поля ребра к виду, в котором клиент и база сравнимы между собой."""
+    normalized = dict(fields)
+    if 'description' in normalized:
+        normalized['description'] = normalized['description'] or ''
+    if 'style' in normalized:
+        normalized['style'] = normalized['style'] or DEFAULT_EDGE_STYLE
+    return normalized
+
+
+class MapBulkWriter:
+    """
+    Пакетная запись изменений узлов и связей карты.
+
+    Все операции выполняются множествами: новые строки создаются через
+    ``bulk_create``, изменённые - через ``bulk_update``, а связи карты с узлами
+    и рёбрами меняются прямыми вставками и удалениями в промежуточных таблицах.
+    Количество запросов не зависит от размера набора изменений.
+    Валидация входных данных выполняется вызывающей стороной, транзакцией
+    также управляет вызывающая сторона.
+
+    При первой записи версия карты увеличивается один раз на весь набор
+    изменений; созданные и измененные строки получают эту версию, а для
+    убранных с карты узлов и ребер создаются записи MapTombstone.
+
+    Если передана ожидаемая версия, увеличение версии выполняется только при
+    ее совпадении с текущей; при расхождении поднимается MapVersionConflict
+    и вызывающая сторона откатывает транзакцию.
+
+    Attributes:
+        map (Map): Карта, к которой применяются изменения
+        expected_version (int): Версия, от которой строились изменения, или None
+    """
+    node_through = Map.nodes.through
+    edge_through = Map.edges.through
+
+    def __init__(self, map_instance, expected_version=None):
+        self.map = map_instance
+        self.expected_version = expected_version
+        self._version = None
+
+    def ensure_version(self):
+        """
+        Возвращает версию карты для текущего набора изменений,
+        увеличивая ее при первом вызове.
+        """
+        if self._version is None:
+            self._version = self.map.bump_version(expected=self.expected_version)
+        return self._version
+
+    def _add_tombstones(self, kind, object_ids):
+        if not object_ids:
+            return
+        version = self.ensure_version()
+        MapTombstone.objects.bulk_create([
+            MapTombstone(map_id=self.map.id, kind=kind, object_id=object_id, version=version)
+            for object_id in object_ids
+        ])
+
+    def _map_node_ids(self, node_ids):
+        """Возвращает множество ID из node_ids, которые принадлежат карте."""
+        if not node_ids:
+            return set()
+        return set(
+            self.node_through.objects
+            .filter(map_id=self.map.id, node_id__in=node_ids)
+            .values_list('node_id', flat=True)
+        )
+
+    def delete_nodes(self, node_ids):
+        """
+        Убирает узлы с карты вместе со всеми связями карты, которые их касаются.
+
+        Args:
+            node_ids (Iterable[int]): ID удаляемых узлов
+
+        Returns:
+            set: ID узлов, которые действительно были на карте
+        """
+        node_ids = set(node_ids)
+        found_ids = self._map_node_ids(node_ids)
+        missing = node_ids - found_ids
+        if missing:
+            logger.warning(f"Узлы {sorted(missing)} не найдены для удаления")
+        if not found_ids:
+            return found_ids
+
+        related_edges = Edge.objects.filter(Q(node1_id__in=found_ids) | Q(node2_id__in=found_ids))
+        edge_links = self.edge_through.objects.filter(map_id=self.map.id, edge_id__in=related_edges.values('id'))
+        removed_edge_ids = list(edge_links.values_list('edge_id', flat=True))
+        if removed_edge_ids:
+            self.edge_through.objects.filter(map_id=self.map.id, edge_id__in=removed_edge_ids).delete()
+        self.node_through.objects.filter(map_id=self.map.id, node_id__in=found_ids).delete()
+        self._add_tombstones(MapTombstone.NODE, found_ids)
+        self._add_tombstones(MapTombstone.EDGE, removed_edge_ids)
+        logger.debug(f"Удалено узлов: {len(found_ids)}, связанных ребер: {len(removed_edge_ids)}")
+        return found_ids
+
+    def create_nodes(self, nodes_data):
+        """
+        Создает узлы и добавляет их на карту.
+
+        Args:
+            nodes_data (list[dict]): Проверенные данные узлов
+
+        Returns:
+            list[Node]: Созданные узлы в порядке nodes_data
+        """
+        if not nodes_data:
+            return []
+        version = self.ensure_version()
+        new_nodes = [Node(**data, version=version) for data in nodes_data]
+        for node in new_nodes:
+            node.update_grid_cell()
+        new_nodes = Node.objects.bulk_create(new_nodes)
+        self.node_through.objects.bulk_create(
+            [self.node_through(map_id=self.map.id, node_id=node.id) for node in new_nodes],
+            ignore_conflicts=True,
+        )
+        logger.debug(f"Создано узлов: {len(new_nodes)}")
+        return new_nodes
+
+    def update_nodes(self, changes):
+        """
+        Обновляет узлы карты одним запросом.
+
+        Args:
+            changes (dict[int, dict]): Новые значения полей по ID узла
+
+        Returns:
+            list[Node]: Обновленные узлы
+        """
+        if not changes:
+            return []
+        nodes = list(self.map.nodes.filter(id__in=changes.keys()))
+        missing = set(changes) - {node.id for node in nodes}
+        if missing:
+            logger.warning(f"Узлы {sorted(missing)} не найдены для обновления")
+
+        fields = set()
+        for node in nodes:
+            for attr, value in changes[node.id].items():
+                if attr in NODE_WRITE_FIELDS:
+                    setattr(node, attr, value)
+                    fields.add(attr)
+        if nodes and fields:
+            version = self.ensure_version()
+            for node in nodes:
+                node.version = version
+            if {'latitude', 'longitude'} & fields:
+                for node in nodes:
+                    node.update_grid_cell()
+                fields.add('grid_cell')
+            Node.objects.bulk_update(nodes, sorted(fields) + ['version'])
+        logger.debug(f"Обновлено узлов: {len(nodes)}")
+        return nodes
+
+    def delete_edges(self, edge_ids):
+        """
+        Убирает ребра с карты.
+
+        Args:
+            edge_ids (Iterable[int]): ID удаляемых ребер
+
+        Returns:
+            int: Количество убранных ребер
+        """
+        edge_ids = set(edge_ids)
+        if not edge_ids:
+            return 0
+        links = self.edge_through.objects.filter(map_id=self.map.id, edge_id__in=edge_ids)
+        removed_ids = list(links.values_list('edge_id', flat=True))
+        if len(removed_ids) < len(edge_ids):
+            logger.warning(f"Не найдено для удаления ребер: {len(edge_ids) - len(removed_ids)}")
+        if removed_ids:
+            self.edge_through.objects.filter(map_id=self.map.id, edge_id__in=removed_ids).delete()
+            self._add_tombstones(MapTombstone.EDGE, removed_ids)
+        return len(removed_ids)
+
+    def create_edges(self, edges_data):
+        """
+        Создает ребра между узлами карты и добавляет их на карту.
+
+        Ребра, у которых хотя бы один из узлов отсутствует на карте, пропускаются.
+
+        Args:
+            edges_data (list[dict]): Проверенные данные ребер с целыми ID node1 и node2
+
+        Returns:
+            list[Edge]: Созданные ребра
+        """
+        if not edges_data:
+            return []
+        referenced = {data['node1'] for data in edges_data} | {data['node2'] for data in edges_data}
+        map_node_ids = self._map_node_ids(referenced)
+
+        new_edges = []
+        for data in edges_data:
+            if data['node1'] in map_node_ids and data['node2'] in map_node_ids:
+                new_edges.append(Edge(
+                    version=self.ensure_version(),
+                    node1_id=data['node1'],
+                    node2_id=data['node2'],
+                    description=data.get('description', ''),
+                    style=data.get('style', {}),
+                    temp_id=data.get('temp_id'),
+                ))
+            else:
+                logger.warning(f"Один или оба узла ({data['node1']}, {data['node2']}) не найдены для создания нового ребра")
+        if not new_edges:
+            return []
+
+        new_edges = Edge.objects.bulk_create(new_edges)
+        self.edge_through.objects.bulk_create(
+            [self.edge_through(map_id=self.map.id, edge_id=edge.id) for edge in new_edges],
+            ignore_conflicts=True,
+        )
+        logger.debug(f"Создано ребер: {len(new_edges)}")
+        return new_edges
+
+    def update_edges(self, changes):
+        """
+        Обновляет ребра карты одним запросом.
+
+        Args:
+            changes (dict[int, dict]): Новые значения полей по ID ребра
+
+        Returns:
+            list[Edge]: Обновленные ребра
+
+        Raises:
+            ValidationError: Если ребро ссылается на несуществующий узел
+        """
+        if not changes:
+            return []
+        edges = list(self.map.edges.filter(id__in=changes.keys()))
+        missing = set(changes) - {edge.id for edge in edges}
+        if missing:
+            logger.warning(f"Ребра {sorted(missing)} не найдены для обновления")
+
+        referenced = set()
+        for edge in edges:
+            referenced.update(changes[edge.id][key] for key in ('node1', 'node2') if key in changes[edge.id])
+        known = set(Node.objects.filter(id__in=referenced).values_list('id', flat=True)) if referenced else set()
+        unknown = referenced - known
+        if unknown:
+            raise serializers.ValidationError({
+                'changed_edges': f"Недопустимый первичный ключ \"{sorted(unknown)[0]}\" - объект не существует."
+            })
+
+        fields = set()
+        for edge in edges:
+            for attr, value in changes[edge.id].items():
+                if attr not in EDGE_WRITE_FIELDS:
+                    continue
+                if attr in ('node1', 'node2'):
+                    setattr(edge, f'{attr}_id', value)
+                else:
+                    setattr(edge, attr, value)
+                fields.add(attr)
+            if edge.node1_id == edge.node2_id:
+                raise serializers.ValidationError({'changed_edges': "Узлы не могут ссылаться сами на себя"})
+        if edges and fields:
+            version = self.ensure_version()
+            for edge in edges:
+                edge.version = version
+            Edge.objects.bulk_update(edges, sorted(fields) + ['version'])
+        logger.debug(f"Обновлено ребер: {len(edges)}")
+        return edges
+
+    def sync(self, nodes_data, edges_data):
+        """
+        Приводит узлы и ребра карты к присланному полному состоянию.
+
+        Присланные строки сравниваются с сохраненными по ID и хешу содержимого,
+        после чего применяется минимальный набор вставок, обновлений и удалений.
+        Строки, отсутствующие в присланном состоянии, убираются с карты.
+        Сравниваются только присланные поля, остальные поля строк не меняются.
+
+        Args:
+            nodes_data (list[dict]): Узлы с ключом 'id' (ID из базы или клиентский ID нового узла)
+            edges_data (list[dict]): Ребра с ключами 'id' (необязательно), 'node1' и 'node2'
+
+        Returns:
+            tuple: (словарь клиентских ID новых узлов -> созданный Node, словарь счетчиков изменений)
+        """
+        stored_nodes = {
+            row[0]: dict(zip(NODE_WRITE_FIELDS, row[1:]))
+            for row in self.map.nodes.values_list('id', *NODE_WRITE_FIELDS)
+        }
+        seen_nodes = set()
+        node_inserts = []
+        node_updates = {}
+        for data in nodes_data:
+            fields = {key: data[key] for key in NODE_WRITE_FIELDS if key in data}
+            node_id = data.get('id')
+            if node_id in stored_nodes and node_id not in seen_nodes:
+                seen_nodes.add(node_id)
+                stored = {key: stored_nodes[node_id][key] for key in fields}
+                if content_hash(_normalize_node(fields)) != content_hash(_normalize_node(stored)):
+                    node_updates[node_id] = fields
+            else:
+                node_inserts.append((node_id, fields))
+        node_deletes = set(stored_nodes) - seen_nodes
+
+        if node_deletes:
+            self.delete_nodes(node_deletes)
+        if node_updates:
+            self.update_nodes(node_updates)
+        client_index_map = {}
+        if node_inserts:
+            created = self.create_nodes([fields for _, fields in node_inserts])
+            for (client_id, _), node in zip(node_inserts, created):
+                if client_id is not None:
+                    client_index_map[str(client_id)] = node
+
+        # Ребра загружаются после удаления узлов, чтобы не учитывать уже убранные
+        edge_columns = ('node1_id', 'node2_id', 'description', 'style')
+        stored_edges = {
+            row[0]: dict(zip(EDGE_WRITE_FIELDS, row[1:]))
+            for row in self.map.edges.values_list('id', *edge_columns)
+        }
+        seen_edges = set()
+        edge_inserts = []
+        edge_updates = {}
+        for data in edges_data:
+            fields = {key: data[key] for key in EDGE_WRITE_FIELDS if key in data}
+            for key in ('node1', 'node2'):
+                node = client_index_map.get(str(fields[key]))
+                if node is not None:
+                    fields[key] = node.id
+            edge_id = data.get('id')
+            if edge_id in stored_edges and edge_id not in seen_edges:
+                seen_edges.add(edge_id)
+                stored = {key: stored_edges[edge_id][key] for key in fields}
+                if content_hash(_normalize_edge(fields)) != content_hash(_normalize_edge(stored)):
+                    edge_updates[edge_id] = fields
+            else:
+                fields.setdefault('style', DEFAULT_EDGE_STYLE)
+                edge_inserts.append(fields)
+        edge_deletes = set(stored_edges) - seen_edges
+
+        if edge_deletes:
+            self.delete_edges(edge_deletes)
+        if edge_updates:
+            self.update_edges(edge_updates)
+        created_edges = self.create_edges(edge_inserts)
+
+        stats = {
+            'nodes_created': len(node_inserts),
+            'nodes_updated': len(node_updates),
+            'nodes_deleted': len(node_deletes),
+            'edges_created': len(created_edges),
+            'edges_updated': len(edge_updates),
+            'edges_deleted': len(edge_deletes),
+        }
+        logger.info(f"Синхронизация карты ID: {self.map.id}: {stats}")
+        return client_index_map, stats
@@ -0,0 +1,305 @@
+import logging
+
+from django.core.cache import cache
+
+from .models import MapTombstone
+from .spatial import mercator
+
+logger = logging.getLogger(__name__)
+
+# Уровни масштаба, для которых строятся кластеры. На больших масштабах клиент
+# берет сами узлы через /nodes/?bbox=
+MAX_CLUSTER_ZOOM = 16
+
+# Размер ячейки кластера в пикселях экрана: на уровне zoom мир делится
+# на 2 ** zoom тайлов по 256 пикселей, то есть на 2 ** zoom * 256 / 64 ячеек
+CLUSTER_CELL_PIXELS = 64
+
+CACHE_TIMEOUT = 24 * 60 * 60
+STATE_KEY = 'map_clusters:%(map_id)s'
+LEVEL_KEY = 'map_clusters:%(map_id)s:%(zoom)s'
+
+
+def cells_per_axis(zoom):
+    """Возвращает число ячеек по каждой оси на уровне zoom."""
+    return (1 << zoom) * 256 // CLUSTER_CELL_PIXELS
+
+
+# Число ячеек по оси на самом подробном уровне; ячейки остальных уровней
+# получаются сдвигом номеров столбца и строки
+MAX_AXIS_CELLS = cells_per_axis(MAX_CLUSTER_ZOOM)
+LEVEL_SHIFTS = [MAX_CLUSTER_ZOOM - zoom for zoom in range(MAX_CLUSTER_ZOOM + 1)]
+
+
+def project(latitude, longitude):
+    """Возвращает столбец и строку ячейки точки на уровне MAX_CLUSTER_ZOOM (проекция Меркатора)."""
+    x, y = mercator(latitude, longitude)
+    last = MAX_AXIS_CELLS - 1
+    return min(max(int(x * MAX_AXIS_CELLS), 0), last), min(max(int(y * MAX_AXIS_CELLS), 0), last)
+
+
+def cell_xy(latitude, longitude, zoom):
+    """Возвращает столбец и строку ячейки точки на уровне zoom."""
+    column, row = project(latitude, longitude)
+    shift = LEVEL_SHIFTS[zoom]
+    return column >> shift, row >> shift
+
+
+def cell_keys(column, row):
+    """Возвращает ключи ячейки project() на всех уровнях: row * cells_per_axis + column."""
+    return [((row >> shift) * (MAX_AXIS_CELLS >> shift)) + (column >> shift) for shift in LEVEL_SHIFTS]
+
+
+def cell_key(latitude, longitude, zoom):
+    """Возвращает ключ ячейки точки на уровне zoom."""
+    column, row = cell_xy(latitude, longitude, zoom)
+    return row * cells_per_axis(zoom) + column
+
+
+class ClusterPyramid:
+    """
+    Пирамида кластеров узлов карты по уровням масштаба.
+
+    На каждом уровне узлы группируются по ячейкам сетки Меркатора
+    (CLUSTER_CELL_PIXELS пикселей); ячейки соседних уровней вложены друг
+    в друга. Для ячейки хранятся число узлов и суммы координат и ID: центр
+    кластера - средняя точка, а у кластера из одного узла сумма ID равна
+    ID узла. Ребра агрегируются в связи между разными ячейками с числом
+    ребер.
+
+    Пирамида обновляется по изменениям: узел или ребро сначала вычитается
+    из ячеек по сохраненному положению, затем добавляется по новому. Поэтому
+    повторное применение одного и того же изменения ничего не портит.
+
+    Attributes:
+        version (int): Версия карты, до которой учтены изменения
+        nodes (dict): Положение узлов {id: (latitude, longitude, column, row)}, ячейка - project()
+        edges (dict): Концы ребер {id: (node1, node2)}
+        node_edges (dict): Ребра каждого узла {node_id: set(edge_id)}
+        levels (list[dict]): Ячейки уровней {key: [count, sum_lat, sum_lon, sum_id]}
+        links (list[dict]): Связи уровней {(key1, key2): count}
+    """
+
+    def __init__(self, version=0):
+        self.version = version
+        self.nodes = {}
+        self.edges = {}
+        self.node_edges = {}
+        self.levels = [{} for _ in range(MAX_CLUSTER_ZOOM + 1)]
+        self.links = [{} for _ in range(MAX_CLUSTER_ZOOM + 1)]
+
+    def _node_cells(self, node_id):
+        return cell_keys(*self.nodes[node_id][2:])
+
+    def _add_node(self, node_id, sign):
+        latitude, longitude = self.nodes[node_id][:2]
+        for cells, key in zip(self.levels, self._node_cells(node_id)):
+            cell = cells.setdefault(key, [0, 0.0, 0.0, 0])
+            cell[0] += sign
+            cell[1] += sign * latitude
+            cell[2] += sign * longitude
+            cell[3] += sign * node_id
+            if not cell[0]:
+                del cells[key]
+
+    def _add_edge(self, edge_id, sign):
+        node1, node2 = self.edges[edge_id]
+        if node1 not in self.nodes or node2 not in self.nodes:
+            return
+        for links, key1, key2 in zip(self.links, self._node_cells(node1), self._node_cells(node2)):
+            if key1 == key2:
+                continue
+            link = (key1, key2) if key1 < key2 else (key2, key1)
+            count = links.get(link, 0) + sign
+            if count:
+                links[link] = count
+            else:
+                links.pop(link, None)
+
+    def apply(self, changed_nodes, removed_node_ids, changed_edges, removed_edge_ids):
+        """
+        Учитывает изменения карты.
+
+        Args:
+            changed_nodes (dict): Новые и измененные узлы {id: (latitude, longitude)}
+            removed_node_ids (Iterable[int]): ID убранных с карты узлов
+            changed_edges (dict): Новые и измененные ребра {id: (node1, node2)}
+            removed_edge_ids (Iterable[int]): ID убранных с карты ребер
+        """
+        removed_node_ids = [node_id for node_id in removed_node_ids if node_id in self.nodes]
+        removed_edge_ids = [edge_id for edge_id in removed_edge_ids if edge_id in self.edges]
+
+        affected_edges = set(changed_edges) | set(removed_edge_ids)
+        for node_id in list(changed_nodes) + removed_node_ids:
+            affected_edges.update(self.node_edges.get(node_id, ()))
+        affected_edges = [edge_id for edge_id in affected_edges if edge_id in self.edges or edge_id in changed_edges]
+
+        for edge_id in affected_edges:
+            if edge_id in self.edges:
+                self._add_edge(edge_id, -1)
+        for node_id in removed_node_ids:
+            self._add_node(node_id, -1)
+            del self.nodes[node_id]
+        for node_id, position in changed_nodes.items():
+            if node_id in self.nodes:
+                self._add_node(node_id, -1)
+            self.nodes[node_id] = position + project(*position)
+            self._add_node(node_id, 1)
+
+        for edge_id in removed_edge_ids:
+            for node_id in self.edges.pop(edge_id):
+                self.node_edges.get(node_id, set()).discard(edge_id)
+        for edge_id, ends in changed_edges.items():
+            for node_id in self.edges.get(edge_id, ()):
+                self.node_edges.get(node_id, set()).discard(edge_id)
+            self.edges[edge_id] = ends
+            for node_id in ends:
+                self.node_edges.setdefault(node_id, set()).add(edge_id)
+        for edge_id in affected_edges:
+            if edge_id in self.edges:
+                self._add_edge(edge_id, 1)
+
+    def level(self, zoom):
+        """Возвращает ячейки и связи уровня zoom для записи в кеш."""
+        return {'version': self.version, 'cells': self.levels[zoom], 'links': self.links[zoom]}
+
+
+def _load_changes(map_instance, since):
+    """Возвращает изменения карты после версии since в виде аргументов ClusterPyramid.apply()."""
+    nodes = map_instance.nodes.all()
+    edges = map_instance.edges.all()
+    tombstones = MapTombstone.objects.filter(map_id=map_instance.id)
+    if since is not None:
+        nodes = nodes.filter(version__gt=since)
+        edges = edges.filter(version__gt=since)
+        tombstones = tombstones.filter(version__gt=since)
+    else:
+        tombstones = tombstones.none()
+    changed_nodes = {node_id: (lat, lon) for node_id, lat, lon in nodes.values_list('id', 'latitude', 'longitude')}
+    changed_edges = {edge_id: (node1, node2) for edge_id, node1, node2 in edges.values_list('id', 'node1_id', 'node2_id')}
+    removed_nodes, removed_edges = [], []
+    for kind, object_id in tombstones.values_list('kind', 'object_id'):
+        if kind == MapTombstone.NODE and object_id not in changed_nodes:
+            removed_nodes.append(object_id)
+        elif kind == MapTombstone.EDGE and object_id not in changed_edges:
+            removed_edges.append(object_id)
+    return changed_nodes, removed_nodes, changed_edges, removed_edges
+
+
+def _level_keys(map_id):
+    return [LEVEL_KEY % {'map_id': map_id, 'zoom': zoom} for zoom in range(MAX_CLUSTER_ZOOM + 1)]
+
+
+def load_pyramid(map_id):
+    """
+    Возвращает пирамиду кластеров из кеша или None.
+
+    Положения узлов и концы ребер хранятся под ключом STATE_KEY, ячейки
+    и связи - под ключами уровней, чтобы не записывать их дважды.
+    Если какой-то уровень вытеснен из кеша или отстал, пирамида не
+    восстанавливается.
+    """
+    state = cache.get(STATE_KEY % {'map_id': map_id})
+    if state is None:
+        return None
+    keys = _level_keys(map_id)
+    levels = cache.get_many(keys)
+    if any(key not in levels or levels[key]['version'] != state['version'] for key in keys):
+        return None
+    pyramid = ClusterPyramid(state['version'])
+    pyramid.nodes, pyramid.edges, pyramid.node_edges = state['nodes'], state['edges'], state['node_edges']
+    pyramid.levels = [levels[key]['cells'] for key in keys]
+    pyramid.links = [levels[key]['links'] for key in keys]
+    return pyramid
+
+
+def build_pyramid(map_instance):
+    """
+    Возвращает пирамиду кластеров карты, актуальную для ее версии.
+
+    Сохраненная в кеше пирамида дополняется изменениями после своей версии
+    (узлы и ребра с большей версией и записи MapTombstone). Если пирамиды
+    нет в кеше, она строится по всей карте. Все уровни записываются в кеш
+    отдельными ключами, чтобы запрос одного уровня не читал остальные.
+
+    Args:
+        map_instance (Map): Карта
+
+    Returns:
+        ClusterPyramid: Пирамида кластеров
+    """
+    pyramid = load_pyramid(map_instance.id)
+    if pyramid is not None and pyramid.version > map_instance.version:
+        pyramid = None
+    if pyramid is None:
+        pyramid = ClusterPyramid()
+        pyramid.apply(*_load_changes(map_instance, None))
+        logger.info(f"Карта ID: {map_instance.id}: построены кластеры, узлов: {len(pyramid.nodes)}")
+    elif pyramid.version < map_instance.version:
+        changes = _load_changes(map_instance, pyramid.version)
+        pyramid.apply(*changes)
+        logger.debug(
+            f"Карта ID: {map_instance.id}: кластеры обновлены с версии {pyramid.version}, "
+            f"узлов: {len(changes[0]) + len(changes[1])}, ребер: {len(changes[2]) + len(changes[3])}"
+        )
+    pyramid.version = map_instance.version
+
+    state = {'version': pyramid.version, 'nodes': pyramid.nodes, 'edges': pyramid.edges, 'node_edges': pyramid.node_edges}
+    cache.set(STATE_KEY % {'map_id': map_instance.id}, state, CACHE_TIMEOUT)
+    cache.set_many({
+        key: pyramid.level(zoom) for zoom, key in enumerate(_level_keys(map_instance.id))
+    }, CACHE_TIMEOUT)
+    return pyramid
+
+
+def get_level(map_instance, zoom):
+    """Возвращает ячейки и связи уровня zoom для текущей версии карты."""
+    level = cache.get(_level_keys(map_instance.id)[zoom])
+    if level is None or level['version'] != map_instance.version:
+        level = build_pyramid(map_instance).level(zoom)
+    return level
+
+
+def map_clusters(map_instance, zoom, bbox=None):
+    """
+    Возвращает кластеры узлов и связи между ними для уровня масштаба.
+
+    Args:
+        map_instance (Map): Карта
+        zoom (int): Уровень масштаба, не больше MAX_CLUSTER_ZOOM
+        bbox (tuple): Окно (min_lon, min_lat, max_lon, max_lat) или None
+
+    Returns:
+        dict: zoom, clusters и edges
+    """
+    level = get_level(map_instance, zoom)
+    n = cells_per_axis(zoom)
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        # Ось y проекции направлена на юг
+        first_x, first_y = cell_xy(max_lat, min_lon, zoom)
+        last_x, last_y = cell_xy(min_lat, max_lon, zoom)
+
+        def visible(key):
+            y, x = divmod(key, n)
+            return first_x <= x <= last_x and first_y <= y <= last_y
+    else:
+        def visible(key):
+            return True
+
+    clusters = []
+    for key, (count, sum_lat, sum_lon, sum_id) in level['cells'].items():
+        if visible(key):
+            clusters.append({
+                'id': key,
+                'count': count,
+                'latitude': sum_lat / count,
+                'longitude': sum_lon / count,
+                'node_id': sum_id if count == 1 else None,
+            })
+    edges = [
+        {'source': key1, 'target': key2, 'count': count}
+        for (key1, key2), count in level['links'].items()
+        if visible(key1) or visible(key2)
+    ]
+    return {'zoom': zoom, 'clusters': clusters, 'edges': edges}
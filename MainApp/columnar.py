@@ -0,0 +1,113 @@
+import sys
+from array import array
+
+from .bulk import DEFAULT_EDGE_STYLE
+
+# Форматы ответа (renderer.format), для которых карта отдается по столбцам
+COLUMNAR_FORMATS = ('msgpack', 'cbor')
+
+_INT32_MIN, _INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def _to_bytes(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def pack_column(values):
+    """
+    Упаковывает числовой столбец в массив little-endian.
+
+    Целые столбцы без пропусков в пределах int32 упаковываются как int32,
+    остальные - как float64, пропуски (None) - как NaN. Клиент читает столбец
+    напрямую в Int32Array или Float64Array.
+
+    Returns:
+        dict: {'dtype': 'int32' | 'float64', 'data': bytes}
+    """
+    if all(type(value) is int and _INT32_MIN <= value <= _INT32_MAX for value in values):
+        return {'dtype': 'int32', 'data': _to_bytes(array('i', values))}
+    nan = float('nan')
+    return {
+        'dtype': 'float64',
+        'data': _to_bytes(array('d', [nan if value is None else value for value in values])),
+    }
+
+
+class StringTable:
+    """Таблица уникальных строк; столбцы хранят индексы строк, -1 - None."""
+
+    def __init__(self):
+        self.strings = []
+        self._index = {}
+
+    def add(self, value):
+        if value is None:
+            return -1
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+def map_columns(instance):
+    """
+    Возвращает узлы и ребра карты в столбцовом виде.
+
+    Узлы и ребра читаются двумя запросами values_list. Концы ребер
+    задаются индексами узлов в столбцах узлов (-1, если узла нет на карте),
+    строки вынесены в общую таблицу strings, стили ребер - в таблицу styles.
+
+    Returns:
+        dict: {'strings', 'styles', 'nodes', 'edges'}
+    """
+    strings = StringTable()
+    node_rows = list(instance.nodes.values_list(
+        'id', 'name', 'latitude', 'longitude', 'description', 'z_coordinate', 'version', 'temp_id'
+    ))
+    node_ids, names, latitudes, longitudes, descriptions, z_coordinates, versions, temp_ids = (
+        zip(*node_rows) if node_rows else ((),) * 8
+    )
+    position = {node_id: index for index, node_id in enumerate(node_ids)}
+    nodes = {
+        'count': len(node_rows),
+        'id': pack_column(node_ids),
+        'latitude': pack_column([float(value) for value in latitudes]),
+        'longitude': pack_column([float(value) for value in longitudes]),
+        'z_coordinate': pack_column([None if value is None else float(value) for value in z_coordinates]),
+        'version': pack_column(versions),
+        'temp_id': pack_column(temp_ids),
+        'name': pack_column([strings.add(value) for value in names]),
+        'description': pack_column([strings.add(value) for value in descriptions]),
+    }
+
+    styles = StringTable()
+    edge_rows = list(instance.edges.values_list(
+        'id', 'node1_id', 'node2_id', 'description', 'style', 'version', 'temp_id'
+    ))
+    edge_ids, node1_ids, node2_ids, edge_descriptions, edge_styles, edge_versions, edge_temp_ids = (
+        zip(*edge_rows) if edge_rows else ((),) * 7
+    )
+    style_indexes = []
+    style_values = []
+    for style in edge_styles:
+        # Стили сравниваются по содержимому, значение по умолчанию - как в EdgeSerializer
+        style = style or DEFAULT_EDGE_STYLE
+        key = repr(sorted(style.items()))
+        index = styles.add(key)
+        if index == len(style_values):
+            style_values.append(style)
+        style_indexes.append(index)
+    edges = {
+        'count': len(edge_rows),
+        'id': pack_column(edge_ids),
+        'node1': pack_column([position.get(node_id, -1) for node_id in node1_ids]),
+        'node2': pack_column([position.get(node_id, -1) for node_id in node2_ids]),
+        'description': pack_column([strings.add(value) for value in edge_descriptions]),
+        'style': pack_column(style_indexes),
+        'version': pack_column(edge_versions),
+        'temp_id': pack_column(edge_temp_ids),
+    }
+    return {'strings': strings.strings, 'styles': style_values, 'nodes': nodes, 'edges': edges}
@@ -0,0 +1,209 @@
+import logging
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, тогда br не предлагается
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard необязателен, тогда zstd не предлагается
+    zstandard = None
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .representations import cached_variant
+
+logger = logging.getLogger(__name__)
+
+# Кодировки в порядке предпочтения сервера при равном q у клиента
+ENCODINGS = ('br', 'zstd', 'gzip')
+
+# Сжимаются только ответы API; HTML со CSRF-токеном не сжимается (BREACH)
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'application/geo+json',
+    'application/msgpack',
+    'application/cbor',
+)
+
+DEFAULT_MIN_SIZE = 1024
+
+# Уровни сжатия на лету - быстрые; варианты, которые хранятся в кеше
+# представлений, сжимаются один раз и плотнее
+LEVELS = {'br': 4, 'zstd': 3, 'gzip': 6}
+CACHED_LEVELS = {'br': 9, 'zstd': 12, 'gzip': 9}
+
+
+def get_min_size():
+    """Возвращает размер ответа в байтах, начиная с которого он сжимается."""
+    return getattr(settings, 'MAP_COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+
+
+def available_encodings():
+    """Возвращает кодировки, для которых установлены библиотеки, в порядке предпочтения."""
+    installed = {'br': brotli is not None, 'zstd': zstandard is not None, 'gzip': True}
+    return tuple(encoding for encoding in ENCODINGS if installed[encoding])
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Выбирает кодировку ответа по заголовку Accept-Encoding.
+
+    Берется доступная кодировка с наибольшим q; при равном q - по порядку
+    ENCODINGS. "*" относится к кодировкам, не названным явно, q=0 запрещает
+    кодировку.
+
+    Args:
+        accept_encoding (str): Значение заголовка Accept-Encoding
+
+    Returns:
+        str: Кодировка или None, если сжимать не нужно
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _Compressor:
+    """
+    Потоковый компрессор одной кодировки.
+
+    compress() возвращает сжатый блок, который клиент может распаковать
+    сразу (сброс после каждого блока), finish() - завершение потока.
+    """
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        elif encoding == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        if self.encoding == 'br':
+            return self._compressor.process(chunk) + self._compressor.flush()
+        if self.encoding == 'zstd':
+            return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(content, encoding, level=None):
+    """Сжимает содержимое ответа целиком."""
+    level = LEVELS[encoding] if level is None else level
+    if encoding == 'br':
+        return brotli.compress(content, quality=level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(content)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(content) + compressor.flush()
+
+
+def compress_sequence(chunks, encoding):
+    """Сжимает поток блоков ответа, не собирая его в памяти."""
+    compressor = _Compressor(encoding, LEVELS[encoding])
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_sequence(chunks, encoding):
+    """Асинхронный вариант compress_sequence."""
+    compressor = _Compressor(encoding, LEVELS[encoding])
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжимает ответы API в br, zstd или gzip по заголовку Accept-Encoding.
+
+    Сжимаются ответы с типом из COMPRESSIBLE_TYPES не короче
+    MAP_COMPRESSION_MIN_SIZE; потоковые ответы сжимаются по блокам.
+    Если ответ взят из кеша представлений карты (атрибут
+    representation_key), сжатый вариант хранится там же и не сжимается
+    заново на каждый запрос.
+
+    Если кодировка согласована, сильный ETag становится слабым, как в
+    django.middleware.gzip.GZipMiddleware. Это делается по запросу, а не
+    по факту сжатия: у ответа 304 нет тела, и по нему нельзя узнать, был
+    бы сжат полный ответ или нет. Так 200 и 304 на один и тот же запрос
+    несут ETag в одной форме. У ответа 304 от DRF нет Content-Type, тип
+    берется из accepted_media_type.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type') or getattr(response, 'accepted_media_type', None) or ''
+        if content_type.split(';')[0].strip().lower() not in COMPRESSIBLE_TYPES:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        if response.status_code == 304:
+            return response
+        if not response.streaming and len(response.content) < get_min_size():
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_sequence(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content, encoding)
+            # Размер сжатого потока заранее неизвестен
+            del response.headers['Content-Length']
+        else:
+            key = getattr(response, 'representation_key', None)
+            if key is not None:
+                content = response.content
+                compressed = cached_variant(key, encoding, lambda: compress(content, encoding, CACHED_LEVELS[encoding]))
+            else:
+                compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+import tempfile
+
+
+def write_file(path, content):
+    """
+    Записывает файл атомарно: nginx видит либо старое, либо новое содержимое.
+
+    Содержимое пишется во временный файл .tmp-* в том же каталоге, который
+    затем переименовывается в path.
+
+    Args:
+        path (str): Путь к файлу
+        content (bytes): Содержимое
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(content)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(map_root, name):
+    """Возвращает манифест из каталога карты или None, если его нет."""
+    try:
+        with open(os.path.join(map_root, name), encoding='utf-8') as manifest:
+            return json.load(manifest)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def publish_manifest(map_root, name, manifest):
+    """
+    Атомарно заменяет манифест версии файлов карты и удаляет старые версии.
+
+    Версия - файлы или каталог в map_root, имя которых до первой точки
+    равно manifest['hash']. Кроме новой остается версия из предыдущего
+    манифеста, чтобы клиенты, прочитавшие его, догрузили карту.
+    Временные файлы .tmp-* параллельной записи не трогаются.
+
+    Args:
+        map_root (str): Каталог файлов карты
+        name (str): Имя файла манифеста
+        manifest (dict): Новый манифест с ключом hash
+    """
+    previous = read_manifest(map_root, name)
+    write_file(os.path.join(map_root, name), json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+    keep = {manifest['hash'], previous.get('hash') if previous else None}
+    for file_name in os.listdir(map_root):
+        if file_name == name or file_name.startswith('.tmp-') or file_name.split('.')[0] in keep:
+            continue
+        path = os.path.join(map_root, file_name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def remove_map_root(map_root):
+    """
+    Удаляет каталог файлов карты.
+
+    Returns:
+        bool: True, если каталог был
+    """
+    if not os.path.isdir(map_root):
+        return False
+    shutil.rmtree(map_root, ignore_errors=True)
+    return True
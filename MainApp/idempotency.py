@@ -0,0 +1,102 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .bulk import content_hash
+from .models import MapIdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def get_ttl():
+    """Возвращает время хранения результатов запросов в секундах."""
+    return getattr(settings, 'MAP_IDEMPOTENCY_TTL', DEFAULT_TTL)
+
+
+def request_fingerprint(request):
+    """Возвращает хеш метода и тела запроса для сверки повторов."""
+    return content_hash({'method': request.method, 'body': request.data})
+
+
+def claim_key(map_instance, key, fingerprint):
+    """
+    Резервирует ключ идемпотентности за запросом.
+
+    Просроченные записи карты удаляются. Уникальное ограничение (map, key)
+    гарантирует, что из параллельных запросов с одним ключом выполнится один.
+    Вызывается в той же транзакции, что и запись в карту: параллельный
+    запрос с тем же ключом ждет ее фиксации, а если процесс упадет до
+    фиксации, резерв откатится вместе с изменениями и повтор выполнится.
+
+    Args:
+        map_instance (Map): Карта
+        key (str): Ключ из заголовка Idempotency-Key
+        fingerprint (str): Хеш запроса (request_fingerprint)
+
+    Returns:
+        tuple: (MapIdempotencyKey, created) - запись и признак того,
+            что ключ зарезервирован этим запросом
+    """
+    cutoff = timezone.now() - timedelta(seconds=get_ttl())
+    MapIdempotencyKey.objects.filter(map=map_instance, created_at__lt=cutoff).delete()
+    try:
+        with transaction.atomic():
+            record = MapIdempotencyKey.objects.create(map=map_instance, key=key, request_hash=fingerprint)
+        return record, True
+    except IntegrityError:
+        return MapIdempotencyKey.objects.get(map=map_instance, key=key), False
+
+
+def is_replay(map_id, key, fingerprint):
+    """
+    Проверяет, сохранен ли результат запроса с этим ключом и телом.
+
+    Повтор такого запроса получает сохраненный результат и ничего не
+    записывает в карту, поэтому, например, не расходует лимит записи.
+    """
+    cutoff = timezone.now() - timedelta(seconds=get_ttl())
+    return MapIdempotencyKey.objects.filter(
+        map_id=map_id, key=key, request_hash=fingerprint,
+        status_code__isnull=False, created_at__gte=cutoff,
+    ).exists()
+
+
+def store_response(record, response):
+    """
+    Сохраняет результат запроса для повторов с тем же ключом.
+
+    Хранится только то, что нельзя восстановить по карте: версия после
+    записи и соответствие временных ID клиента новым ID узлов. Тело
+    ответа при повторе собирается заново (replay_data).
+    """
+    record.status_code = response.status_code
+    record.response = {
+        'version': response.data.get('version'),
+        'client_index_map': response.data.get('client_index_map') or {},
+    }
+    record.save(update_fields=['status_code', 'response'])
+
+
+def replay_data(record, data):
+    """
+    Возвращает тело ответа на повтор запроса.
+
+    Args:
+        record (MapIdempotencyKey): Запись с сохраненным результатом
+        data (dict): Текущее представление карты
+
+    Returns:
+        dict: Карта с client_index_map исходного запроса
+    """
+    return {**data, 'client_index_map': (record.response or {}).get('client_index_map', {})}
+
+
+def release_key(record):
+    """Освобождает ключ, чтобы повтор запроса выполнился заново."""
+    record.delete()
+    logger.info(f"Карта ID: {record.map_id}: ключ идемпотентности {record.key} освобожден")
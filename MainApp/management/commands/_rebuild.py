@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+import time
+import logging
+
+from MainApp.models import Map
+from MainApp.rebuilds import run_due_rebuilds
+
+logger = logging.getLogger('MainApp')
+
+class RebuildCommand(BaseCommand):
+    """
+    Фоновое построение файлов опубликованных карт по заявкам MapRebuild.
+
+    Подклассы задают вид файлов (kind), их название в выводе (label) и
+    функции построения: rebuild(map_id) для заявок, publish(map_instance)
+    и read_manifest(map_id) для карт, указанных явно или через --all.
+    """
+    kind = None
+    label = None
+
+    def rebuild(self, map_id):
+        raise NotImplementedError
+
+    def publish(self, map_instance):
+        raise NotImplementedError
+
+    def read_manifest(self, map_id):
+        raise NotImplementedError
+
+    def add_arguments(self, parser):
+        parser.add_argument('map_ids', nargs='*', type=int,
+                            help='Maps to process instead of the queued ones')
+        parser.add_argument('--all', action='store_true',
+                            help='Process all published maps instead of the queued ones')
+        parser.add_argument('--force', action='store_true',
+                            help='Rewrite the manifest even if it matches the map version')
+        parser.add_argument('--delay', type=float, default=None,
+                            help='Build queued maps unchanged for this many seconds (default: MAP_REBUILD_DELAY)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and build queued maps every --interval seconds')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds between runs in --loop mode')
+
+    def handle(self, *args, **options):
+        if options['map_ids'] or options['all']:
+            self.publish_stale(options)
+            return
+        while True:
+            try:
+                built = run_due_rebuilds(self.kind, self.rebuild, options['delay'])
+                if built:
+                    self.stdout.write(self.style.SUCCESS(f'Rebuilt {self.label} for {built} maps'))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Unexpected error: {str(e)}'))
+                logger.error(f"Unexpected error rebuilding map {self.label}: {str(e)}")
+                if not options['loop']:
+                    raise
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def publish_stale(self, options):
+        maps = Map.objects.filter(is_published=True)
+        if options['map_ids']:
+            maps = maps.filter(id__in=options['map_ids'])
+        written = 0
+        for map_instance in maps.iterator():
+            manifest = self.read_manifest(map_instance.id)
+            if manifest and manifest.get('version') == map_instance.version and not options['force']:
+                continue
+            try:
+                self.publish(map_instance)
+                written += 1
+            except OSError as e:
+                self.stdout.write(self.style.ERROR(f'Map {map_instance.id}: {str(e)}'))
+                logger.error(f"Unexpected error writing {self.label} for map {map_instance.id}: {str(e)}")
+        self.stdout.write(self.style.SUCCESS(f'Wrote {self.label} for {written} maps'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+import time
+import logging
+
+from MainApp.models import MapOperation
+from MainApp.operations import compact_pending_operations
+
+logger = logging.getLogger('MainApp')
+
+class Command(BaseCommand):
+    help = 'Fold pending map operations into the Node/Edge tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Operations applied per transaction (default: MAP_OPERATIONS_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and compact every --interval seconds')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between compaction runs in --loop mode')
+        parser.add_argument('--prune-days', type=int, default=None,
+                            help='Delete applied operations older than this many days')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                applied = compact_pending_operations(options['batch_size'])
+                if applied:
+                    self.stdout.write(self.style.SUCCESS(f'Applied {applied} map operations'))
+                if options['prune_days'] is not None:
+                    cutoff = timezone.now() - timedelta(days=options['prune_days'])
+                    pruned, _ = MapOperation.objects.filter(applied_at__lt=cutoff).delete()
+                    if pruned:
+                        self.stdout.write(f'Pruned {pruned} applied map operations')
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Unexpected error: {str(e)}'))
+                logger.error(f"Unexpected error compacting map operations: {str(e)}")
+                if not options['loop']:
+                    raise
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+import time
+import logging
+
+from MainApp.autosave import flush_due_autosaves
+
+logger = logging.getLogger('MainApp')
+
+class Command(BaseCommand):
+    help = 'Flush map autosave buffers whose changes have waited longer than the flush interval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=float, default=None,
+                            help='Flush buffers older than this many seconds (default: MAP_AUTOSAVE_FLUSH_INTERVAL)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and flush every --interval seconds')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between flush runs in --loop mode')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                flushed = flush_due_autosaves(options['max_age'])
+                if flushed:
+                    self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} autosave buffers'))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Unexpected error: {str(e)}'))
+                logger.error(f"Unexpected error flushing autosave buffers: {str(e)}")
+                if not options['loop']:
+                    raise
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+from MainApp import snapshots
+from MainApp.models import MapRebuild
+
+from ._rebuild import RebuildCommand
+
+class Command(RebuildCommand):
+    help = ('Write JSON snapshots for published maps changed since the last build; '
+            'with map ids or --all, for maps whose snapshot is missing or out of date')
+    kind = MapRebuild.SNAPSHOT
+    label = 'snapshots'
+
+    def rebuild(self, map_id):
+        snapshots.rebuild_map_snapshot(map_id)
+
+    def publish(self, map_instance):
+        snapshots.publish_snapshot(map_instance)
+
+    def read_manifest(self, map_id):
+        return snapshots.read_manifest(map_id)
@@ -0,0 +1,19 @@
+from MainApp import tiles
+from MainApp.models import MapRebuild
+
+from ._rebuild import RebuildCommand
+
+class Command(RebuildCommand):
+    help = ('Write vector tiles for published maps changed since the last build; '
+            'with map ids or --all, for maps whose tiles are missing or out of date')
+    kind = MapRebuild.TILES
+    label = 'tiles'
+
+    def rebuild(self, map_id):
+        tiles.rebuild_map_tiles(map_id)
+
+    def publish(self, map_instance):
+        tiles.publish_tiles(map_instance)
+
+    def read_manifest(self, map_id):
+        return tiles.read_manifest(map_id)
@@ -0,0 +1,14 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MainApp', '0003_remove_map_map_settings'),
+        ('MainApp', '0008_complaint'),
+    ]
+
+    operations = [
+    ]
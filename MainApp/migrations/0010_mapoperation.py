@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 12:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MainApp', '0009_merge_20261018_1200'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapOperation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField()),
+                ('op_type', models.CharField(choices=[('add_node', 'Добавление узла'), ('move_node', 'Перемещение узла'), ('delete_node', 'Удаление узла'), ('add_edge', 'Добавление связи'), ('delete_edge', 'Удаление связи')], max_length=20)),
+                ('temp_id', models.BigIntegerField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('target_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='map_operations', to=settings.AUTH_USER_MODEL)),
+                ('map', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='operations', to='MainApp.map')),
+            ],
+            options={
+                'verbose_name': 'Операция карты',
+                'verbose_name_plural': 'Операции карт',
+                'ordering': ['map', 'seq'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='mapoperation',
+            index=models.Index(fields=['map', 'applied_at', 'seq'], name='map_operation_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mapoperation',
+            index=models.Index(fields=['map', 'op_type', 'temp_id'], name='map_operation_temp_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='mapoperation',
+            constraint=models.UniqueConstraint(fields=('map', 'seq'), name='unique_map_operation_seq'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-18 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MainApp', '0010_mapoperation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('node', 'Узел'), ('edge', 'Связь')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('version', models.PositiveBigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Удаленный объект карты',
+                'verbose_name_plural': 'Удаленные объекты карт',
+            },
+        ),
+        migrations.AddField(
+            model_name='edge',
+            name='version',
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='map',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='version',
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='maptombstone',
+            name='map',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstones', to='MainApp.map'),
+        ),
+        migrations.AddIndex(
+            model_name='maptombstone',
+            index=models.Index(fields=['map', 'version'], name='map_tombstone_version_idx'),
+        ),
+    ]
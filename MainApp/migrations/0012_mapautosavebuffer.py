@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 13:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MainApp', '0011_map_version_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapAutosaveBuffer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('changes', models.JSONField(blank=True, default=dict)),
+                ('node_ids', models.JSONField(blank=True, default=dict)),
+                ('edits', models.PositiveIntegerField(default=0)),
+                ('buffered_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('map', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='autosave_buffer', to='MainApp.map')),
+            ],
+            options={
+                'verbose_name': 'Буфер автосохранения',
+                'verbose_name_plural': 'Буферы автосохранения',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+def fill_grid_cells(apps, schema_editor):
+    from MainApp.spatial import grid_cell
+
+    Node = apps.get_model('MainApp', 'Node')
+    batch = []
+    for node in Node.objects.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        node.grid_cell = grid_cell(node.latitude, node.longitude)
+        batch.append(node)
+        if len(batch) >= 2000:
+            Node.objects.bulk_update(batch, ['grid_cell'])
+            batch = []
+    if batch:
+        Node.objects.bulk_update(batch, ['grid_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MainApp', '0013_mapidempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='grid_cell',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_grid_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MainApp', '0014_node_grid_cell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mapoperation',
+            name='error',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MainApp', '0015_mapoperation_error'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapRebuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('tiles', 'Тайлы'), ('snapshot', 'Снимок')], max_length=20)),
+                ('requested_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('map', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rebuilds', to='MainApp.map')),
+            ],
+            options={
+                'verbose_name': 'Перестроение карты',
+                'verbose_name_plural': 'Перестроения карт',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='maprebuild',
+            constraint=models.UniqueConstraint(fields=('map', 'kind'), name='unique_map_rebuild_kind'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MainApp', '0016_maprebuild'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mapautosavebuffer',
+            name='error',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mapautosavebuffer',
+            name='rejected_changes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 17:30
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_last_applied_seq(apps, schema_editor):
+    Map = apps.get_model('MainApp', 'Map')
+    MapOperation = apps.get_model('MainApp', 'MapOperation')
+    applied = (
+        MapOperation.objects
+        .filter(applied_at__isnull=False)
+        .values('map_id')
+        .annotate(last_seq=Max('seq'))
+    )
+    for row in applied.iterator():
+        Map.objects.filter(pk=row['map_id']).update(last_applied_seq=row['last_seq'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MainApp', '0017_mapautosavebuffer_rejected'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='map',
+            name='last_applied_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_last_applied_seq, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,13 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
+from .spatial import grid_cell
+from .signals import send_map_version_changed
+
 class CustomUser(AbstractUser):
     """
     Расширенная модель пользователя Django с дополнительными полями.
@@ -65,6 +69,8 @@ class Node(models.Model):
         description (TextField): Описание узла (опционально)
         z_coordinate (FloatField): Z-координата для трехмерных карт (опционально)
         temp_id (IntegerField): Временный идентификатор для операций с фронтендом (опционально)
+        version (PositiveBigIntegerField): Версия карты, в которой узел последний раз изменялся
+        grid_cell (BigIntegerField): Ключ ячейки сетки по координатам для выборки по окну (MainApp/spatial.py)
     """
     name = models.CharField(max_length=100)
     latitude = models.FloatField()
@@ -72,11 +78,25 @@ class Node(models.Model):
     description = models.TextField(blank=True, null=True)
     z_coordinate = models.FloatField(blank=True, null=True)
     temp_id = models.IntegerField(null=True, blank=True, db_index=True)
+    version = models.PositiveBigIntegerField(default=0, db_index=True)
+    grid_cell = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True)
     
     def __str__(self):
         """Возвращает название узла как строковое представление."""
         return self.name
 
+    def update_grid_cell(self):
+        """Пересчитывает ключ ячейки сетки по текущим координатам."""
+        self.grid_cell = grid_cell(self.latitude, self.longitude)
+
+    def save(self, *args, **kwargs):
+        """Сохраняет узел, обновляя ключ ячейки сетки."""
+        self.update_grid_cell()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'grid_cell'}
+        return super().save(*args, **kwargs)
+
 class Edge(models.Model):
     """
     Модель связи между узлами карты.
@@ -87,17 +107,31 @@ class Edge(models.Model):
         description (TextField): Описание связи (опционально)
         style (JSONField): JSON с параметрами стиля ребра (цвет, ширина, тип линии и т.д.)
         temp_id (IntegerField): Временный идентификатор для операций с фронтендом (опционально)
+        version (PositiveBigIntegerField): Версия карты, в которой связь последний раз изменялась
     """
     node1 = models.ForeignKey(Node, related_name='edges_from', on_delete=models.CASCADE)
     node2 = models.ForeignKey(Node, related_name='edges_to', on_delete=models.CASCADE)
     description = models.TextField(blank=True, null=True)
     style = models.JSONField(blank=True, null=True, default=dict)
     temp_id = models.IntegerField(null=True, blank=True, db_index=True)
+    version = models.PositiveBigIntegerField(default=0, db_index=True)
     
     def __str__(self):
         """Возвращает строковое представление связи в формате 'узел1 -> узел2'."""
         return "%s -> %s" % (self.node1, self.node2)
 
+class MapVersionConflict(Exception):
+    """
+    Версия карты изменилась с момента, когда клиент ее прочитал.
+
+    Attributes:
+        current_version (int): Текущая версия карты в базе
+    """
+
+    def __init__(self, current_version):
+        super().__init__(f"Версия карты изменилась: текущая версия {current_version}")
+        self.current_version = current_version
+
 class Map(models.Model):
     """
     Модель карты с узлами и связями между ними.
@@ -114,6 +148,9 @@ class Map(models.Model):
         is_published (BooleanField): Флаг публикации карты
         created_at (DateTimeField): Дата создания карты
         updated_at (DateTimeField): Дата последнего обновления карты
+        version (PositiveBigIntegerField): Монотонно растущая версия содержимого карты
+        last_applied_seq (PositiveBigIntegerField): Наибольший seq свернутой операции журнала;
+            не уменьшается при удалении старых операций
     """
     title = models.CharField(max_length=100, null=True)
     owner = models.ForeignKey(
@@ -136,11 +173,271 @@ class Map(models.Model):
     is_published = models.BooleanField(default=False, verbose_name='published')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveBigIntegerField(default=0)
+    last_applied_seq = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         """Возвращает название карты как строковое представление."""
         return self.title
 
+    def save(self, *args, **kwargs):
+        """
+        Переопределение метода сохранения: поля version и last_applied_seq
+        не перезаписываются при обычном сохранении, чтобы устаревший экземпляр
+        не откатил их. Версия изменяется только через bump_version(),
+        last_applied_seq - при сворачивании журнала операций.
+
+        Args:
+            *args: Позиционные аргументы
+            **kwargs: Именованные аргументы
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('version', 'last_applied_seq')
+            ]
+        return super().save(*args, **kwargs)
+
+    def bump_version(self, expected=None):
+        """
+        Атомарно увеличивает версию карты.
+
+        Должен вызываться внутри транзакции: после UPDATE строка карты
+        заблокирована до конца транзакции, поэтому прочитанное значение - свое.
+        После фиксации транзакции отправляется сигнал map_version_changed.
+
+        Args:
+            expected (int): Версия, от которой клиент строил изменения. Если
+                задана, версия увеличивается только при совпадении с текущей
+                (сравнение и обмен одним UPDATE), иначе MapVersionConflict
+
+        Returns:
+            int: Новая версия карты
+
+        Raises:
+            MapVersionConflict: Текущая версия не совпадает с expected
+        """
+        queryset = Map.objects.filter(pk=self.pk)
+        if expected is not None:
+            queryset = queryset.filter(version=expected)
+        if not queryset.update(version=models.F('version') + 1):
+            raise MapVersionConflict(Map.objects.values_list('version', flat=True).get(pk=self.pk))
+        self.version = Map.objects.values_list('version', flat=True).get(pk=self.pk)
+        map_id, version = self.pk, self.version
+        transaction.on_commit(lambda: send_map_version_changed(Map, map_id, version))
+        return self.version
+
+class MapOperation(models.Model):
+    """
+    Операция редактирования карты из журнала операций (append-only).
+
+    Клиент присылает небольшие операции с порядковыми номерами, они сохраняются
+    как есть, а затем пакетно сворачиваются в таблицы Node/Edge (см. MainApp/operations.py).
+    Примененные операции остаются в журнале и позволяют воспроизвести историю карты.
+
+    Attributes:
+        map (ForeignKey): Карта, к которой относится операция
+        seq (PositiveBigIntegerField): Порядковый номер операции в пределах карты
+        op_type (CharField): Тип операции
+        temp_id (BigIntegerField): Временный ID добавляемого узла или ребра (опционально)
+        data (JSONField): Параметры операции
+        target_id (BigIntegerField): ID созданного узла или ребра после сворачивания (опционально)
+        author (ForeignKey): Пользователь, отправивший операцию
+        created_at (DateTimeField): Дата получения операции
+        applied_at (DateTimeField): Дата сворачивания операции в таблицы карты (опционально)
+        error (CharField): Причина отклонения операции при сворачивании (опционально)
+    """
+    ADD_NODE = 'add_node'
+    MOVE_NODE = 'move_node'
+    DELETE_NODE = 'delete_node'
+    ADD_EDGE = 'add_edge'
+    DELETE_EDGE = 'delete_edge'
+    OP_TYPE_CHOICES = [
+        (ADD_NODE, 'Добавление узла'),
+        (MOVE_NODE, 'Перемещение узла'),
+        (DELETE_NODE, 'Удаление узла'),
+        (ADD_EDGE, 'Добавление связи'),
+        (DELETE_EDGE, 'Удаление связи'),
+    ]
+
+    map = models.ForeignKey(Map, on_delete=models.CASCADE, related_name='operations')
+    seq = models.PositiveBigIntegerField()
+    op_type = models.CharField(max_length=20, choices=OP_TYPE_CHOICES)
+    temp_id = models.BigIntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    target_id = models.BigIntegerField(null=True, blank=True)
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='map_operations',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        """Возвращает строковое представление в формате 'карта #номер тип'."""
+        return "%s #%s %s" % (self.map_id, self.seq, self.op_type)
+
+    class Meta:
+        ordering = ['map', 'seq']
+        constraints = [
+            models.UniqueConstraint(fields=['map', 'seq'], name='unique_map_operation_seq'),
+        ]
+        indexes = [
+            models.Index(fields=['map', 'applied_at', 'seq'], name='map_operation_pending_idx'),
+            models.Index(fields=['map', 'op_type', 'temp_id'], name='map_operation_temp_idx'),
+        ]
+        verbose_name = 'Операция карты'
+        verbose_name_plural = 'Операции карт'
+
+class MapAutosaveBuffer(models.Model):
+    """
+    Буфер автосохранения карты (write-behind).
+
+    Частые изменения из автосохранения не пишутся сразу в таблицы Node/Edge,
+    а сливаются в один набор изменений карты: повторные правки одного узла
+    объединяются по полям (побеждает последнее значение). Буфер сбрасывается
+    в таблицы одним пакетом по таймеру, при явном сохранении или перед
+    обращением к карте (см. MainApp/autosave.py).
+
+    Attributes:
+        map (OneToOneField): Карта, к которой относится буфер
+        changes (JSONField): Накопленный набор изменений
+        node_ids (JSONField): ID узлов, созданных предыдущими сбросами, по временному ID
+        edits (PositiveIntegerField): Количество изменений, принятых с последнего сброса
+        buffered_at (DateTimeField): Время первого несброшенного изменения (опционально)
+        rejected_changes (JSONField): Изменения, не прошедшие проверку при сбросе
+        error (JSONField): Ошибки проверки отклоненных изменений (опционально)
+        updated_at (DateTimeField): Дата последнего изменения буфера
+    """
+    map = models.OneToOneField(Map, on_delete=models.CASCADE, related_name='autosave_buffer')
+    changes = models.JSONField(default=dict, blank=True)
+    node_ids = models.JSONField(default=dict, blank=True)
+    edits = models.PositiveIntegerField(default=0)
+    buffered_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    rejected_changes = models.JSONField(default=dict, blank=True)
+    error = models.JSONField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """Возвращает строковое представление в формате 'карта: число изменений'."""
+        return "%s: %s" % (self.map_id, self.edits)
+
+    class Meta:
+        verbose_name = 'Буфер автосохранения'
+        verbose_name_plural = 'Буферы автосохранения'
+
+class MapIdempotencyKey(models.Model):
+    """
+    Результат запроса на изменение карты, сохраненный по ключу идемпотентности.
+
+    Клиент передает заголовок Idempotency-Key; повтор запроса с тем же ключом
+    получает текущую карту с сохраненным результатом вместо повторного
+    применения изменений.
+    Записи действуют MAP_IDEMPOTENCY_TTL секунд.
+
+    Attributes:
+        map (ForeignKey): Карта, к которой относится запрос
+        key (CharField): Ключ идемпотентности из заголовка
+        request_hash (CharField): Хеш метода и тела запроса
+        status_code (PositiveSmallIntegerField): Код ответа; пусто, пока запрос выполняется
+        response (JSONField): Версия карты и client_index_map после записи (опционально)
+        created_at (DateTimeField): Дата получения запроса
+    """
+    map = models.ForeignKey(Map, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=32)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        """Возвращает строковое представление в формате 'карта: ключ'."""
+        return "%s: %s" % (self.map_id, self.key)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['map', 'key'], name='unique_map_idempotency_key'),
+        ]
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+class MapRebuild(models.Model):
+    """
+    Заявка на перестроение файлов опубликованной карты, которые отдает nginx.
+
+    После изменения карты заявка только создается или откладывается, а сами
+    файлы строит фоновая команда, когда карта перестает меняться
+    (см. MainApp/rebuilds.py). Поэтому серия сохранений дает одно построение.
+
+    Attributes:
+        map (ForeignKey): Карта
+        kind (CharField): Что перестроить
+        requested_at (DateTimeField): Время последнего изменения карты
+        created_at (DateTimeField): Время первого изменения, ожидающего построения
+    """
+    TILES = 'tiles'
+    SNAPSHOT = 'snapshot'
+    KIND_CHOICES = [
+        (TILES, 'Тайлы'),
+        (SNAPSHOT, 'Снимок'),
+    ]
+
+    map = models.ForeignKey(Map, on_delete=models.CASCADE, related_name='rebuilds')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    requested_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """Возвращает строковое представление в формате 'карта: тип'."""
+        return "%s: %s" % (self.map_id, self.kind)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['map', 'kind'], name='unique_map_rebuild_kind'),
+        ]
+        verbose_name = 'Перестроение карты'
+        verbose_name_plural = 'Перестроения карт'
+
+class MapTombstone(models.Model):
+    """
+    Запись об удалении узла или связи с карты.
+
+    Нужна для выдачи изменений карты начиная с версии: клиент узнает
+    не только о новых и измененных строках, но и об удаленных.
+
+    Attributes:
+        map (ForeignKey): Карта, с которой удален объект
+        kind (CharField): Тип удаленного объекта (узел или связь)
+        object_id (BigIntegerField): ID удаленного узла или связи
+        version (PositiveBigIntegerField): Версия карты, в которой объект удален
+    """
+    NODE = 'node'
+    EDGE = 'edge'
+    KIND_CHOICES = [
+        (NODE, 'Узел'),
+        (EDGE, 'Связь'),
+    ]
+
+    map = models.ForeignKey(Map, on_delete=models.CASCADE, related_name='tombstones')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    version = models.PositiveBigIntegerField()
+
+    def __str__(self):
+        """Возвращает строковое представление в формате 'карта: тип ID @версия'."""
+        return "%s: %s %s @%s" % (self.map_id, self.kind, self.object_id, self.version)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['map', 'version'], name='map_tombstone_version_idx'),
+        ]
+        verbose_name = 'Удаленный объект карты'
+        verbose_name_plural = 'Удаленные объекты карт'
+
 class MapNode(models.Model):
     """
     Модель связи узла с определенной картой (для отслеживания позиций узлов в разных картах).
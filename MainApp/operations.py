@@ -0,0 +1,307 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .bulk import MapBulkWriter, DEFAULT_EDGE_STYLE
+from .models import Map, MapOperation
+from .validators import validate_operation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def get_batch_size():
+    """Возвращает размер пакета операций, сворачиваемых за одну транзакцию."""
+    return getattr(settings, 'MAP_OPERATIONS_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+class FoldedOperations:
+    """
+    Результат свертки пакета операций в набор изменений карты.
+
+    Последовательные операции над одним объектом схлопываются: перемещения узла
+    объединяются (побеждает последнее значение), добавление и удаление в одном
+    пакете взаимно уничтожаются, ребра удаленного узла не создаются.
+
+    Attributes:
+        new_nodes (dict): Поля новых узлов по временному ID
+        changed_nodes (dict): Новые значения полей по ID узла в базе
+        deleted_node_ids (set): ID удаляемых узлов
+        new_edges (dict): Данные новых ребер по ключу (временный ID или номер операции)
+        deleted_edge_ids (set): ID удаляемых ребер
+    """
+
+    def __init__(self):
+        self.new_nodes = {}
+        self.changed_nodes = {}
+        self.deleted_node_ids = set()
+        self.new_edges = {}
+        self.deleted_edge_ids = set()
+
+    def is_empty(self):
+        return not (self.new_nodes or self.changed_nodes or self.deleted_node_ids
+                    or self.new_edges or self.deleted_edge_ids)
+
+
+def _node_ref(data, prefix=''):
+    """
+    Возвращает ссылку на узел из параметров операции.
+
+    Ссылка имеет вид ('id', ID в базе) или ('temp', временный ID).
+    """
+    if data.get(f'{prefix}temp_id') is not None:
+        return ('temp', data[f'{prefix}temp_id'])
+    key = prefix.rstrip('_') or 'id'
+    if data.get(key) is not None:
+        return ('id', data[key])
+    return None
+
+
+def fold_operations(operations, known_nodes=None, known_edges=None):
+    """
+    Сворачивает упорядоченный список операций в набор изменений.
+
+    Args:
+        operations (Iterable[MapOperation]): Операции в порядке seq
+        known_nodes (dict): ID узлов, созданных предыдущими пакетами, по временному ID
+        known_edges (dict): ID ребер, созданных предыдущими пакетами, по временному ID
+
+    Returns:
+        FoldedOperations: Набор изменений для MapBulkWriter
+    """
+    known_nodes = known_nodes or {}
+    known_edges = known_edges or {}
+    folded = FoldedOperations()
+    # Временные ID узлов, добавленных и удаленных в этом же пакете
+    dropped_temp_nodes = set()
+
+    def resolve(ref):
+        """Приводит ссылку на узел к ('temp', t) для узлов пакета или ('id', x)."""
+        if ref is None:
+            return None
+        kind, value = ref
+        if kind == 'temp':
+            if value in folded.new_nodes:
+                return ref
+            if value in dropped_temp_nodes or value not in known_nodes:
+                return None
+            return ('id', known_nodes[value])
+        return ref
+
+    def drop_edges_of(ref):
+        for key in [key for key, edge in folded.new_edges.items() if ref in (edge['node1'], edge['node2'])]:
+            del folded.new_edges[key]
+
+    for op in operations:
+        data = op.data or {}
+        if op.op_type == MapOperation.ADD_NODE:
+            folded.new_nodes[op.temp_id] = {
+                key: data[key] for key in ('name', 'latitude', 'longitude', 'description', 'z_coordinate')
+                if key in data
+            }
+            dropped_temp_nodes.discard(op.temp_id)
+
+        elif op.op_type == MapOperation.MOVE_NODE:
+            ref = resolve(_node_ref(data))
+            fields = {key: data[key] for key in ('latitude', 'longitude', 'z_coordinate') if key in data}
+            if ref is None:
+                logger.warning(f"Операция #{op.seq}: узел для перемещения не найден")
+            elif ref[0] == 'temp':
+                folded.new_nodes[ref[1]].update(fields)
+            elif ref[1] not in folded.deleted_node_ids:
+                folded.changed_nodes.setdefault(ref[1], {}).update(fields)
+
+        elif op.op_type == MapOperation.DELETE_NODE:
+            ref = resolve(_node_ref(data))
+            if ref is None:
+                logger.warning(f"Операция #{op.seq}: узел для удаления не найден")
+                continue
+            drop_edges_of(ref)
+            if ref[0] == 'temp':
+                del folded.new_nodes[ref[1]]
+                dropped_temp_nodes.add(ref[1])
+            else:
+                folded.changed_nodes.pop(ref[1], None)
+                folded.deleted_node_ids.add(ref[1])
+
+        elif op.op_type == MapOperation.ADD_EDGE:
+            node1 = resolve(_node_ref(data, 'node1_'))
+            node2 = resolve(_node_ref(data, 'node2_'))
+            if node1 is None or node2 is None:
+                logger.warning(f"Операция #{op.seq}: узлы ребра не найдены")
+                continue
+            key = op.temp_id if op.temp_id is not None else f'seq:{op.seq}'
+            folded.new_edges[key] = {
+                'node1': node1,
+                'node2': node2,
+                'description': data.get('description', ''),
+                'style': data.get('style') or DEFAULT_EDGE_STYLE,
+            }
+
+        elif op.op_type == MapOperation.DELETE_EDGE:
+            if data.get('temp_id') is not None and data['temp_id'] in folded.new_edges:
+                del folded.new_edges[data['temp_id']]
+            elif data.get('temp_id') is not None:
+                if data['temp_id'] in known_edges:
+                    folded.deleted_edge_ids.add(known_edges[data['temp_id']])
+                else:
+                    logger.warning(f"Операция #{op.seq}: ребро для удаления не найдено")
+            elif data.get('id') is not None:
+                folded.deleted_edge_ids.add(data['id'])
+
+    return folded
+
+
+def _known_targets(map_id, op_type, temp_ids):
+    """Возвращает ID объектов, созданных операциями op_type, по их временным ID."""
+    if not temp_ids:
+        return {}
+    rows = (
+        MapOperation.objects
+        .filter(map_id=map_id, op_type=op_type, temp_id__in=temp_ids, target_id__isnull=False)
+        .order_by('seq')
+        .values_list('temp_id', 'target_id')
+    )
+    # При повторном использовании временного ID побеждает более поздняя операция
+    return dict(rows)
+
+
+def compact_map_operations(map_id, batch_size=None):
+    """
+    Сворачивает неприменённые операции карты в таблицы Node/Edge.
+
+    Операции обрабатываются пакетами по batch_size в порядке seq, каждый пакет -
+    в отдельной транзакции под блокировкой строки карты, поэтому параллельные
+    вызовы для одной карты не применяют операции дважды. Некорректная
+    операция не останавливает сворачивание: она отклоняется (MapOperation.error),
+    а остальные операции пакета применяются.
+
+    Args:
+        map_id (int): ID карты
+        batch_size (int): Размер пакета (по умолчанию MAP_OPERATIONS_BATCH_SIZE)
+
+    Returns:
+        int: Количество примененных операций
+    """
+    batch_size = batch_size or get_batch_size()
+    applied = 0
+    while True:
+        with transaction.atomic():
+            map_instance = Map.objects.select_for_update().filter(pk=map_id).first()
+            if map_instance is None:
+                return applied
+            batch = list(
+                MapOperation.objects
+                .filter(map_id=map_id, applied_at__isnull=True)
+                .order_by('seq')[:batch_size]
+            )
+            if not batch:
+                return applied
+            try:
+                with transaction.atomic():
+                    _apply_batch(map_instance, batch)
+            except Exception:
+                logger.exception(f"Карта ID: {map_id}: пакет операций не применен, операции применяются по одной")
+                for op in batch:
+                    try:
+                        with transaction.atomic():
+                            _apply_batch(map_instance, [op])
+                    except Exception as e:
+                        _reject(op, str(e))
+            # Граница seq хранится в карте: она не откатится, когда примененные
+            # операции удалят из журнала (compact_map_operations --prune-days)
+            Map.objects.filter(pk=map_id).update(
+                last_applied_seq=max(map_instance.last_applied_seq, batch[-1].seq)
+            )
+        applied += len(batch)
+        logger.info(f"Карта ID: {map_id}: свернуто операций: {len(batch)}")
+        if len(batch) < batch_size:
+            return applied
+
+
+def _reject(op, reason):
+    """Отмечает операцию отклоненной: она считается обработанной и больше не сворачивается."""
+    logger.error(f"Карта ID: {op.map_id}: операция #{op.seq} отклонена: {reason}")
+    MapOperation.objects.filter(pk=op.pk).update(applied_at=timezone.now(), error=reason[:255])
+
+
+def _apply_batch(map_instance, batch):
+    """Применяет пакет операций к карте. Вызывается внутри транзакции."""
+    # Операции, записанные до проверки параметров при приеме, проверяются повторно
+    valid = []
+    for op in batch:
+        try:
+            op.data = validate_operation(op.op_type, op.data or {})
+        except serializers.ValidationError as e:
+            _reject(op, str(e.detail))
+        else:
+            valid.append(op)
+    batch = valid
+
+    node_temp_refs = set()
+    edge_temp_refs = set()
+    for op in batch:
+        data = op.data or {}
+        for key in ('temp_id', 'node1_temp_id', 'node2_temp_id'):
+            if op.op_type != MapOperation.DELETE_EDGE and data.get(key) is not None:
+                node_temp_refs.add(data[key])
+        if op.op_type == MapOperation.DELETE_EDGE and data.get('temp_id') is not None:
+            edge_temp_refs.add(data['temp_id'])
+    known_nodes = _known_targets(map_instance.id, MapOperation.ADD_NODE, node_temp_refs)
+    known_edges = _known_targets(map_instance.id, MapOperation.ADD_EDGE, edge_temp_refs)
+
+    folded = fold_operations(batch, known_nodes, known_edges)
+    node_ids_by_temp = {}
+    edge_ids_by_temp = {}
+    if not folded.is_empty():
+        writer = MapBulkWriter(map_instance)
+        writer.delete_nodes(folded.deleted_node_ids)
+        created_nodes = writer.create_nodes(
+            [dict(fields, temp_id=temp_id) for temp_id, fields in folded.new_nodes.items()]
+        )
+        node_ids_by_temp = {temp_id: node.id for temp_id, node in zip(folded.new_nodes, created_nodes)}
+        writer.update_nodes(folded.changed_nodes)
+        writer.delete_edges(folded.deleted_edge_ids)
+
+        def node_id(ref):
+            return node_ids_by_temp[ref[1]] if ref[0] == 'temp' else ref[1]
+
+        created_edges = writer.create_edges([
+            dict(edge, node1=node_id(edge['node1']), node2=node_id(edge['node2']),
+                 temp_id=key if isinstance(key, int) else None)
+            for key, edge in folded.new_edges.items()
+        ])
+        edge_ids_by_temp = {edge.temp_id: edge.id for edge in created_edges if edge.temp_id is not None}
+        Map.objects.filter(pk=map_instance.pk).update(updated_at=timezone.now())
+
+    targets = []
+    for op in batch:
+        if op.op_type == MapOperation.ADD_NODE:
+            op.target_id = node_ids_by_temp.get(op.temp_id)
+            targets.append(op)
+        elif op.op_type == MapOperation.ADD_EDGE and op.temp_id is not None:
+            op.target_id = edge_ids_by_temp.get(op.temp_id)
+            targets.append(op)
+    if targets:
+        MapOperation.objects.bulk_update(targets, ['target_id'])
+    MapOperation.objects.filter(id__in=[op.id for op in batch]).update(applied_at=timezone.now())
+
+
+def compact_pending_operations(batch_size=None):
+    """
+    Сворачивает неприменённые операции всех карт.
+
+    Returns:
+        int: Количество примененных операций
+    """
+    map_ids = (
+        MapOperation.objects
+        .filter(applied_at__isnull=True)
+        .values_list('map_id', flat=True)
+        .distinct()
+    )
+    return sum(compact_map_operations(map_id, batch_size) for map_id in list(map_ids))
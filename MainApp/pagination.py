@@ -0,0 +1,92 @@
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_MAX_PAGE_SIZE = 10000
+
+
+def get_page_size():
+    """Возвращает размер страницы узлов и ребер по умолчанию."""
+    return getattr(settings, 'MAP_OBJECTS_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+
+
+def get_max_page_size():
+    """Возвращает наибольший размер страницы, который может запросить клиент."""
+    return getattr(settings, 'MAP_OBJECTS_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+
+
+def parse_int(value, field, minimum):
+    """Разбирает целое не меньше minimum из параметра запроса или вызывает ValidationError."""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({field: 'Должен быть целым числом'})
+    if number < minimum:
+        raise ValidationError({field: f'Должен быть не меньше {minimum}'})
+    return number
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничная выдача узлов и ребер карты по ключу (ID).
+
+    Страница - объекты с ID больше ?after=<ID> в порядке ID, не больше
+    ?limit=<размер> (MAP_OBJECTS_PAGE_SIZE, не больше
+    MAP_OBJECTS_MAX_PAGE_SIZE). В отличие от OFFSET, выборка каждой
+    страницы идет по индексу первичного ключа и не пропускает и не
+    повторяет объекты, если карта меняется между запросами страниц.
+    Без after и limit выдача не разбивается на страницы.
+
+    Строки страницы собирает представление (view.object_rows), чтобы
+    узлы и ребра отдавались в том же виде, что и в карте целиком.
+    """
+    cursor_query_param = 'after'
+    page_size_query_param = 'limit'
+
+    def get_limit(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return get_page_size()
+        return min(parse_int(value, self.page_size_query_param, 1), get_max_page_size())
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        self.request = request
+        limit = self.get_limit(request)
+        after = params.get(self.cursor_query_param)
+
+        self.count = queryset.count()
+        if after is not None:
+            queryset = queryset.filter(id__gt=parse_int(after, self.cursor_query_param, 0))
+        # Лишняя строка показывает, есть ли следующая страница
+        rows = view.object_rows(queryset.order_by('id')[:limit + 1])
+        self.next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+        return rows[:limit]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['count', 'results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,37 @@
+import codecs
+import io
+import re
+
+from django.conf import settings
+from rest_framework import parsers
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, используется стандартный json
+    orjson = None
+
+# orjson читает целые больше 64 бит как float; такие запросы разбирает json
+_BIG_INT_RE = re.compile(rb'\d{20}')
+
+
+class FastJSONParser(parsers.JSONParser):
+    """
+    JSONParser на основе orjson.
+
+    Результат разбора совпадает с JSONParser. Некорректный JSON, кодировки
+    кроме UTF-8, очень большие целые и отсутствие orjson обрабатываются
+    стандартным JSONParser, поэтому сообщения об ошибках не меняются.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        data = stream.read()
+        if not _BIG_INT_RE.search(data):
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(data), media_type, parser_context)
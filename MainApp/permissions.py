@@ -22,5 +22,17 @@ class IsMapOwner(permissions.BasePermission):
             bool: True, если пользователь является владельцем карты, иначе False
         """
         if isinstance(obj, Map):
-            return obj.owner == request.user
-        return False
\ No newline at end of file
+            # Сравнение по owner_id не загружает владельца из базы
+            return request.user.is_authenticated and obj.owner_id == request.user.pk
+        return False
+
+
+class IsPublishedMap(permissions.BasePermission):
+    """
+    Разрешение на чтение опубликованной карты любым пользователем.
+
+    Используется публичным API карты, которое не требует входа в систему.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        return isinstance(obj, Map) and obj.is_published
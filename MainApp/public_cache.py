@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+
+from .compression import ENCODINGS
+from .models import Map
+from .renderers import BINARY_RENDERER_CLASSES, FastJSONRenderer
+from .signals import map_version_changed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 10
+DEFAULT_CACHE_LEVELS = '1:2'
+
+# Варианты ответа, которые nginx хранит под отдельными ключами: заголовки
+# Accept и Accept-Encoding приводятся в nginx.conf к одному из этих значений
+PUBLIC_MEDIA_TYPES = tuple(renderer.media_type for renderer in [FastJSONRenderer] + BINARY_RENDERER_CLASSES)
+PUBLIC_ENCODINGS = ('',) + ENCODINGS
+
+
+def get_max_age():
+    """Возвращает время хранения публичной карты в кеше nginx (s-maxage) в секундах."""
+    return getattr(settings, 'MAP_PUBLIC_CACHE_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+def get_cache_root():
+    """Возвращает каталог кеша nginx (proxy_cache_path) или None, если он недоступен Django."""
+    return getattr(settings, 'MAP_PUBLIC_CACHE_ROOT', None)
+
+
+def patch_public_cache(response):
+    """
+    Разрешает кешировать ответ публичной карты в общих кешах.
+
+    Браузер проверяет карту при каждом открытии (max-age=0, ответ 304
+    по ETag), nginx хранит ее s-maxage секунд и еще
+    MAP_REPRESENTATION_STALE_TIMEOUT отдает устаревшую, пока обновляет.
+    """
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=0,
+        s_maxage=get_max_age(),
+        stale_while_revalidate=getattr(settings, 'MAP_REPRESENTATION_STALE_TIMEOUT', 30),
+    )
+    return response
+
+
+def cache_keys(map_id):
+    """Возвращает ключи proxy_cache_key публичной карты во всех вариантах ответа."""
+    path = reverse('public-map', kwargs={'pk': map_id})
+    return [f'{path}|{media_type}|{encoding}' for media_type in PUBLIC_MEDIA_TYPES for encoding in PUBLIC_ENCODINGS]
+
+
+def cache_file_path(key):
+    """
+    Возвращает путь к файлу кеша nginx для ключа.
+
+    Имя файла - MD5 ключа, подкаталоги берутся с конца имени по
+    уровням MAP_PUBLIC_CACHE_LEVELS (как levels в proxy_cache_path).
+    """
+    name = hashlib.md5(key.encode('utf-8')).hexdigest()
+    parts, end = [], len(name)
+    for level in getattr(settings, 'MAP_PUBLIC_CACHE_LEVELS', DEFAULT_CACHE_LEVELS).split(':'):
+        width = int(level)
+        parts.append(name[end - width:end])
+        end -= width
+    return os.path.join(get_cache_root(), *parts, name)
+
+
+def purge_public_map(map_id):
+    """
+    Удаляет публичную карту из кеша nginx.
+
+    Удаляются файлы кеша всех вариантов ответа; nginx считает
+    отсутствующий файл промахом и запрашивает карту у Django.
+    Без MAP_PUBLIC_CACHE_ROOT карта устаревает в кеше не дольше s-maxage.
+
+    Returns:
+        int: Число удаленных файлов
+    """
+    if not get_cache_root():
+        return 0
+    removed = 0
+    for key in cache_keys(map_id):
+        try:
+            os.remove(cache_file_path(key))
+            removed += 1
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.error(f"Карта ID: {map_id}: не удалось удалить файл кеша nginx: {str(e)}")
+    if removed:
+        logger.info(f"Карта ID: {map_id}: из кеша nginx удалено вариантов: {removed}")
+    return removed
+
+
+@receiver(map_version_changed)
+def purge_changed_map(sender, map_id, version, **kwargs):
+    """Удаляет карту из кеша nginx после изменения, публикации или снятия с публикации."""
+    purge_public_map(map_id)
+
+
+@receiver(post_delete, sender=Map)
+def purge_deleted_map(sender, instance, **kwargs):
+    """Удаляет удаленную карту из кеша nginx после фиксации транзакции."""
+    map_id = instance.pk
+    transaction.on_commit(lambda: purge_public_map(map_id))
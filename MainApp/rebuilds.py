@@ -0,0 +1,91 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import MapRebuild
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DELAY = 10
+DEFAULT_MAX_DELAY = 120
+
+
+def get_delay():
+    """Возвращает, сколько секунд карта должна не меняться перед построением файлов."""
+    return getattr(settings, 'MAP_REBUILD_DELAY', DEFAULT_DELAY)
+
+
+def get_max_delay():
+    """Возвращает наибольшее время ожидания построения для непрерывно меняющейся карты."""
+    return getattr(settings, 'MAP_REBUILD_MAX_DELAY', DEFAULT_MAX_DELAY)
+
+
+def request_rebuild(map_id, kind):
+    """
+    Отмечает, что файлы карты устарели.
+
+    Существующая заявка откладывается до нового изменения, поэтому
+    сохранения подряд дают одно построение.
+
+    Args:
+        map_id (int): ID карты
+        kind (str): Что перестроить (MapRebuild.KIND_CHOICES)
+    """
+    now = timezone.now()
+    if MapRebuild.objects.filter(map_id=map_id, kind=kind).update(requested_at=now):
+        return
+    try:
+        with transaction.atomic():
+            MapRebuild.objects.create(map_id=map_id, kind=kind, requested_at=now)
+    except IntegrityError:
+        # Заявку успел создать параллельный запрос
+        MapRebuild.objects.filter(map_id=map_id, kind=kind).update(requested_at=now)
+
+
+def cancel_rebuild(map_id, kind):
+    """Удаляет заявку: файлы карты удалены, и строить их не нужно."""
+    MapRebuild.objects.filter(map_id=map_id, kind=kind).delete()
+
+
+def run_due_rebuilds(kind, build, delay=None):
+    """
+    Выполняет заявки, готовые к построению.
+
+    Заявка готова, если карта не менялась delay секунд или заявка ждет
+    дольше MAP_REBUILD_MAX_DELAY. Заявка удаляется до построения, только
+    если карта с тех пор не менялась: изменение во время построения
+    оставит заявку для следующего запуска. Ошибка построения одной карты
+    пишется в лог и не мешает остальным.
+
+    Args:
+        kind (str): Что перестроить (MapRebuild.KIND_CHOICES)
+        build (callable): build(map_id) строит файлы карты
+        delay (float): Время без изменений карты (по умолчанию MAP_REBUILD_DELAY)
+
+    Returns:
+        int: Количество выполненных заявок
+    """
+    delay = get_delay() if delay is None else delay
+    now = timezone.now()
+    due = (
+        MapRebuild.objects
+        .filter(kind=kind)
+        .filter(Q(requested_at__lte=now - timedelta(seconds=delay))
+                | Q(created_at__lte=now - timedelta(seconds=get_max_delay())))
+        .values_list('id', 'map_id', 'requested_at')
+    )
+    built = 0
+    for rebuild_id, map_id, requested_at in list(due):
+        deleted, _ = MapRebuild.objects.filter(id=rebuild_id, requested_at=requested_at).delete()
+        if not deleted:
+            continue
+        try:
+            build(map_id)
+            built += 1
+        except Exception:
+            logger.exception(f"Карта ID: {map_id}: не удалось перестроить {kind}")
+    return built
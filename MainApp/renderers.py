@@ -0,0 +1,189 @@
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, используется стандартный json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack необязателен, без него формат не предлагается
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # cbor2 необязателен, без него формат не предлагается
+    cbor2 = None
+
+# Для поиска чисел все цифры заменяются на 0
+_DIGITS_TO_ZERO = bytes.maketrans(b'123456789', b'000000000')
+_NUMBER_START = frozenset(b':,[')
+_NUMBER_END = frozenset(b',]}')
+_NUMBER_CHARS = frozenset(b'0123456789.-+e')
+_MAX_CANDIDATES = 64
+_SMALL_FLOAT_PREFIXES = tuple(start + sign + b'0.0000' for start in (b':', b',', b'[') for sign in (b'', b'-'))
+
+
+def _is_number_token(text, position):
+    """Проверяет, что позиция лежит внутри числа JSON, а не внутри строки."""
+    start = position
+    while start > 0 and text[start - 1] in _NUMBER_CHARS:
+        start -= 1
+    end = position
+    while end < len(text) and text[end] in _NUMBER_CHARS:
+        end += 1
+    if start > 0 and text[start - 1] not in _NUMBER_START:
+        return None
+    if end < len(text) and text[end] not in _NUMBER_END:
+        return None
+    return text[start:end]
+
+
+def _has_divergent_floats(ret):
+    """
+    Ищет числа, которые orjson записывает иначе, чем json: с экспонентой
+    (1e16 вместо 1e+16, 1e-7 вместо 1e-07) и от 1e-05 до 1e-04 (0.00001).
+
+    Совпадения внутри строк отсеиваются проверкой окружения числа; если
+    похожих фрагментов слишком много, ответ кодируется стандартным json.
+    """
+    candidates = []
+    # Экспонента: цифра перед "e" (все цифры заменены на 0)
+    text = ret.translate(_DIGITS_TO_ZERO)
+    position = text.find(b'0e')
+    while position != -1 and len(candidates) <= _MAX_CANDIDATES:
+        candidates.append(position)
+        position = text.find(b'0e', position + 1)
+    # Малые числа: 0.0000x в начале документа или сразу после разделителя
+    if ret[:7].lstrip(b'-').startswith(b'0.0000'):
+        candidates.append(0)
+    for prefix in _SMALL_FLOAT_PREFIXES:
+        position = ret.find(prefix)
+        while position != -1 and len(candidates) <= _MAX_CANDIDATES:
+            candidates.append(position + 1)
+            position = ret.find(prefix, position + 1)
+    if len(candidates) > _MAX_CANDIDATES:
+        return True
+    return any(_is_number_token(text, position) is not None for position in candidates)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer на основе orjson.
+
+    Вывод совпадает с JSONRenderer побайтно: даты и время, Decimal и прочие
+    типы кодируются JSONEncoder DRF, символы U+2028/U+2029 экранируются,
+    а ответы с числами, которые orjson записывает иначе, чем json (очень
+    большие и очень маленькие), кодируются стандартным JSONRenderer.
+    Он же используется, если orjson не установлен, запрошен отступ или
+    настройки UNICODE_JSON, COMPACT_JSON отличаются от значений по умолчанию.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context)):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except orjson.JSONEncodeError:
+            # Неизвестные типы и целые больше 64 бит - стандартным кодировщиком,
+            # он же поднимет ту же ошибку, что и раньше
+            return super().render(data, accepted_media_type, renderer_context)
+        if _has_divergent_floats(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как в JSONRenderer: U+2028/U+2029 экранируются для встраивания в JavaScript
+        if b'\xe2\x80\xa8' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028')
+        if b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class NDJSONRenderer(FastJSONRenderer):
+    """
+    Запись NDJSON (Accept: application/x-ndjson): один JSON-объект в строке.
+
+    Карта в этом формате отдается потоком записей (MainApp/streaming.py),
+    renderer кодирует каждую запись и ответы с ошибками одной строкой.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def get_indent(self, accepted_media_type, renderer_context):
+        # Отступ разорвал бы запись на несколько строк
+        return None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return super().render(data, accepted_media_type, renderer_context) + b'\n'
+
+    def render_lines(self, records):
+        """
+        Кодирует блок записей в строки NDJSON.
+
+        orjson вызывается на каждую запись, а проверка чисел, которые он
+        записывает иначе, чем json, - один раз на блок. Если такие числа
+        есть, блок кодируется по записи через render().
+        """
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return b''.join(self.render(record) for record in records)
+        default = self.encoder_class().default
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_APPEND_NEWLINE
+        try:
+            block = b''.join([orjson.dumps(record, default=default, option=option) for record in records])
+        except orjson.JSONEncodeError:
+            return b''.join(self.render(record) for record in records)
+        if _has_divergent_floats(block):
+            return b''.join(self.render(record) for record in records)
+        if b'\xe2\x80\xa8' in block:
+            block = block.replace(b'\xe2\x80\xa8', b'\\u2028')
+        if b'\xe2\x80\xa9' in block:
+            block = block.replace(b'\xe2\x80\xa9', b'\\u2029')
+        return block
+
+
+class MsgPackRenderer(renderers.BaseRenderer):
+    """
+    Ответ в формате MessagePack (Accept: application/msgpack).
+
+    Значения, которые msgpack не кодирует сам (даты, Decimal, ленивые
+    строки), приводятся так же, как в JSON-ответах.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    encoder_class = renderers.JSONRenderer.encoder_class
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self.encoder_class().default, use_bin_type=True)
+
+
+class CBORRenderer(renderers.BaseRenderer):
+    """Ответ в формате CBOR (Accept: application/cbor)."""
+    media_type = 'application/cbor'
+    format = 'cbor'
+    charset = None
+    render_style = 'binary'
+    encoder_class = renderers.JSONRenderer.encoder_class
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        default = self.encoder_class().default
+        return cbor2.dumps(data, default=lambda encoder, value: encoder.encode(default(value)))
+
+
+# Бинарные форматы, доступные при установленных библиотеках
+BINARY_RENDERER_CLASSES = [
+    renderer for renderer, module in ((MsgPackRenderer, msgpack), (CBORRenderer, cbor2))
+    if module is not None
+]
@@ -0,0 +1,169 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .columnar import COLUMNAR_FORMATS
+from .models import Map
+from .signals import map_version_changed
+
+logger = logging.getLogger(__name__)
+
+# Форматы, в которых карта целиком хранится в кеше представлений
+CACHED_FORMATS = ('json',) + COLUMNAR_FORMATS
+
+DEFAULT_TIMEOUT = 24 * 60 * 60
+DEFAULT_STALE_TIMEOUT = 30
+LOCK_TIMEOUT = 60
+
+ENTRY_KEY = 'map_representation:%(map_id)s:%(version)s:%(format)s'
+LATEST_KEY = 'map_representation:%(map_id)s:%(format)s:latest'
+LOCK_KEY = 'map_representation:%(map_id)s:%(format)s:lock'
+# Сжатые варианты записи (MainApp/compression.py): {кодировка: bytes}
+VARIANTS_KEY = '%(key)s:variants'
+
+HIT = 'hit'
+STALE = 'stale'
+MISS = 'miss'
+
+
+def get_cache():
+    """Возвращает кеш Django для представлений карт (настройка MAP_REPRESENTATION_CACHE)."""
+    return caches[getattr(settings, 'MAP_REPRESENTATION_CACHE', 'default')]
+
+
+def get_timeout():
+    """Возвращает время хранения представления актуальной версии в секундах."""
+    return getattr(settings, 'MAP_REPRESENTATION_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def get_stale_timeout():
+    """Возвращает время, в течение которого после изменения карты можно отдавать старую версию."""
+    return getattr(settings, 'MAP_REPRESENTATION_STALE_TIMEOUT', DEFAULT_STALE_TIMEOUT)
+
+
+def _keys(map_id, format):
+    return {
+        'latest': LATEST_KEY % {'map_id': map_id, 'format': format},
+        'lock': LOCK_KEY % {'map_id': map_id, 'format': format},
+    }
+
+
+def cached_representation(map_instance, format, render, allow_stale=True):
+    """
+    Возвращает закодированное представление карты из кеша или строит его.
+
+    Представление хранится по ключу (ID карты, версия, формат), поэтому
+    после изменения карты новая версия в кеше не находится. Пока новая
+    версия строится одним запросом (блокировка через cache.add), остальные
+    запросы к карте получают предыдущую версию (stale-while-revalidate),
+    если она моложе MAP_REPRESENTATION_STALE_TIMEOUT с момента изменения.
+    Без allow_stale запрос при занятой блокировке строит версию сам: так
+    редактор владельца не получит версию старше той, что он записал.
+
+    Args:
+        map_instance (Map): Карта, версия которой запрошена
+        format (str): Формат из CACHED_FORMATS
+        render (callable): Строит запись {'content', 'content_type', 'etag'}
+        allow_stale (bool): Можно ли отдать предыдущую версию, пока строится новая
+
+    Returns:
+        tuple: (запись, состояние HIT, STALE или MISS). В записи есть
+            version - версия карты, которой соответствует содержимое,
+            и key - ключ записи в кеше
+    """
+    cache = get_cache()
+    keys = _keys(map_instance.id, format)
+    key = ENTRY_KEY % {'map_id': map_instance.id, 'version': map_instance.version, 'format': format}
+    entry = cache.get(key)
+    if entry is not None:
+        return entry, HIT
+
+    latest = cache.get(keys['latest'])
+    locked = cache.add(keys['lock'], map_instance.version, LOCK_TIMEOUT)
+    if allow_stale and not locked and latest is not None and latest < map_instance.version:
+        stale = cache.get(ENTRY_KEY % {'map_id': map_instance.id, 'version': latest, 'format': format})
+        if stale is not None:
+            return stale, STALE
+
+    try:
+        entry = dict(render(), version=map_instance.version, key=key)
+        cache.set(key, entry, get_timeout())
+        if latest is None or latest <= map_instance.version:
+            cache.set(keys['latest'], map_instance.version, get_timeout())
+    finally:
+        if locked:
+            cache.delete(keys['lock'])
+    return entry, MISS
+
+
+def cached_variant(key, encoding, compress):
+    """
+    Возвращает сжатый вариант записи кеша представлений.
+
+    Варианты хранятся рядом с записью и снимаются с кеша вместе с ней,
+    поэтому карта одной версии сжимается в каждой кодировке один раз.
+
+    Args:
+        key (str): Ключ записи (entry['key'])
+        encoding (str): Кодировка (br, zstd, gzip)
+        compress (callable): Сжимает содержимое записи
+
+    Returns:
+        bytes: Сжатое содержимое
+    """
+    cache = get_cache()
+    variants_key = VARIANTS_KEY % {'key': key}
+    variants = cache.get(variants_key) or {}
+    content = variants.get(encoding)
+    if content is None:
+        content = variants[encoding] = compress()
+        cache.set(variants_key, variants, get_timeout())
+    return content
+
+
+def invalidate_representations(map_id, version=None):
+    """
+    Снимает с кеша представления карты.
+
+    Если передана новая версия, представление предыдущей версии остается
+    в кеше на MAP_REPRESENTATION_STALE_TIMEOUT и отдается, пока строится
+    новое. Без версии (карта удалена или снята с публикации) все
+    представления удаляются сразу.
+
+    Args:
+        map_id (int): ID карты
+        version (int): Новая версия карты или None
+    """
+    cache = get_cache()
+    for format in CACHED_FORMATS:
+        keys = _keys(map_id, format)
+        latest = cache.get(keys['latest'])
+        if latest is None:
+            continue
+        key = ENTRY_KEY % {'map_id': map_id, 'version': latest, 'format': format}
+        variants_key = VARIANTS_KEY % {'key': key}
+        if version is None:
+            cache.delete_many([key, variants_key, keys['latest']])
+        elif latest < version:
+            cache.touch(key, get_stale_timeout())
+            cache.touch(variants_key, get_stale_timeout())
+    logger.debug(f"Карта ID: {map_id}: представления в кеше сняты, версия {version}")
+
+
+@receiver(map_version_changed)
+def invalidate_changed_map(sender, map_id, version, **kwargs):
+    """Снимает с кеша представления после изменения, публикации или снятия карты с публикации."""
+    map_instance = Map.objects.filter(pk=map_id).only('is_published').first()
+    if map_instance is None or not map_instance.is_published:
+        invalidate_representations(map_id)
+    else:
+        invalidate_representations(map_id, version)
+
+
+@receiver(post_delete, sender=Map)
+def invalidate_deleted_map(sender, instance, **kwargs):
+    """Удаляет представления удаленной карты."""
+    invalidate_representations(instance.pk)
@@ -1,6 +1,13 @@
 from rest_framework import serializers
-from .models import Map, Node, Edge
+from django.db import transaction
+from .models import Map, Node, Edge, MapOperation, MapTombstone, MapVersionConflict
+from .bulk import MapBulkWriter, DEFAULT_EDGE_STYLE
+from .transforms import GEOMETRY_OPERATIONS, STYLE_OPERATIONS, NODE_FILTER_FIELDS, EDGE_FILTER_FIELDS
+from . import validators
+from .timing import get_timer
+from .columnar import map_columns
 import logging
+from collections import Counter
 
 
 class NodeSerializer(serializers.ModelSerializer):
@@ -8,7 +15,8 @@ class NodeSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Node
-        fields = '__all__'
+        exclude = ('grid_cell',)
+        read_only_fields = ('version',)
 
     def validate_latitude(self, value):
         if not (-90 <= value <= 90):
@@ -70,32 +78,33 @@ class EdgeWriteSerializer(serializers.Serializer):
         
         # Проверяем структуру и значения поля style, если оно есть
         if 'style' in data and data['style']:
-            style = data['style']
-            if not isinstance(style, dict):
-                raise serializers.ValidationError({'style': 'Должно быть объектом JSON'})
-            
-            # Проверка цвета
-            if 'color' in style and not isinstance(style['color'], str):
-                raise serializers.ValidationError({'style.color': 'Должен быть строкой'})
-            
-            # Проверка ширины
-            if 'width' in style:
-                try:
-                    width = int(style['width'])
-                    if not (1 <= width <= 10):
-                        raise serializers.ValidationError({'style.width': 'Должен быть числом от 1 до 10'})
-                except (ValueError, TypeError):
-                    raise serializers.ValidationError({'style.width': 'Должен быть числом'})
-            
-            # Проверка стиля линии
-            if 'lineStyle' in style and style['lineStyle'] not in ['solid', 'dashed', 'dotted']:
-                raise serializers.ValidationError({
-                    'style.lineStyle': 'Должен быть одним из: solid, dashed, dotted'
-                })
+            validators.check_edge_style(data['style'])
         
         return data
 
 
+class MapOperationSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор операции из журнала операций карты.
+
+    Проверяет параметры операции в зависимости от ее типа
+    (validators.validate_operation).
+    """
+
+    class Meta:
+        model = MapOperation
+        fields = ['seq', 'op_type', 'data', 'temp_id', 'target_id', 'created_at', 'applied_at', 'error']
+        read_only_fields = ('temp_id', 'target_id', 'created_at', 'applied_at', 'error')
+
+    def validate(self, attrs):
+        op_type = attrs['op_type']
+        data = validators.validate_operation(op_type, attrs.get('data') or {})
+        attrs['data'] = data
+        if op_type in (MapOperation.ADD_NODE, MapOperation.ADD_EDGE):
+            attrs['temp_id'] = data.get('temp_id')
+        return attrs
+
+
 class MapSerializer(serializers.ModelSerializer):
     # Явно объявляем title как обязательное поле
     title = serializers.CharField(max_length=100, required=True, allow_null=False, allow_blank=False)
@@ -113,9 +122,9 @@ class MapSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'owner', 'description', 'center_latitude', 
             'center_longitude', 'nodes', 'edges', 'hashtags', 'is_published',
-            'created_at', 'updated_at', 'edges_data', 'client_index_map'
+            'created_at', 'updated_at', 'version', 'edges_data', 'client_index_map'
             ] 
-        read_only_fields = ('owner', 'created_at', 'updated_at', 'edges', 'client_index_map') # Добавили edges и client_index_map
+        read_only_fields = ('owner', 'created_at', 'updated_at', 'version', 'edges', 'client_index_map') # Добавили edges и client_index_map
 
     def get_client_index_map(self, obj):
         """
@@ -176,14 +185,8 @@ class MapSerializer(serializers.ModelSerializer):
                         logger.debug(f"Преобразовано поле {field} из строки JSON: {processed_data[field]}")
                     except Exception as e:
                         logger.error(f"Ошибка при преобразовании JSON для поля {field}: {str(e)}")
-                if field in ['new_edges', 'changed_edges'] and isinstance(processed_data[field], list):
-                    for i, edge_data in enumerate(processed_data[field]):
-                        if isinstance(edge_data, dict):
-                            if 'node1' in edge_data and isinstance(edge_data['node1'], str) and edge_data['node1'].isdigit():
-                                edge_data['node1'] = int(edge_data['node1'])
-                            if 'node2' in edge_data and isinstance(edge_data['node2'], str) and edge_data['node2'].isdigit():
-                                edge_data['node2'] = int(edge_data['node2'])
-                            logger.debug(f"Преобразованы ID узлов в ребре {i}: {edge_data}")
+                # ID узлов в ребрах приводятся к int при проверке (MainApp/validators.py),
+                # отдельный проход по ребрам здесь не нужен
         result = super().to_internal_value(processed_data)
         for field in patch_fields:
             if field in processed_data and field not in result:
@@ -191,11 +194,35 @@ class MapSerializer(serializers.ModelSerializer):
                 logger.debug(f"Добавлено поле {field} в validated_data: {result[field]}")
         return result
 
+    def validate(self, attrs):
+        """
+        При полной синхронизации (PUT) требует узлы и ребра и запрещает
+        повторяющиеся ID: отсутствующий список удалил бы все узлы или ребра карты.
+        """
+        if not self.context.get('full_sync'):
+            return attrs
+        for key, field in (('nodes', 'nodes'), ('edges_data', 'edges')):
+            if key not in attrs:
+                raise serializers.ValidationError({field: 'Обязательное поле при полной синхронизации карты (PUT)'})
+        node_ids = [self._coerce_id(node.get('id')) for node in self.initial_data.get('nodes', [])
+                    if isinstance(node, dict)]
+        edge_ids = [edge.get('id') for edge in attrs['edges_data']]
+        for field, ids in (('nodes', node_ids), ('edges', edge_ids)):
+            counts = Counter(value for value in ids if value is not None)
+            duplicates = sorted(value for value, count in counts.items() if count > 1)
+            if duplicates:
+                raise serializers.ValidationError({field: f"Повторяющиеся ID: {', '.join(map(str, duplicates))}"})
+        return attrs
+
     def update(self, instance, validated_data):
         """
         Обрабатывает обновление существующего объекта карты (только PATCH).
         Извлекает поля для PATCH из контекста запроса, если они не прошли стандартную валидацию.
         Вызывает _handle_patch_update для выполнения обновления.
+
+        Если в контексте передана expected_version (заголовок If-Match),
+        изменения применяются только когда версия карты не изменилась,
+        иначе поднимается MapVersionConflict.
         """
         logger = logging.getLogger(__name__)
         logger.info(f"Обновление карты ID: {instance.id}")
@@ -210,7 +237,12 @@ class MapSerializer(serializers.ModelSerializer):
                     if field in request_data and field not in validated_data:
                         logger.info(f"Добавление поля {field} из исходных данных запроса")
                         validated_data[field] = request_data[field]
+            if self.context.get('full_sync'):
+                return self._handle_full_sync(instance, validated_data)
             return self._handle_patch_update(instance, validated_data)
+        except MapVersionConflict:
+            # Конфликт версий обрабатывается представлением (412 Precondition Failed)
+            raise
         except Exception as e:
             logger.exception(f"Ошибка при обновлении карты: {str(e)}")
             raise serializers.ValidationError(f"Ошибка при обновлении карты: {str(e)}")
@@ -220,135 +252,432 @@ class MapSerializer(serializers.ModelSerializer):
         Выполняет логику PATCH-обновления для карты.
         Обновляет основные поля, удаляет/добавляет/изменяет узлы и ребра.
         Создает карту соответствия временных и постоянных ID для ответа.
+
+        Все изменения применяются пакетно через MapBulkWriter в одной транзакции,
+        поэтому число запросов не зависит от количества измененных узлов и ребер.
+        Ребра могут ссылаться на узлы, создаваемые в этом же запросе, через поля
+        node1_temp_id/node2_temp_id (значение temp_id из new_nodes), а на
+        сохраненные узлы - через node1/node2. Пространства временных и постоянных
+        ID не пересекаются.
         """
         logger = logging.getLogger(__name__)
         logger.info(f"Обработка PATCH-запроса для карты ID: {instance.id}")
         client_to_db_id_map = {}
+        map_fields_changed = False
         for attr, value in validated_data.items():
             if attr not in ['new_nodes', 'changed_nodes', 'deleted_node_ids', 
                         'new_edges', 'changed_edges', 'deleted_edge_ids', 'nodes', 'edges_data']:
                 logger.debug(f"Обновление основного поля {attr}: {value}")
                 setattr(instance, attr, value)
-        instance.save()
-        existing_nodes = {str(node.id): node for node in instance.nodes.all()}
-        existing_edges = {str(edge.id): edge for edge in instance.edges.all()}
-        deleted_node_ids = validated_data.get('deleted_node_ids', [])
-        if deleted_node_ids:
-            logger.info(f"Удаление {len(deleted_node_ids)} узлов: {deleted_node_ids}")
-            for node_id in deleted_node_ids:
-                node_id_str = str(node_id)
-                if node_id_str in existing_nodes:
-                    node = existing_nodes[node_id_str]
-                    node_db_id = node.id
-                    related_edges = Edge.objects.filter(node1_id=node_db_id) | Edge.objects.filter(node2_id=node_db_id)
-                    for edge in related_edges:
-                        if str(edge.id) in existing_edges:
-                            logger.debug(f"Удаление связанного ребра ID: {edge.id} при удалении узла ID: {node_id}")
-                            instance.edges.remove(edge)
-                            del existing_edges[str(edge.id)]
-                    logger.debug(f"Удаление узла ID: {node_id}")
-                    instance.nodes.remove(node)
-                    del existing_nodes[node_id_str]
-                else:
-                    logger.warning(f"Узел ID {node_id} не найден для удаления")
-
-        new_nodes_data = validated_data.get('new_nodes', [])
-        if new_nodes_data:
-            logger.info(f"Добавление {len(new_nodes_data)} новых узлов")
-            for node_data in new_nodes_data:
-                temp_id = node_data.pop('temp_id', None)
-                node_serializer = NodeSerializer(data=node_data)
-                if node_serializer.is_valid():
-                    new_node = node_serializer.save()
-                    instance.nodes.add(new_node)
+                map_fields_changed = True
+
+        timer = get_timer(self.context)
+        with timer.span('validate_items'):
+            deleted_node_ids = self._coerce_ids(validated_data.get('deleted_node_ids', []))
+            deleted_edge_ids = self._coerce_ids(validated_data.get('deleted_edge_ids', []))
+            new_nodes = self._validate_new_nodes(validated_data.get('new_nodes', []))
+            changed_nodes = self._validate_changed_nodes(validated_data.get('changed_nodes', []))
+            new_edges = validated_data.get('new_edges', [])
+            changed_edges = validated_data.get('changed_edges', [])
+            validators.check_edge_items(new_edges, 'new_edges')
+            validators.check_edge_items(changed_edges, 'changed_edges')
+
+        with transaction.atomic():
+            instance.save()
+            writer = MapBulkWriter(instance, expected_version=self.context.get('expected_version'))
+            if map_fields_changed:
+                writer.ensure_version()
+
+            if deleted_node_ids:
+                logger.info(f"Удаление {len(deleted_node_ids)} узлов: {deleted_node_ids}")
+                with timer.span('delete_nodes'):
+                    writer.delete_nodes(deleted_node_ids)
+
+            if new_nodes:
+                logger.info(f"Добавление {len(new_nodes)} новых узлов")
+                with timer.span('create_nodes'):
+                    created = writer.create_nodes([node_data for _, node_data in new_nodes])
+                for (temp_id, _), new_node in zip(new_nodes, created):
                     if temp_id is not None:
                         client_to_db_id_map[str(temp_id)] = new_node
-                    existing_nodes[str(new_node.id)] = new_node
-                    logger.debug(f"Добавлен новый узел ID: {new_node.id} (временный ID: {temp_id})")
-                else:
-                    logger.error(f"Ошибка валидации нового узла: {node_serializer.errors}")
-                    raise serializers.ValidationError({'new_nodes': node_serializer.errors})
-
-        changed_nodes_data = validated_data.get('changed_nodes', [])
-        if changed_nodes_data:
-            logger.info(f"Обновление {len(changed_nodes_data)} узлов")
-            for node_data in changed_nodes_data:
-                node_id = node_data.get('id')
-                if node_id and str(node_id) in existing_nodes:
-                    node_instance = existing_nodes[str(node_id)]
-                    node_serializer = NodeSerializer(node_instance, data=node_data, partial=True)
-                    if node_serializer.is_valid():
-                        node_serializer.save()
-                        logger.debug(f"Обновлен узел ID: {node_id}")
-                    else:
-                        logger.error(f"Ошибка валидации измененного узла ID {node_id}: {node_serializer.errors}")
-                        raise serializers.ValidationError({'changed_nodes': node_serializer.errors})
-                else:
-                    logger.warning(f"Узел ID {node_id} не найден для обновления")
-
-        deleted_edge_ids = validated_data.get('deleted_edge_ids', [])
-        if deleted_edge_ids:
-            logger.info(f"Удаление {len(deleted_edge_ids)} ребер: {deleted_edge_ids}")
-            for edge_id in deleted_edge_ids:
-                edge_id_str = str(edge_id)
-                if edge_id_str in existing_edges:
-                    edge = existing_edges[edge_id_str]
-                    instance.edges.remove(edge)
-                    del existing_edges[edge_id_str]
-                    logger.debug(f"Удалено ребро ID: {edge_id}")
-                else:
-                    logger.warning(f"Ребро ID {edge_id} не найдено для удаления")
-
-        new_edges_data = validated_data.get('new_edges', [])
-        if new_edges_data:
-            logger.info(f"Добавление {len(new_edges_data)} новых ребер")
-            for edge_data in new_edges_data:
-                node1_ref = edge_data.get('node1')
-                node2_ref = edge_data.get('node2')
-                node1_id = client_to_db_id_map.get(str(node1_ref), node1_ref) if str(node1_ref) in client_to_db_id_map else node1_ref
-                node2_id = client_to_db_id_map.get(str(node2_ref), node2_ref) if str(node2_ref) in client_to_db_id_map else node2_ref
-                
-                if str(node1_id) in existing_nodes and str(node2_id) in existing_nodes:
-                    edge_payload = {
-                        'node1': existing_nodes[str(node1_id)].id,
-                        'node2': existing_nodes[str(node2_id)].id,
-                        'description': edge_data.get('description', ''),
-                        'style': edge_data.get('style', {
-                            'color': '#1DA1F2',
-                            'width': 3,
-                            'lineStyle': 'solid'
-                        })
-                    }
-                    edge_serializer = EdgeSerializer(data=edge_payload)
-                    if edge_serializer.is_valid():
-                        new_edge = edge_serializer.save()
-                        instance.edges.add(new_edge)
-                        existing_edges[str(new_edge.id)] = new_edge
-                        logger.debug(f"Добавлено новое ребро ID: {new_edge.id} между узлами {node1_id} и {node2_id}")
-                    else:
-                        logger.error(f"Ошибка валидации нового ребра: {edge_serializer.errors}")
-                        raise serializers.ValidationError({'new_edges': edge_serializer.errors})
-                else:
-                    logger.warning(f"Один или оба узла ({node1_id}, {node2_id}) не найдены для создания нового ребра")
-
-        changed_edges_data = validated_data.get('changed_edges', [])
-        if changed_edges_data:
-            logger.info(f"Обновление {len(changed_edges_data)} ребер")
-            for edge_data in changed_edges_data:
-                edge_id = edge_data.get('id')
-                if edge_id and str(edge_id) in existing_edges:
-                    edge_instance = existing_edges[str(edge_id)]
-                    edge_serializer = EdgeSerializer(edge_instance, data=edge_data, partial=True)
-                    if edge_serializer.is_valid():
-                        edge_serializer.save()
-                        logger.debug(f"Обновлено ребро ID: {edge_id}")
-                    else:
-                        logger.error(f"Ошибка валидации измененного ребра ID {edge_id}: {edge_serializer.errors}")
-                        raise serializers.ValidationError({'changed_edges': edge_serializer.errors})
-                else:
-                    logger.warning(f"Ребро ID {edge_id} не найдено для обновления")
 
-        instance.save()
+            if changed_nodes:
+                logger.info(f"Обновление {len(changed_nodes)} узлов")
+                with timer.span('update_nodes'):
+                    writer.update_nodes(changed_nodes)
+
+            if deleted_edge_ids:
+                logger.info(f"Удаление {len(deleted_edge_ids)} ребер: {deleted_edge_ids}")
+                with timer.span('delete_edges'):
+                    writer.delete_edges(deleted_edge_ids)
+
+            if new_edges:
+                logger.info(f"Добавление {len(new_edges)} новых ребер")
+                with timer.span('create_edges'):
+                    writer.create_edges(self._validate_new_edges(new_edges, client_to_db_id_map))
+
+            if changed_edges:
+                logger.info(f"Обновление {len(changed_edges)} ребер")
+                with timer.span('update_edges'):
+                    writer.update_edges(self._validate_changed_edges(changed_edges, client_to_db_id_map))
+
         self._client_index_map = client_to_db_id_map
         logger.info(f"Обновление карты ID: {instance.id} завершено")
-        return instance
\ No newline at end of file
+        return instance
+
+    def _handle_full_sync(self, instance, validated_data):
+        """
+        Выполняет синхронизацию карты с полным состоянием, присланным клиентом (PUT).
+        Сравнивает присланные узлы и ребра с сохраненными по ID и хешу содержимого
+        и применяет только отличающиеся строки. Повторное сохранение неизмененной
+        карты не выполняет ни одной записи.
+        """
+        logger = logging.getLogger(__name__)
+        logger.info(f"Обработка PUT-запроса для карты ID: {instance.id}")
+        changed_attrs = []
+        for attr, value in validated_data.items():
+            if attr not in ['nodes', 'edges_data', 'hashtags'] and getattr(instance, attr) != value:
+                logger.debug(f"Обновление основного поля {attr}: {value}")
+                setattr(instance, attr, value)
+                changed_attrs.append(attr)
+
+        raw_nodes = self.initial_data.get('nodes', [])
+        nodes_data = []
+        for raw_node, node_fields in zip(raw_nodes, validated_data.get('nodes', [])):
+            node_fields = dict(node_fields)
+            node_fields.pop('temp_id', None)
+            node_fields['id'] = self._coerce_id(raw_node.get('id'))
+            nodes_data.append(node_fields)
+        edges_data = [dict(edge_data) for edge_data in validated_data.get('edges_data', [])]
+
+        with transaction.atomic():
+            if 'hashtags' in validated_data:
+                instance.hashtags.set(validated_data['hashtags'])
+            writer = MapBulkWriter(instance, expected_version=self.context.get('expected_version'))
+            with get_timer(self.context).span('sync'):
+                client_to_db_id_map, stats = writer.sync(nodes_data, edges_data)
+            if changed_attrs or any(stats.values()):
+                writer.ensure_version()
+                instance.save()
+
+        self._client_index_map = client_to_db_id_map
+        logger.info(f"Синхронизация карты ID: {instance.id} завершена")
+        return instance
+
+    @staticmethod
+    def _coerce_id(value):
+        """Приводит ID из запроса к int, возвращает None для некорректных значений."""
+        return validators.coerce_id(value)
+
+    def _coerce_ids(self, values):
+        """Приводит список ID из запроса к int, пропуская некорректные значения."""
+        logger = logging.getLogger(__name__)
+        ids = []
+        for value in values or []:
+            coerced = self._coerce_id(value)
+            if coerced is None:
+                logger.warning(f"Некорректный ID {value!r} пропущен")
+            else:
+                ids.append(coerced)
+        return ids
+
+    def _validate_new_nodes(self, nodes_data):
+        """
+        Проверяет новые узлы скомпилированной схемой (MainApp/validators.py)
+        без создания NodeSerializer на каждый узел.
+
+        Returns:
+            list[tuple]: Пары (временный ID, проверенные данные узла)
+        """
+        return validators.validate_new_nodes(nodes_data)
+
+    def _validate_changed_nodes(self, nodes_data):
+        """
+        Проверяет измененные узлы скомпилированной схемой.
+
+        Returns:
+            dict: Проверенные значения полей по ID узла
+        """
+        return validators.validate_changed_nodes(nodes_data)
+
+    def _resolve_node_ref(self, edge_data, key, client_to_db_id_map):
+        """
+        Определяет ID узла, на который ссылается ребро.
+
+        Args:
+            edge_data (dict): Данные ребра из запроса
+            key (str): 'node1' или 'node2'
+            client_to_db_id_map (dict): Созданные узлы по временному ID
+
+        Returns:
+            int | None: ID узла в базе или None, если ссылку не удалось разрешить
+        """
+        temp_id = edge_data.get(f'{key}_temp_id')
+        if temp_id is not None:
+            node = client_to_db_id_map.get(str(temp_id))
+            return node.id if node is not None else None
+        return self._coerce_id(edge_data.get(key))
+
+    def _validate_new_edges(self, edges_data, client_to_db_id_map):
+        """
+        Проверяет новые ребра и заменяет временные ID узлов на ID из базы.
+
+        Returns:
+            list[dict]: Данные ребер с целыми ID узлов
+        """
+        return validators.validate_new_edges(
+            edges_data, lambda edge_data, key: self._resolve_node_ref(edge_data, key, client_to_db_id_map)
+        )
+
+    def _validate_changed_edges(self, edges_data, client_to_db_id_map):
+        """
+        Проверяет измененные ребра и заменяет временные ID узлов на ID из базы.
+
+        Returns:
+            dict: Новые значения полей по ID ребра
+        """
+        return validators.validate_changed_edges(
+            edges_data, lambda edge_data, key: self._resolve_node_ref(edge_data, key, client_to_db_id_map)
+        )
+
+
+class MapAutosaveSerializer(serializers.Serializer):
+    """
+    Сериализатор изменений автосохранения.
+
+    Принимает тот же формат, что и PATCH карты, и проверяет узлы так же,
+    но ничего не записывает: проверенные изменения сливаются в буфер
+    автосохранения (MainApp/autosave.py). У новых узлов обязателен temp_id,
+    по нему объединяются повторные правки еще не сохраненного узла, а
+    deleted_node_temp_ids удаляет такой узел вместе с его новыми ребрами.
+    """
+    title = serializers.CharField(max_length=100, required=False)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    center_latitude = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    center_longitude = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    new_nodes = serializers.ListField(required=False)
+    changed_nodes = serializers.ListField(required=False)
+    deleted_node_ids = serializers.ListField(required=False)
+    deleted_node_temp_ids = serializers.ListField(required=False)
+    new_edges = serializers.ListField(required=False)
+    changed_edges = serializers.ListField(required=False)
+    deleted_edge_ids = serializers.ListField(required=False)
+
+    def validate(self, attrs):
+        new_nodes = validators.validate_new_nodes(attrs.get('new_nodes', []))
+        if any(temp_id is None for temp_id, _ in new_nodes):
+            raise serializers.ValidationError({'new_nodes': ['Для автосохранения у нового узла должен быть temp_id']})
+        for key in ('new_edges', 'changed_edges'):
+            validators.check_edge_items(attrs.get(key, []), key)
+        attrs['new_nodes'] = new_nodes
+        attrs['changed_nodes'] = validators.validate_changed_nodes(attrs.get('changed_nodes', []))
+        for key in ('deleted_node_ids', 'deleted_node_temp_ids', 'deleted_edge_ids'):
+            ids = [validators.coerce_id(value) for value in attrs.get(key, [])]
+            attrs[key] = [value for value in ids if value is not None]
+        return attrs
+
+
+class BulkSelectorSerializer(serializers.Serializer):
+    """Селектор массовой операции: ровно один способ отбора узлов или ребер."""
+    node_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    edge_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    bbox = serializers.ListField(child=serializers.FloatField(), required=False, min_length=4, max_length=4)
+    node_filter = serializers.DictField(required=False, allow_empty=False)
+    edge_filter = serializers.DictField(required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        if len(attrs) != 1:
+            raise serializers.ValidationError(
+                "Требуется ровно одно из: node_ids, edge_ids, bbox, node_filter, edge_filter"
+            )
+        if 'bbox' in attrs:
+            south, west, north, east = attrs['bbox']
+            if south > north or west > east:
+                raise serializers.ValidationError({'bbox': 'Ожидается [юг, запад, север, восток]'})
+        for key, allowed in (('node_filter', NODE_FILTER_FIELDS), ('edge_filter', EDGE_FILTER_FIELDS)):
+            unknown = set(attrs.get(key, {})) - set(allowed)
+            if unknown:
+                raise serializers.ValidationError({key: f"Недопустимые поля: {', '.join(sorted(unknown))}"})
+        return attrs
+
+
+class BulkOperationSerializer(serializers.Serializer):
+    """
+    Массовая операция: translate (delta_latitude, delta_longitude),
+    rotate (angle в градусах против часовой стрелки) или scale (factor)
+    вокруг точки (center_latitude, center_longitude), set_style (style).
+    """
+    type = serializers.ChoiceField(choices=GEOMETRY_OPERATIONS + STYLE_OPERATIONS)
+    delta_latitude = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    delta_longitude = serializers.FloatField(required=False, min_value=-360, max_value=360)
+    angle = serializers.FloatField(required=False)
+    factor = serializers.FloatField(required=False)
+    center_latitude = serializers.FloatField(required=False, min_value=-89, max_value=89)
+    center_longitude = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    style = serializers.JSONField(required=False)
+
+    REQUIRED = {
+        'rotate': ('angle', 'center_latitude', 'center_longitude'),
+        'scale': ('factor', 'center_latitude', 'center_longitude'),
+        'set_style': ('style',),
+    }
+
+    def validate(self, attrs):
+        kind = attrs['type']
+        for key in self.REQUIRED.get(kind, ()):
+            if key not in attrs:
+                raise serializers.ValidationError({key: 'Обязательное поле.'})
+        if kind == 'translate' and 'delta_latitude' not in attrs and 'delta_longitude' not in attrs:
+            raise serializers.ValidationError('Требуется delta_latitude или delta_longitude')
+        if kind == 'scale' and attrs['factor'] <= 0:
+            raise serializers.ValidationError({'factor': 'Должен быть больше 0'})
+        if kind == 'set_style':
+            validators.check_edge_style(attrs['style'])
+        return attrs
+
+
+class MapBulkEditSerializer(serializers.Serializer):
+    """Запрос массового изменения карты: селектор и операции в порядке применения."""
+    selector = BulkSelectorSerializer()
+    operations = BulkOperationSerializer(many=True, allow_empty=False)
+
+
+class MapHeaderSerializer(serializers.ModelSerializer):
+    """Основные поля карты без узлов и ребер (для MapReadSerializer)."""
+
+    class Meta:
+        model = Map
+        fields = [
+            'id', 'title', 'owner', 'description', 'center_latitude', 'center_longitude',
+            'hashtags', 'is_published', 'created_at', 'updated_at', 'version',
+        ]
+
+
+class MapReadSerializer(serializers.BaseSerializer):
+    """
+    Быстрое представление карты целиком для чтения.
+
+    Отдает тот же JSON, что и MapSerializer, но узлы и ребра загружаются
+    через values_list двумя запросами и собираются в словари напрямую, без
+    экземпляров моделей и полей DRF на каждую строку. Порядок ключей и
+    значения по умолчанию (стиль ребра) повторяют NodeSerializer и
+    EdgeSerializer; совпадение проверяется тестом.
+    """
+    # Ключи в порядке NodeSerializer/EdgeSerializer ('__all__' и temp_id в конце)
+    NODE_FIELDS = ('id', 'name', 'latitude', 'longitude', 'description', 'z_coordinate', 'version', 'temp_id')
+    EDGE_FIELDS = ('id', 'description', 'style', 'version', 'node1', 'node2', 'temp_id')
+    EDGE_COLUMNS = ('id', 'description', 'style', 'version', 'node1_id', 'node2_id', 'temp_id')
+
+    @classmethod
+    def node_rows(cls, nodes):
+        """Возвращает узлы из QuerySet в виде словарей NodeSerializer."""
+        keys = cls.NODE_FIELDS
+        return [dict(zip(keys, row)) for row in nodes.values_list(*keys)]
+
+    @classmethod
+    def iter_node_rows(cls, nodes, chunk_size):
+        """Выдает узлы из QuerySet по одному, читая их из базы порциями по chunk_size."""
+        keys = cls.NODE_FIELDS
+        for row in nodes.values_list(*keys).iterator(chunk_size=chunk_size):
+            yield dict(zip(keys, row))
+
+    @classmethod
+    def iter_edge_rows(cls, edges, chunk_size):
+        """Выдает ребра из QuerySet по одному, читая их из базы порциями по chunk_size."""
+        keys = cls.EDGE_FIELDS
+        for row in edges.values_list(*cls.EDGE_COLUMNS).iterator(chunk_size=chunk_size):
+            edge = dict(zip(keys, row))
+            if not edge['style']:
+                edge['style'] = dict(DEFAULT_EDGE_STYLE)
+            yield edge
+
+    @classmethod
+    def edge_rows(cls, edges):
+        """Возвращает ребра из QuerySet в виде словарей EdgeSerializer."""
+        keys = cls.EDGE_FIELDS
+        edges = [dict(zip(keys, row)) for row in edges.values_list(*cls.EDGE_COLUMNS)]
+        for edge in edges:
+            if not edge['style']:
+                edge['style'] = dict(DEFAULT_EDGE_STYLE)
+        return edges
+
+    def get_nodes(self, instance):
+        return self.node_rows(instance.nodes.all())
+
+    def get_edges(self, instance):
+        return self.edge_rows(instance.edges.all())
+
+    def to_representation(self, instance):
+        header = MapHeaderSerializer(instance, context=self.context).data
+        data = {}
+        for key in ('id', 'title', 'owner', 'description', 'center_latitude', 'center_longitude'):
+            data[key] = header[key]
+        data['nodes'] = self.get_nodes(instance)
+        data['edges'] = self.get_edges(instance)
+        for key in ('hashtags', 'is_published', 'created_at', 'updated_at', 'version'):
+            data[key] = header[key]
+        data['client_index_map'] = {}
+        return data
+
+
+class MapColumnarSerializer(serializers.BaseSerializer):
+    """
+    Представление карты по столбцам для бинарных форматов (msgpack, CBOR).
+
+    Основные поля карты совпадают с MapSerializer, а узлы и ребра отдаются
+    параллельными массивами (MainApp/columnar.py), которые клиент читает
+    напрямую в типизированные массивы.
+    """
+
+    def to_representation(self, instance):
+        data = dict(MapHeaderSerializer(instance, context=self.context).data)
+        data['layout'] = 'columnar'
+        data.update(map_columns(instance))
+        return data
+
+
+class MapDeltaSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор изменений карты начиная с версии, переданной в контексте ('since').
+
+    Возвращает основные поля карты, узлы и ребра, созданные или измененные
+    после этой версии, а также ID узлов и ребер, убранных с карты.
+    """
+    since = serializers.SerializerMethodField()
+    nodes = serializers.SerializerMethodField()
+    edges = serializers.SerializerMethodField()
+    deleted_node_ids = serializers.SerializerMethodField()
+    deleted_edge_ids = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Map
+        fields = [
+            'id', 'title', 'owner', 'description', 'center_latitude',
+            'center_longitude', 'hashtags', 'is_published', 'created_at', 'updated_at',
+            'version', 'since', 'nodes', 'edges', 'deleted_node_ids', 'deleted_edge_ids'
+        ]
+
+    def get_since(self, obj):
+        return self.context['since']
+
+    def get_nodes(self, obj):
+        nodes = obj.nodes.filter(version__gt=self.context['since'])
+        return NodeSerializer(nodes, many=True).data
+
+    def get_edges(self, obj):
+        edges = obj.edges.filter(version__gt=self.context['since'])
+        return EdgeSerializer(edges, many=True).data
+
+    def _deleted_ids(self, obj, kind):
+        return list(
+            obj.tombstones
+            .filter(kind=kind, version__gt=self.context['since'])
+            .order_by('version', 'object_id')
+            .values_list('object_id', flat=True)
+        )
+
+    def get_deleted_node_ids(self, obj):
+        return self._deleted_ids(obj, MapTombstone.NODE)
+
+    def get_deleted_edge_ids(self, obj):
+        return self._deleted_ids(obj, MapTombstone.EDGE)
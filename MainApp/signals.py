@@ -0,0 +1,25 @@
+import logging
+
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+# Версия карты изменилась (Map.bump_version). Отправляется после фиксации
+# транзакции, в которой изменилась версия; аргументы: map_id, version
+map_version_changed = Signal()
+
+
+def send_map_version_changed(sender, map_id, version):
+    """
+    Отправляет map_version_changed всем получателям.
+
+    Изменение карты к этому моменту уже зафиксировано, поэтому ошибка
+    получателя не должна ни превращать ответ в 500, ни мешать остальным
+    получателям: она только пишется в лог.
+    """
+    for receiver, result in map_version_changed.send_robust(sender=sender, map_id=map_id, version=version):
+        if isinstance(result, Exception):
+            logger.error(
+                f"Карта ID: {map_id}: ошибка обработки изменения версии {version} в {receiver.__module__}.{receiver.__name__}",
+                exc_info=result,
+            )
@@ -0,0 +1,146 @@
+import gzip
+import hashlib
+import logging
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, тогда .br не пишется
+    brotli = None
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .files import publish_manifest, read_manifest as read_map_manifest, remove_map_root, write_file
+from .models import Map, MapRebuild
+from .rebuilds import cancel_rebuild, request_rebuild
+from .renderers import FastJSONRenderer
+from .serializers import MapReadSerializer
+from .signals import map_version_changed
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'snapshot.json'
+
+
+def get_snapshots_root():
+    """Возвращает каталог, из которого nginx отдает снимки опубликованных карт."""
+    return settings.MAP_SNAPSHOTS_ROOT
+
+
+def get_snapshots_url():
+    """Возвращает URL-префикс каталога снимков."""
+    return getattr(settings, 'MAP_SNAPSHOTS_URL', '/media/snapshots/')
+
+
+def render_snapshot(map_instance):
+    """Возвращает JSON карты целиком, тот же, что отдает GET /api/v1/maps/{map_id}/."""
+    return FastJSONRenderer().render(MapReadSerializer(map_instance).data)
+
+
+def snapshot_hash(content):
+    """Возвращает хеш содержимого снимка: он же имя файла."""
+    return hashlib.blake2b(content, digest_size=10).hexdigest()
+
+
+def read_manifest(map_id):
+    """Возвращает манифест снимка карты или None, если снимка нет."""
+    return read_map_manifest(os.path.join(get_snapshots_root(), str(map_id)), MANIFEST_NAME)
+
+
+def snapshot_url(map_instance):
+    """
+    Возвращает URL снимка текущей версии карты или None.
+
+    None возвращается, если снимка нет или он построен для другой версии
+    (например, еще не записан после сохранения): тогда клиент читает
+    карту через API.
+    """
+    manifest = read_manifest(map_instance.id)
+    if manifest is None or manifest['version'] != map_instance.version:
+        return None
+    return manifest['url']
+
+
+def publish_snapshot(map_instance):
+    """
+    Записывает снимок опубликованной карты на диск.
+
+    Снимок лежит в <MAP_SNAPSHOTS_ROOT>/<map_id>/<hash>.json, где hash -
+    хеш содержимого, поэтому nginx отдает его с вечным кешем. Рядом
+    пишутся сжатые варианты .json.gz (gzip_static) и, если установлен
+    brotli, .json.br. Файлы и манифест snapshot.json с URL текущего
+    снимка заменяются атомарно. Кроме текущего остается предыдущий
+    снимок, чтобы его догрузили клиенты, открывшие страницу до изменения.
+
+    Args:
+        map_instance (Map): Опубликованная карта
+
+    Returns:
+        dict: Манифест снимка
+    """
+    content = render_snapshot(map_instance)
+    content_hash = snapshot_hash(content)
+    map_root = os.path.join(get_snapshots_root(), str(map_instance.id))
+    name = f'{content_hash}.json'
+    path = os.path.join(map_root, name)
+    os.makedirs(map_root, exist_ok=True)
+
+    if not os.path.exists(path):
+        # Сжатые варианты пишутся раньше основного файла: его наличие означает, что снимок готов
+        write_file(f'{path}.gz', gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            write_file(f'{path}.br', brotli.compress(content, quality=11))
+        write_file(path, content)
+        logger.info(f"Карта ID: {map_instance.id}: записан снимок {name}, {len(content)} байт")
+
+    manifest = {
+        'version': map_instance.version,
+        'hash': content_hash,
+        'url': f'{get_snapshots_url()}{map_instance.id}/{name}',
+    }
+    publish_manifest(map_root, MANIFEST_NAME, manifest)
+    return manifest
+
+
+def remove_snapshots(map_id):
+    """Удаляет снимки карты, снятой с публикации или удаленной."""
+    if remove_map_root(os.path.join(get_snapshots_root(), str(map_id))):
+        logger.info(f"Карта ID: {map_id}: снимки удалены")
+
+
+def rebuild_map_snapshot(map_id):
+    """
+    Приводит снимок карты в соответствие с ее текущим состоянием: записывает
+    его для опубликованной карты и удаляет для неопубликованной или удаленной.
+    """
+    map_instance = Map.objects.filter(pk=map_id).first()
+    if map_instance is None or not map_instance.is_published:
+        remove_snapshots(map_id)
+        return
+    publish_snapshot(map_instance)
+
+
+@receiver(map_version_changed)
+def update_map_snapshot(sender, map_id, version, **kwargs):
+    """
+    Отмечает снимок опубликованной карты устаревшим после ее изменения.
+
+    Снимок пишет команда generate_map_snapshots (rebuild_map_snapshot), когда
+    карта перестает меняться; до этого страница просмотра читает карту через
+    API (snapshot_url). Снимки неопубликованной карты удаляются сразу.
+    """
+    if Map.objects.filter(pk=map_id, is_published=True).exists():
+        request_rebuild(map_id, MapRebuild.SNAPSHOT)
+        return
+    cancel_rebuild(map_id, MapRebuild.SNAPSHOT)
+    remove_snapshots(map_id)
+
+
+@receiver(post_delete, sender=Map)
+def remove_deleted_map_snapshots(sender, instance, **kwargs):
+    """Удаляет снимки удаленной карты после фиксации транзакции."""
+    map_id = instance.pk
+    transaction.on_commit(lambda: remove_snapshots(map_id))
@@ -0,0 +1,111 @@
+import math
+
+from django.db.models import BigIntegerField, Q, Value
+from django.db.models.functions import Cast, Floor, Greatest, Least
+
+# Сетка ячеек по 1 / CELLS_PER_DEGREE градуса. Ключ ячейки строится по строкам
+# (широта) и столбцам (долгота): row * GRID_COLUMNS + column, поэтому ячейки
+# одной строки сетки образуют непрерывный диапазон ключей в индексе
+CELLS_PER_DEGREE = 10
+GRID_ROWS = 180 * CELLS_PER_DEGREE
+GRID_COLUMNS = 360 * CELLS_PER_DEGREE
+
+# Наибольшее число диапазонов ключей в условии; соседние строки сетки
+# большого окна объединяются в полосы, чтобы диапазонов было не больше
+MAX_GRID_RANGES = 64
+
+# Предел широты проекции Меркатора (веб-карты, тайлы)
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+
+def _row(latitude):
+    return min(max(math.floor((latitude + 90) * CELLS_PER_DEGREE), 0), GRID_ROWS - 1)
+
+
+def _column(longitude):
+    return min(max(math.floor((longitude + 180) * CELLS_PER_DEGREE), 0), GRID_COLUMNS - 1)
+
+
+def grid_cell(latitude, longitude):
+    """Возвращает ключ ячейки сетки для точки."""
+    return _row(latitude) * GRID_COLUMNS + _column(longitude)
+
+
+def grid_cell_expression(latitude, longitude):
+    """
+    Возвращает SQL-выражение ключа ячейки для выражений широты и долготы.
+
+    Повторяет grid_cell(), чтобы ключ можно было пересчитать в том же UPDATE,
+    который меняет координаты (MainApp/transforms.py).
+    """
+    row = Least(Greatest(Floor((latitude + Value(90.0)) * Value(float(CELLS_PER_DEGREE))), Value(0.0)),
+                Value(float(GRID_ROWS - 1)))
+    column = Least(Greatest(Floor((longitude + Value(180.0)) * Value(float(CELLS_PER_DEGREE))), Value(0.0)),
+                   Value(float(GRID_COLUMNS - 1)))
+    return Cast(row * Value(float(GRID_COLUMNS)) + column, output_field=BigIntegerField())
+
+
+def mercator(latitude, longitude):
+    """
+    Возвращает координаты точки в проекции Меркатора, нормированные к [0, 1]:
+    x растет на восток от долготы -180, y - на юг от северного края карты.
+    """
+    latitude = math.radians(min(max(latitude, -MAX_MERCATOR_LATITUDE), MAX_MERCATOR_LATITUDE))
+    x = (longitude + 180.0) / 360.0
+    y = (1.0 - math.log(math.tan(latitude) + 1.0 / math.cos(latitude)) / math.pi) / 2.0
+    return min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+
+
+def parse_bbox(value):
+    """
+    Разбирает параметр bbox вида minLon,minLat,maxLon,maxLat.
+
+    Returns:
+        tuple: (min_lon, min_lat, max_lon, max_lat)
+
+    Raises:
+        ValueError: Некорректный формат или порядок координат
+    """
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or not all(math.isfinite(part) for part in parts):
+        raise ValueError(value)
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError(value)
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def bbox_query(bbox, prefix=''):
+    """
+    Возвращает условие попадания узла в окно.
+
+    Точная проверка широты и долготы дополняется диапазонами ключей ячеек
+    по строкам сетки, чтобы выборка шла по индексу grid_cell. Диапазоны
+    расширены на ячейку, поэтому расхождение округления на границе ячейки
+    не теряет узлы. Если строк больше MAX_GRID_RANGES, соседние строки
+    объединяются в полосы: диапазон полосы захватывает и ячейки вне окна
+    между строками, их отсекает проверка широты и долготы, но выборка
+    по-прежнему идет по индексу. Окно на всю ширину карты дает один диапазон.
+
+    Args:
+        bbox (tuple): (min_lon, min_lat, max_lon, max_lat)
+        prefix (str): Префикс пути к узлу в запросе (например, 'node1__')
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    query = Q(**{
+        f'{prefix}latitude__range': (min_lat, max_lat),
+        f'{prefix}longitude__range': (min_lon, max_lon),
+    })
+    first_row = max(_row(min_lat) - 1, 0)
+    last_row = min(_row(max_lat) + 1, GRID_ROWS - 1)
+    first_column = max(_column(min_lon) - 1, 0)
+    last_column = min(_column(max_lon) + 1, GRID_COLUMNS - 1)
+    if first_column == 0 and last_column == GRID_COLUMNS - 1:
+        band = last_row - first_row + 1
+    else:
+        band = math.ceil((last_row - first_row + 1) / MAX_GRID_RANGES)
+    cells = Q()
+    for row in range(first_row, last_row + 1, band):
+        end_row = min(row + band - 1, last_row)
+        cells |= Q(**{f'{prefix}grid_cell__range': (row * GRID_COLUMNS + first_column, end_row * GRID_COLUMNS + last_column)})
+    return query & cells
@@ -19,13 +19,16 @@ class DatabaseController {
         
         this.initialNodeIds = new Set();
         this.initialEdgeIds = new Set();
+        // Версия карты, от которой строятся изменения (заголовок If-Match)
+        this.version = null;
+        // Сохранение без окончательного ответа сервера: его Idempotency-Key
+        // повторяется, пока не придет ответ, отличный от 5xx
+        this.pendingWrite = null;
         
         this.resetChanges();
         
         this.autoSaveInterval = null;
         this.enableAutoSave = false;
-
-        this.pendingEdges = [];
     }
     GetCurrentData() {
         console.log('Поиск карты...')
@@ -44,6 +47,7 @@ class DatabaseController {
     }
 
     ArrayFilling(data) {
+        this.version = data.version ?? null;
         console.log(data.nodes);
         console.log(data.edges);
         
@@ -184,16 +188,15 @@ class DatabaseController {
         const csrfToken = this.getCsrfToken();
         console.log(`Отправка запроса на /api/v1/maps/${getMapId()}/ с CSRF токеном: ${csrfToken.substring(0, 5)}...`);
 
-        fetch(`/api/v1/maps/${getMapId()}/`, {
-            method: 'PUT',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-CSRFToken': csrfToken
-            },
-            body: JSON.stringify(dataToSend)
-        })
+        this.sendWrite('PUT', JSON.stringify(dataToSend), csrfToken)
         .then(response => {
             console.log(`Получен ответ HTTP ${response.status} ${response.statusText}`);
+            if (response.status === 412) {
+                return response.json().then(conflict => {
+                    console.error('Карта была изменена в другом окне, текущая версия:', conflict.version);
+                    throw new Error('Карта была изменена после загрузки. Обновите страницу, чтобы получить актуальную версию');
+                });
+            }
             if (!response.ok) {
                 console.error('Ошибка HTTP:', response.status);
                 return response.text().then(text => {
@@ -207,6 +210,7 @@ class DatabaseController {
             console.log('Ответ сервера:', updatedData);
             console.log(`Обновлено узлов: ${updatedData.nodes ? updatedData.nodes.length : 0}, ребер: ${updatedData.edges ? updatedData.edges.length : 0}`);
             
+            this.version = updatedData.version ?? this.version;
             this.updateLocalIdsAfterSave(updatedData);
             
             console.log('Обновление списка начальных ID узлов и ребер');
@@ -259,7 +263,6 @@ class DatabaseController {
         }
         
         const mapData = {};
-        this.pendingEdges = [...this.changes.newEdges];
         
         if (this.changes.newNodes.length > 0) {
             console.log(`Подготовка ${this.changes.newNodes.length} новых узлов`);
@@ -292,9 +295,10 @@ class DatabaseController {
         
         if (this.changes.newEdges.length > 0) {
             console.log(`Подготовка ${this.changes.newEdges.length} новых ребер`);
+            // Ребра к еще не сохраненным узлам отправляются в том же запросе:
+            // такие узлы указываются через node1_temp_id/node2_temp_id
             mapData.new_edges = this.changes.newEdges.map(edge => ({
-                node1: typeof edge.node1 === 'object' ? edge.node1.id : edge.node1,
-                node2: typeof edge.node2 === 'object' ? edge.node2.id : edge.node2,
+                ...this.edgeEndpointRefs(edge),
                 style: edge.style || {
                     color: "#1DA1F2",
                     width: 3,
@@ -314,8 +318,7 @@ class DatabaseController {
                 // Создаем промежуточный объект для отладки
                 const edgeData = {
                     id: edge.id,
-                    node1: typeof edge.node1 === 'object' ? edge.node1.id : edge.node1,
-                    node2: typeof edge.node2 === 'object' ? edge.node2.id : edge.node2,
+                    ...this.edgeEndpointRefs(edge),
                     style: edge.style || {
                         color: "#1DA1F2",
                         width: 3,
@@ -343,11 +346,11 @@ class DatabaseController {
                 const edgeObj = getEdges()[edge.id];
                 if (edgeObj) {
                     // Если поля отсутствуют, извлекаем их из объекта Edge
-                    if (!edge.node1 && edgeObj.node1) {
+                    if (!edge.node1 && !edge.node1_temp_id && edgeObj.node1) {
                         edge.node1 = edgeObj.node1.id;
                         console.log(`Восстановлено поле node1 для ребра ${edge.id}: ${edge.node1}`);
                     }
-                    if (!edge.node2 && edgeObj.node2) {
+                    if (!edge.node2 && !edge.node2_temp_id && edgeObj.node2) {
                         edge.node2 = edgeObj.node2.id;
                         console.log(`Восстановлено поле node2 для ребра ${edge.id}: ${edge.node2}`);
                     }
@@ -376,16 +379,15 @@ class DatabaseController {
         const csrfToken = this.getCsrfToken();
         console.log(`Отправка запроса на /api/v1/maps/${getMapId()}/ с CSRF токеном: ${csrfToken.substring(0, 5)}...`);
         
-        fetch(`/api/v1/maps/${getMapId()}/`, {
-            method: 'PATCH',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-CSRFToken': csrfToken
-            },
-            body: JSON.stringify(mapData)
-        })
+        this.sendWrite('PATCH', JSON.stringify(mapData), csrfToken)
         .then(response => {
             console.log(`Получен ответ HTTP ${response.status} ${response.statusText}`);
+            if (response.status === 412) {
+                return response.json().then(conflict => {
+                    console.error('Карта была изменена в другом окне, текущая версия:', conflict.version);
+                    throw new Error('Карта была изменена после загрузки. Обновите страницу, чтобы получить актуальную версию');
+                });
+            }
             if (!response.ok) {
                 console.error('Ошибка HTTP:', response.status);
                 return response.text().then(text => {
@@ -399,170 +401,96 @@ class DatabaseController {
             console.log('Ответ сервера:', updatedData);
             console.log(`Обновлено узлов: ${updatedData.nodes ? updatedData.nodes.length : 0}, ребер: ${updatedData.edges ? updatedData.edges.length : 0}`);
 
-            const clientIndexMap = updatedData.client_index_map;
-            const pendingEdgesToSend = [...this.pendingEdges];
-
-            // Clear pending edges now that we have the map
-            this.pendingEdges = [];
-
-            // Update local node IDs first (important for consistency if edge creation fails)
+            // Узлы и ребра к ним создаются в одном запросе, остается обновить локальные ID
+            this.version = updatedData.version ?? this.version;
             this.updateLocalIdsAfterSave(updatedData);
-
-            if (clientIndexMap && pendingEdgesToSend.length > 0) {
-                console.log('Найдена карта соответствия ID, обрабатываем ожидающие ребра');
-                // Process edges using the map BEFORE updating local IDs
-                this.processAndSendPendingEdges(clientIndexMap, pendingEdgesToSend); 
-            } else {
-                // No pending edges or no map, just finalize
-                this.finalizeUpdate();
-            }
+            this.finalizeUpdate();
         })
         .catch(error => {
-            console.error('Ошибка при обновлении узлов (PATCH):', error);
-            // Reset pending edges if node update failed
-            this.pendingEdges = [];
+            console.error('Ошибка при обновлении карты (PATCH):', error);
             console.timeEnd('PATCH запрос');
             console.groupEnd();
             console.error('Ошибка при сохранении узлов: ' + error.message);
         });
     }
 
-    // New function to handle processing and sending pending edges
-    processAndSendPendingEdges(clientIndexMap, pendingEdges) {
-        console.group('Обработка и отправка ожидающих ребер');
-        console.log('Карта соответствия ID клиента и сервера:', clientIndexMap);
-        const nodes = getNodes(); // Needed for checks? Maybe not if map is reliable.
-
-        if (!pendingEdges || pendingEdges.length === 0) {
-            console.log('Нет ожидающих ребер для создания');
-            console.groupEnd();
-            this.finalizeUpdate(); // Finalize here if called with no edges
-            return;
-        }
-
-        console.log(`Подготовка ${pendingEdges.length} новых ребер с обновленными ID узлов`);
-        console.log('Исходные ребра перед обработкой:', JSON.stringify(pendingEdges));
-
-        const edgesWithServerIds = pendingEdges.map(edge => {
-            // Get original temporary client IDs
-            const clientNode1Id = typeof edge.node1 === 'object' ? edge.node1.id : edge.node1;
-            const clientNode2Id = typeof edge.node2 === 'object' ? edge.node2.id : edge.node2;
-
-            console.log(`Обработка ребра: clientNode1=${clientNode1Id}, clientNode2=${clientNode2Id}`);
-
-            let node1ServerId = null;
-            let node2ServerId = null;
-
-            // --- Simplified ID lookup using clientIndexMap ---
-            if (clientIndexMap[clientNode1Id] !== undefined) {
-                node1ServerId = clientIndexMap[clientNode1Id];
-                console.log(`Узел node1=${clientNode1Id} -> ${node1ServerId} (из карты)`);
-            } else if (this.initialNodeIds.has(parseInt(clientNode1Id))) {
-                 // Node already existed, use its original ID
-                node1ServerId = parseInt(clientNode1Id);
-                 console.log(`Узел node1=${clientNode1Id} уже существует на сервере`);
-            } else {
-                 console.warn(`Не найден серверный ID для узла node1=${clientNode1Id} в карте соответствия`);
-                 return null; // Cannot create edge if node ID mapping is missing
+    // Ссылки на узлы ребра: сохраненные узлы передаются по ID из базы,
+    // новые - по временному ID в отдельном поле, чтобы ID не пересекались
+    edgeEndpointRefs(edge) {
+        const liveEdge = getEdges()[edge.id];
+        const refs = {};
+        ['node1', 'node2'].forEach(key => {
+            let nodeId = liveEdge && liveEdge[key] ? liveEdge[key].id : edge[key];
+            if (typeof nodeId === 'object' && nodeId !== null) {
+                nodeId = nodeId.id;
             }
-
-            if (clientIndexMap[clientNode2Id] !== undefined) {
-                node2ServerId = clientIndexMap[clientNode2Id];
-                console.log(`Узел node2=${clientNode2Id} -> ${node2ServerId} (из карты)`);
-            } else if (this.initialNodeIds.has(parseInt(clientNode2Id))) {
-                 // Node already existed, use its original ID
-                node2ServerId = parseInt(clientNode2Id);
-                 console.log(`Узел node2=${clientNode2Id} уже существует на сервере`);
+            if (this.initialNodeIds.has(nodeId)) {
+                refs[key] = nodeId;
             } else {
-                 console.warn(`Не найден серверный ID для узла node2=${clientNode2Id} в карте соответствия`);
-                 return null; // Cannot create edge if node ID mapping is missing
-            }
-            // --- End Simplified ID lookup ---
-
-
-            if (node1ServerId === null || node2ServerId === null) {
-                 console.error(`Не удалось определить серверные ID для ребра: ${clientNode1Id} -> ${node1ServerId}, ${clientNode2Id} -> ${node2ServerId}`);
-                 return null;
+                refs[`${key}_temp_id`] = nodeId;
             }
-            
-            node1ServerId = parseInt(node1ServerId, 10);
-            node2ServerId = parseInt(node2ServerId, 10);
-
-            if (node1ServerId === node2ServerId) {
-                console.error(`Ошибка: нельзя создать ребро от узла к самому себе (ID: ${node1ServerId})`);
-                return null;
-            }
-
-            const result = {
-                node1: node1ServerId,
-                node2: node2ServerId,
-                temp_id: edge.id
-            };
-
-            // Добавляем поле style, если оно есть
-            if (edge.style) {
-                result.style = edge.style;
-            }
-
-            console.log(`Итоговое ребро для отправки:`, result);
-            return result;
-
-        }).filter(edge => edge !== null);
+        });
+        return refs;
+    }
 
-        if (edgesWithServerIds.length === 0) {
-            console.warn('После валидации не осталось корректных ребер для создания');
-            console.groupEnd();
-            this.finalizeUpdate(); // Finalize here as well
-            return;
+    // Заголовки запросов записи: If-Match с версией карты защищает
+    // от перезаписи изменений, сделанных в другой вкладке, а Idempotency-Key
+    // позволяет безопасно повторить сохранение после обрыва соединения
+    writeHeaders(csrfToken, idempotencyKey) {
+        const headers = {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrfToken
+        };
+        if (this.version !== null) {
+            headers['If-Match'] = `"v${this.version}"`;
         }
+        if (idempotencyKey) {
+            headers['Idempotency-Key'] = idempotencyKey;
+        }
+        return headers;
+    }
 
-        console.log('Ребра с обновленными ID узлов (итог):', JSON.stringify(edgesWithServerIds));
+    // Ключ идемпотентности одного сохранения. Новый ключ создается, только
+    // если предыдущее сохранение получило окончательный ответ или изменения
+    // с тех пор поменялись; иначе это повтор того же сохранения
+    idempotencyKey(method, body) {
+        const pending = this.pendingWrite;
+        if (pending && pending.method === method && pending.body === body) {
+            return pending.key;
+        }
+        const key = window.crypto && typeof window.crypto.randomUUID === 'function'
+            ? window.crypto.randomUUID()
+            : null;
+        this.pendingWrite = { method, body, key };
+        return key;
+    }
 
-        const edgeData = {
-            new_edges: edgesWithServerIds
-            // Important: Only send new_edges, not other changes again
+    // Отправляет запрос записи карты. После обрыва соединения или ответа 5xx
+    // запрос повторяется с тем же Idempotency-Key: если первая попытка дошла
+    // до сервера, повтор получит ее сохраненный результат, а не применит
+    // изменения второй раз. Ключ забывается после окончательного ответа
+    sendWrite(method, body, csrfToken, attempts = 3) {
+        const headers = this.writeHeaders(csrfToken, this.idempotencyKey(method, body));
+        const retry = (left, reason) => {
+            console.warn(`Сохранение не завершено (${reason}), повтор через 1 с, осталось попыток: ${left - 1}`);
+            return new Promise(resolve => setTimeout(resolve, 1000)).then(() => attempt(left - 1));
         };
-
-        const csrfToken = this.getCsrfToken();
-        console.log('Отправка отдельного PATCH-запроса для создания ребер:', JSON.stringify(edgeData));
-
-        fetch(`/api/v1/maps/${getMapId()}/`, {
-            method: 'PATCH',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-CSRFToken': csrfToken
-            },
-            body: JSON.stringify(edgeData)
-        })
-        .then(response => {
-            console.log(`Получен ответ HTTP ${response.status} ${response.statusText} (создание ребер)`);
-            if (!response.ok) {
-                console.error('Ошибка HTTP при создании ребер:', response.status);
-                return response.text().then(text => {
-                    console.error('Ответ сервера (ошибка ребер):', text);
-                    throw new Error(`Ошибка создания ребер: ${text}`);
-                });
-            }
-            return response.json();
-        })
-        .then(edgeUpdateResponse => {
-             console.log('Ответ сервера после создания ребер:', edgeUpdateResponse);
-             // Update local edge IDs if necessary (server might return edge IDs)
-             this.updateLocalIdsAfterSave(edgeUpdateResponse); // Reuse function if it handles edges too
-
-             console.log(`Создано ребер на сервере: ${edgeUpdateResponse.edges ? edgeUpdateResponse.edges.length : 0}`);
-             this.finalizeUpdate(); // Finalize after successful edge creation
-             console.groupEnd();
-             console.log('Карта успешно сохранена!');
-        })
-        .catch(error => {
-            console.error('Ошибка при создании ребер (PATCH):', error);
-            // Maybe try finalizeUpdate anyway to reset state? Or leave changes pending?
-            // For now, just log and finalize to avoid inconsistent state.
-            this.finalizeUpdate(); 
-            console.groupEnd();
-            console.error('Ошибка при сохранении ребер: ' + error.message);
-        });
+        const attempt = left => fetch(`/api/v1/maps/${getMapId()}/`, { method, headers, body })
+            .then(response => {
+                if (response.status >= 500 && left > 1) {
+                    return retry(left, `HTTP ${response.status}`);
+                }
+                if (response.status < 500) {
+                    this.pendingWrite = null;
+                }
+                return response;
+            }, error => {
+                if (left > 1) {
+                    return retry(left, error.message);
+                }
+                throw error;
+            });
+        return attempt(attempts);
     }
 
     finalizeUpdate() {
@@ -589,6 +517,22 @@ class DatabaseController {
         const nodes = getNodes();
         const edges = getEdges();
 
+        // Сервер возвращает соответствие клиентских ID новых узлов и ID в базе
+        // (сначала забираем все узлы, чтобы новые ID не затерли еще не переназначенные)
+        if (serverData.client_index_map) {
+            const remapped = [];
+            Object.entries(serverData.client_index_map).forEach(([clientId, serverId]) => {
+                if (nodes[clientId] && String(clientId) !== String(serverId)) {
+                    remapped.push([nodes[clientId], serverId]);
+                    delete nodes[clientId];
+                }
+            });
+            remapped.forEach(([node, serverId]) => {
+                nodes[serverId] = node;
+                node.id = serverId;
+            });
+        }
+
         if (serverData.nodes) {
             serverData.nodes.forEach(node => {
                 if (nodes[node.temp_id]) {
@@ -5,6 +5,8 @@ import { Node } from './node.js';
 let nodes = {};
 let edges = {};
 const mapId = document.getElementById('mapId').innerText;
+// Опубликованная карта читается из статического снимка или через публичное API
+const mapUrl = document.getElementById('mapId').dataset.url;
 let Controller;
 
 class DatabaseController {
@@ -15,7 +17,7 @@ class DatabaseController {
 
     GetCurrentData() {
         console.log('Поиск карты...')
-        fetch(`/api/v1/maps/${mapId}`)
+        fetch(mapUrl)
         .then(response => {
             if (!response.ok) throw new Error('Ошибка загрузки');
             return response.json();
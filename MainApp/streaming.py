@@ -0,0 +1,86 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Map
+from .serializers import MapHeaderSerializer, MapReadSerializer
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# Число записей в одном блоке ответа
+BLOCK_RECORDS = 500
+
+
+def get_chunk_size():
+    """Возвращает число узлов или ребер, читаемых из базы за один раз."""
+    return getattr(settings, 'MAP_STREAM_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def map_records(map_instance, context=None, chunk_size=None):
+    """
+    Выдает записи карты для потоковой выгрузки.
+
+    Первая запись - основные поля карты ({"type": "map", ...}), затем узлы
+    ({"type": "node", ...}) и ребра ({"type": "edge", ...}) в том же виде,
+    что и в карте целиком, и последняя запись {"type": "end"} с числом
+    узлов и ребер: по ней клиент отличает полную выгрузку от оборванной.
+    Узлы и ребра читаются из базы порциями (QuerySet.iterator), поэтому
+    в памяти не бывает больше chunk_size строк.
+
+    Все записи читаются в одной транзакции (на PostgreSQL - REPEATABLE READ
+    READ ONLY), а основные поля карты перечитываются в ней же: узлы и ребра
+    относятся к одной версии карты, даже если карту сохранили во время
+    выгрузки. Если версия успела смениться после построения ETag, в
+    записях map и end будет новая версия. Карта, удаленная до начала
+    выгрузки, отдается без записи end.
+
+    Args:
+        map_instance (Map): Карта
+        context (dict): Контекст сериализатора основных полей
+        chunk_size (int): Размер порции или get_chunk_size()
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            # Снимок всех чтений берется при первом запросе транзакции
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        map_instance = Map.objects.filter(pk=map_instance.pk).first()
+        if map_instance is None:
+            return
+        yield {'type': 'map', **MapHeaderSerializer(map_instance, context=context or {}).data}
+        nodes = edges = 0
+        for node in MapReadSerializer.iter_node_rows(map_instance.nodes.order_by('id'), chunk_size):
+            nodes += 1
+            yield {'type': 'node', **node}
+        for edge in MapReadSerializer.iter_edge_rows(map_instance.edges.order_by('id'), chunk_size):
+            edges += 1
+            yield {'type': 'edge', **edge}
+        yield {'type': 'end', 'version': map_instance.version, 'nodes': nodes, 'edges': edges}
+
+
+def stream_map(map_instance, renderer, context=None, chunk_size=None):
+    """
+    Кодирует записи map_records в NDJSON и выдает блоками для StreamingHttpResponse.
+
+    Запись с основными полями отдается сразу, остальные - блоками по
+    BLOCK_RECORDS записей, чтобы клиент начал рисовать карту до конца загрузки.
+
+    Args:
+        map_instance (Map): Карта
+        renderer (NDJSONRenderer): Кодирует записи в строки
+        context (dict): Контекст сериализатора основных полей
+        chunk_size (int): Размер порции чтения из базы
+    """
+    records = map_records(map_instance, context, chunk_size)
+    header = next(records, None)
+    if header is None:
+        return
+    yield renderer.render(header)
+    while True:
+        block = list(islice(records, BLOCK_RECORDS))
+        if not block:
+            return
+        yield renderer.render_lines(block)
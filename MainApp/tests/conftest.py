@@ -0,0 +1,25 @@
+import pytest
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """
+    Кеши Django (представления карт, кластеры) не переходят между тестами.
+    Кеш в базе (ограничение записи) откатывается вместе с транзакцией теста.
+    """
+    local = [cache for cache in caches.all() if not isinstance(cache, DatabaseCache)]
+    for cache in local:
+        cache.clear()
+    yield
+    for cache in local:
+        cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def published_files_root(settings, tmp_path):
+    """Тайлы и снимки опубликованных карт пишутся во временный каталог теста."""
+    settings.MAP_TILES_ROOT = str(tmp_path / 'tiles')
+    settings.MAP_SNAPSHOTS_ROOT = str(tmp_path / 'snapshots')
+    return tmp_path
@@ -3,7 +3,10 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from MainApp.tests.factories import UserFactory
-from MainApp.models import Map # Added import for Map model
+from MainApp.models import Map, Node, Edge, MapVersionConflict, MapIdempotencyKey # Added import for Map model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
 
 @pytest.mark.django_db
 class TestAPI:
@@ -82,4 +85,514 @@ class TestAPI:
         assert response.data['title'] == update_data['title']
         # If description was part of update_data, assert it as well
         # assert response.data['description'] == update_data['description'] 
-        assert response.data['is_published'] == update_data['is_published'] 
\ No newline at end of file
+        assert response.data['is_published'] == update_data['is_published'] 
+
+@pytest.mark.django_db
+class TestMapPatchBulk:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        return Map.objects.create(title='Bulk Map', owner=user)
+
+    def _patch(self, client, test_map, payload):
+        return client.patch(reverse('map-detail', kwargs={'pk': test_map.pk}), payload, format='json')
+
+    def _add_nodes(self, test_map, count):
+        nodes = Node.objects.bulk_create([
+            Node(name=f'N{i}', latitude=10 + i * 0.001, longitude=20) for i in range(count)
+        ])
+        test_map.nodes.add(*nodes)
+        return nodes
+
+    def test_create_nodes_and_edges(self, client, test_map):
+        node = self._add_nodes(test_map, 1)[0]
+        response = self._patch(client, test_map, {
+            'new_nodes': [
+                {'name': 'A', 'latitude': 1, 'longitude': 2, 'temp_id': 101},
+                {'name': 'B', 'latitude': 3, 'longitude': 4, 'temp_id': 102},
+            ],
+            'new_edges': [
+                {'node1_temp_id': 101, 'node2': node.id},
+                {'node1_temp_id': 101, 'node2_temp_id': 102},
+            ],
+        })
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.data['client_index_map']) == {'101', '102'}
+        assert test_map.nodes.count() == 3
+        index_map = response.data['client_index_map']
+        assert set(test_map.edges.values_list('node1_id', 'node2_id')) == {
+            (index_map['101'], node.id), (index_map['101'], index_map['102'])
+        }
+
+    def test_temp_ids_do_not_collide_with_real_ids(self, client, test_map):
+        node_a, node_b = self._add_nodes(test_map, 2)
+        # temp_id нового узла совпадает с ID существующего узла node_a
+        response = self._patch(client, test_map, {
+            'new_nodes': [{'name': 'New', 'latitude': 1, 'longitude': 2, 'temp_id': node_a.id}],
+            'new_edges': [
+                {'node1': node_a.id, 'node2': node_b.id},
+                {'node1_temp_id': node_a.id, 'node2': node_b.id},
+            ],
+        })
+        assert response.status_code == status.HTTP_200_OK
+        new_id = response.data['client_index_map'][str(node_a.id)]
+        assert set(test_map.edges.values_list('node1_id', 'node2_id')) == {
+            (node_a.id, node_b.id), (new_id, node_b.id)
+        }
+
+    def test_changed_edge_can_point_to_new_node(self, client, test_map):
+        node_a, node_b = self._add_nodes(test_map, 2)
+        edge = Edge.objects.create(node1=node_a, node2=node_b)
+        test_map.edges.add(edge)
+        response = self._patch(client, test_map, {
+            'new_nodes': [{'name': 'New', 'latitude': 1, 'longitude': 2, 'temp_id': 7}],
+            'changed_edges': [{'id': edge.id, 'node1': node_a.id, 'node2_temp_id': 7}],
+        })
+        assert response.status_code == status.HTTP_200_OK
+        edge.refresh_from_db()
+        assert edge.node2_id == response.data['client_index_map']['7']
+
+    def test_delete_node_removes_its_edges(self, client, test_map):
+        node_a, node_b, node_c = self._add_nodes(test_map, 3)
+        edge_ab = Edge.objects.create(node1=node_a, node2=node_b)
+        edge_bc = Edge.objects.create(node1=node_b, node2=node_c)
+        test_map.edges.add(edge_ab, edge_bc)
+
+        response = self._patch(client, test_map, {'deleted_node_ids': [node_a.id]})
+        assert response.status_code == status.HTTP_200_OK
+        assert set(test_map.nodes.values_list('id', flat=True)) == {node_b.id, node_c.id}
+        assert list(test_map.edges.values_list('id', flat=True)) == [edge_bc.id]
+
+    def test_update_nodes_and_edges(self, client, test_map):
+        node_a, node_b, node_c = self._add_nodes(test_map, 3)
+        edge = Edge.objects.create(node1=node_a, node2=node_b)
+        test_map.edges.add(edge)
+
+        response = self._patch(client, test_map, {
+            'changed_nodes': [{'id': node_a.id, 'name': 'Renamed', 'latitude': 45}],
+            'changed_edges': [{'id': edge.id, 'node1': node_a.id, 'node2': node_c.id, 'style': {'color': '#000000'}}],
+        })
+        assert response.status_code == status.HTTP_200_OK
+        node_a.refresh_from_db()
+        edge.refresh_from_db()
+        assert (node_a.name, node_a.latitude, node_a.longitude) == ('Renamed', 45, 20)
+        assert edge.node2_id == node_c.id
+        assert edge.style == {'color': '#000000'}
+
+    def test_invalid_node_rolls_back_whole_patch(self, client, test_map):
+        node = self._add_nodes(test_map, 1)[0]
+        response = self._patch(client, test_map, {
+            'deleted_node_ids': [node.id],
+            'new_nodes': [{'name': 'Bad', 'latitude': 91, 'longitude': 0}],
+        })
+        assert response.status_code != status.HTTP_200_OK
+        assert list(test_map.nodes.all()) == [node]
+
+    def test_query_count_does_not_depend_on_change_size(self, client, user):
+        def run_patch(size):
+            test_map = Map.objects.create(title=f'Map {size}', owner=user)
+            nodes = self._add_nodes(test_map, size * 2)
+            payload = {
+                'deleted_node_ids': [node.id for node in nodes[:size]],
+                'changed_nodes': [{'id': node.id, 'latitude': 1} for node in nodes[size:]],
+                'new_nodes': [
+                    {'name': f'T{i}', 'latitude': 0, 'longitude': 0, 'temp_id': 1000 + i} for i in range(size)
+                ],
+                'new_edges': [{'node1_temp_id': 1000 + i, 'node2': nodes[size + i].id} for i in range(size)],
+            }
+            with CaptureQueriesContext(connection) as queries:
+                response = self._patch(client, test_map, payload)
+            assert response.status_code == status.HTTP_200_OK
+            assert test_map.edges.count() == size
+            # Запросы на сериализацию ответа не зависят от размера изменений;
+            # запросы корзины ограничения к кешу (чистка просроченных
+            # записей) в счет не идут
+            return len([q for q in queries if 'wiremap_cache' not in q['sql']])
+
+        assert run_patch(3) == run_patch(30)
+
+
+@pytest.mark.django_db
+class TestMapFullSync:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Sync Map', owner=user)
+        nodes = Node.objects.bulk_create([
+            Node(name=f'N{i}', latitude=10 + i, longitude=20) for i in range(3)
+        ])
+        test_map.nodes.add(*nodes)
+        edge = Edge.objects.create(node1=nodes[0], node2=nodes[1])
+        test_map.edges.add(edge)
+        return test_map
+
+    def _state(self, test_map):
+        """Состояние карты в том виде, в котором его отправляет sendPutRequest."""
+        return {
+            'nodes': [
+                {'id': node.id, 'name': node.name, 'latitude': node.latitude, 'longitude': node.longitude,
+                 'description': node.description or '', 'z_coordinate': node.z_coordinate or 0}
+                for node in test_map.nodes.order_by('id')
+            ],
+            'edges': [
+                {'id': edge.id, 'node1': edge.node1_id, 'node2': edge.node2_id,
+                 'style': {'color': '#1DA1F2', 'width': 3, 'lineStyle': 'solid'}}
+                for edge in test_map.edges.order_by('id')
+            ],
+        }
+
+    def _put(self, client, test_map, payload):
+        return client.put(reverse('map-detail', kwargs={'pk': test_map.pk}), payload, format='json')
+
+    def test_unchanged_resave_writes_nothing(self, client, test_map):
+        payload = self._state(test_map)
+        with CaptureQueriesContext(connection) as queries:
+            response = self._put(client, test_map, payload)
+        assert response.status_code == status.HTTP_200_OK
+        # Запись корзины ограничения в кеш не относится к карте
+        writes = [q['sql'] for q in queries
+                  if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE') and 'wiremap_cache' not in q['sql']]
+        assert writes == []
+
+    def test_sync_applies_minimal_diff(self, client, test_map):
+        payload = self._state(test_map)
+        kept, moved, removed = payload['nodes']
+        moved['latitude'] = 50
+        payload['nodes'] = [kept, moved, {'id': 9999, 'name': 'New', 'latitude': 1, 'longitude': 1}]
+        payload['edges'].append({'node1': moved['id'], 'node2': 9999})
+
+        response = self._put(client, test_map, payload)
+        assert response.status_code == status.HTTP_200_OK
+        new_id = response.data['client_index_map']['9999']
+        assert set(test_map.nodes.values_list('id', flat=True)) == {kept['id'], moved['id'], new_id}
+        assert Node.objects.get(pk=moved['id']).latitude == 50
+        assert set(test_map.edges.values_list('node1_id', 'node2_id')) == {
+            (kept['id'], moved['id']), (moved['id'], new_id)
+        }
+
+    @pytest.mark.parametrize('payload', [{'title': 'x'}, {'title': 'x', 'nodes': []}, {'edges': []}])
+    def test_sync_requires_nodes_and_edges(self, client, test_map, payload):
+        response = self._put(client, test_map, payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert test_map.nodes.count() == 3 and test_map.edges.count() == 1
+
+    def test_sync_rejects_duplicate_ids(self, client, test_map):
+        payload = self._state(test_map)
+        payload['nodes'].append(dict(payload['nodes'][0], name='Copy'))
+        response = self._put(client, test_map, payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'nodes' in response.data
+
+        payload = self._state(test_map)
+        payload['edges'].append(dict(payload['edges'][0]))
+        response = self._put(client, test_map, payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'edges' in response.data
+
+    def test_sync_removes_missing_edges(self, client, test_map):
+        payload = self._state(test_map)
+        payload['edges'] = []
+        response = self._put(client, test_map, payload)
+        assert response.status_code == status.HTTP_200_OK
+        assert not test_map.edges.exists()
+        assert test_map.nodes.count() == 3
+
+
+@pytest.mark.django_db
+class TestMapDelta:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        return Map.objects.create(title='Delta Map', owner=user)
+
+    def _url(self, test_map):
+        return reverse('map-detail', kwargs={'pk': test_map.pk})
+
+    def _patch(self, client, test_map, payload):
+        response = client.patch(self._url(test_map), payload, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        return response
+
+    def test_version_increases_once_per_save(self, client, test_map):
+        response = self._patch(client, test_map, {'new_nodes': [
+            {'name': 'A', 'latitude': 1, 'longitude': 1, 'temp_id': 1},
+            {'name': 'B', 'latitude': 2, 'longitude': 2, 'temp_id': 2},
+        ]})
+        assert response.data['version'] == 1
+        response = self._patch(client, test_map, {'title': 'Renamed'})
+        assert response.data['version'] == 2
+
+    def test_delta_since_version(self, client, test_map):
+        created = self._patch(client, test_map, {
+            'new_nodes': [
+                {'name': 'A', 'latitude': 1, 'longitude': 1, 'temp_id': 1},
+                {'name': 'B', 'latitude': 2, 'longitude': 2, 'temp_id': 2},
+                {'name': 'C', 'latitude': 3, 'longitude': 3, 'temp_id': 3},
+            ],
+            'new_edges': [{'node1_temp_id': 1, 'node2_temp_id': 2}],
+        }).data
+        ids = created['client_index_map']
+        version = created['version']
+
+        self._patch(client, test_map, {
+            'changed_nodes': [{'id': ids['3'], 'latitude': 30}],
+            'deleted_node_ids': [ids['1']],
+        })
+
+        delta = client.get(self._url(test_map), {'since': version}).data
+        assert delta['since'] == version
+        assert delta['version'] == version + 1
+        assert [node['id'] for node in delta['nodes']] == [ids['3']]
+        assert delta['edges'] == []
+        assert delta['deleted_node_ids'] == [ids['1']]
+        assert delta['deleted_edge_ids'] == [created['edges'][0]['id']]
+
+        empty = client.get(self._url(test_map), {'since': delta['version']}).data
+        assert (empty['nodes'], empty['edges'], empty['deleted_node_ids']) == ([], [], [])
+
+    def test_since_from_future_returns_full_map(self, client, test_map):
+        response = client.get(self._url(test_map), {'since': 100})
+        assert 'since' not in response.json()
+        assert 'nodes' in response.json()
+
+    def test_invalid_since(self, client, test_map):
+        response = client.get(self._url(test_map), {'since': 'abc'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_stale_instance_does_not_roll_back_version(self, test_map):
+        stale = Map.objects.get(pk=test_map.pk)
+        test_map.bump_version()
+        stale.title = 'Stale save'
+        stale.save()
+        stale.refresh_from_db()
+        assert stale.version == 1
+
+
+@pytest.mark.django_db
+class TestMapConcurrency:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        return Map.objects.create(title='Shared Map', owner=user)
+
+    def _url(self, test_map):
+        return reverse('map-detail', kwargs={'pk': test_map.pk})
+
+    def test_get_returns_version_etag(self, client, test_map):
+        test_map.bump_version()
+        response = client.get(self._url(test_map))
+        assert response['ETag'] == '"v1"'
+
+    def test_patch_with_current_version(self, client, test_map):
+        etag = client.get(self._url(test_map))['ETag']
+        response = client.patch(self._url(test_map), {'title': 'Renamed'}, format='json', HTTP_IF_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['version'] == 1
+        assert response['ETag'] == '"v1"'
+
+    def test_stale_patch_returns_current_delta(self, client, test_map):
+        etag = client.get(self._url(test_map))['ETag']
+        created = client.patch(self._url(test_map), {'new_nodes': [
+            {'name': 'A', 'latitude': 1, 'longitude': 1, 'temp_id': 1},
+        ]}, format='json').data
+
+        response = client.patch(self._url(test_map), {'title': 'Lost update'}, format='json', HTTP_IF_MATCH=etag)
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+        assert response.data['version'] == 1
+        assert response.data['changes']['since'] == 0
+        assert [node['id'] for node in response.data['changes']['nodes']] == [created['client_index_map']['1']]
+        test_map.refresh_from_db()
+        assert test_map.title == 'Shared Map'
+
+    def test_stale_put_is_rejected(self, client, test_map):
+        test_map.bump_version()
+        response = client.put(self._url(test_map), {'nodes': [], 'edges_data': []}, format='json', HTTP_IF_MATCH='"v0"')
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+    def test_unknown_etag_returns_full_map(self, client, test_map):
+        response = client.patch(self._url(test_map), {'title': 'X'}, format='json', HTTP_IF_MATCH='W/"v0"')
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+        assert response.data['changes']['title'] == 'Shared Map'
+
+    def test_conditional_bump_detects_concurrent_write(self, test_map):
+        test_map.bump_version()
+        with pytest.raises(MapVersionConflict) as error:
+            test_map.bump_version(expected=0)
+        assert error.value.current_version == 1
+        assert test_map.bump_version(expected=1) == 2
+
+
+@pytest.mark.django_db
+class TestMapIdempotency:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        return Map.objects.create(title='Retry Map', owner=user)
+
+    def _patch(self, client, test_map, payload, key):
+        return client.patch(
+            reverse('map-detail', kwargs={'pk': test_map.pk}), payload, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_does_not_create_duplicates(self, client, test_map):
+        payload = {'new_nodes': [{'name': 'A', 'latitude': 1, 'longitude': 1, 'temp_id': 1}]}
+        first = self._patch(client, test_map, payload, 'save-1')
+        retry = self._patch(client, test_map, payload, 'save-1')
+        assert first.status_code == retry.status_code == status.HTTP_200_OK
+        assert retry['Idempotent-Replayed'] == 'true'
+        assert retry.data['client_index_map'] == first.data['client_index_map']
+        assert retry['ETag'] == first['ETag']
+        assert test_map.nodes.count() == 1
+
+    def test_different_keys_are_applied(self, client, test_map):
+        payload = {'new_nodes': [{'name': 'A', 'latitude': 1, 'longitude': 1, 'temp_id': 1}]}
+        self._patch(client, test_map, payload, 'save-1')
+        self._patch(client, test_map, payload, 'save-2')
+        assert test_map.nodes.count() == 2
+
+    def test_key_reuse_with_other_body_is_rejected(self, client, test_map):
+        self._patch(client, test_map, {'title': 'One'}, 'save-1')
+        response = self._patch(client, test_map, {'title': 'Two'}, 'save-1')
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        test_map.refresh_from_db()
+        assert test_map.title == 'One'
+
+    def test_only_compact_result_is_stored(self, client, test_map):
+        payload = {'new_nodes': [{'name': 'A', 'latitude': 1, 'longitude': 1, 'temp_id': 1}]}
+        first = self._patch(client, test_map, payload, 'save-1')
+        record = MapIdempotencyKey.objects.get(map=test_map, key='save-1')
+        assert record.response == {'version': first.data['version'], 'client_index_map': first.data['client_index_map']}
+
+        # Повтор после чужого изменения получает текущую карту
+        self._patch(client, test_map, {'title': 'Renamed'}, 'save-2')
+        retry = self._patch(client, test_map, payload, 'save-1')
+        assert retry.data['title'] == 'Renamed'
+        assert retry.data['client_index_map'] == first.data['client_index_map']
+
+    def test_failed_request_is_not_stored(self, client, test_map):
+        response = self._patch(client, test_map, {'title': ''}, 'save-1')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not MapIdempotencyKey.objects.filter(map=test_map).exists()
+
+    @override_settings(MAP_IDEMPOTENCY_TTL=0)
+    def test_expired_key_is_applied_again(self, client, test_map):
+        payload = {'new_nodes': [{'name': 'A', 'latitude': 1, 'longitude': 1, 'temp_id': 1}]}
+        self._patch(client, test_map, payload, 'save-1')
+        response = self._patch(client, test_map, payload, 'save-1')
+        assert 'Idempotent-Replayed' not in response
+        assert test_map.nodes.count() == 2
+
+    def test_other_user_cannot_replay(self, client, test_map):
+        self._patch(client, test_map, {'title': 'One'}, 'save-1')
+        other = APIClient()
+        other.force_authenticate(user=UserFactory())
+        response = self._patch(other, test_map, {'title': 'One'}, 'save-1')
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class TestMapConditionalGet:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Cached Map', owner=user)
+        test_map.nodes.add(Node.objects.create(name='A', latitude=1, longitude=1))
+        return test_map
+
+    def _url(self, test_map):
+        return reverse('map-detail', kwargs={'pk': test_map.pk})
+
+    def test_if_none_match_answers_304_with_one_query(self, client, test_map, django_assert_num_queries):
+        first = client.get(self._url(test_map))
+        assert first['Last-Modified']
+        with django_assert_num_queries(1):
+            response = client.get(self._url(test_map), HTTP_IF_NONE_MATCH=first['ETag'])
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == first['ETag']
+        assert response.content == b''
+
+    def test_if_modified_since(self, client, test_map):
+        last_modified = client.get(self._url(test_map))['Last-Modified']
+        response = client.get(self._url(test_map), HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        response = client.get(self._url(test_map), HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT')
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_changed_map_is_sent_again(self, client, test_map):
+        etag = client.get(self._url(test_map))['ETag']
+        client.patch(self._url(test_map), {'title': 'Renamed'}, format='json')
+        response = client.get(self._url(test_map), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['title'] == 'Renamed'
+        assert response['ETag'] != etag
+
+    def test_pending_autosave_is_flushed_before_answer(self, client, test_map):
+        etag = client.get(self._url(test_map))['ETag']
+        client.post(reverse('map-autosave', kwargs={'pk': test_map.pk}), {'title': 'Buffered'}, format='json')
+        response = client.get(self._url(test_map), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['title'] == 'Buffered'
+
+    def test_etag_depends_on_format_and_owner(self, client, test_map):
+        etag = client.get(self._url(test_map))['ETag']
+        other = APIClient()
+        other.force_authenticate(user=UserFactory())
+        assert other.get(self._url(test_map), HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_403_FORBIDDEN
+        response = client.get(self._url(test_map), HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT='application/json; indent=2')
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        nodes = client.get(reverse('map-nodes', kwargs={'pk': test_map.pk}), HTTP_IF_NONE_MATCH=etag)
+        assert nodes.status_code == status.HTTP_304_NOT_MODIFIED
@@ -0,0 +1,193 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node, Edge, MapAutosaveBuffer
+from MainApp.autosave import flush_autosave, merge_changes
+
+@pytest.mark.django_db
+class TestMapAutosave:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Autosave Map', owner=user)
+        node = Node.objects.create(name='Saved', latitude=1, longitude=1)
+        test_map.nodes.add(node)
+        return test_map
+
+    def _autosave(self, client, test_map, payload):
+        response = client.post(reverse('map-autosave', kwargs={'pk': test_map.pk}), payload, format='json')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        return response
+
+    def _flush(self, client, test_map):
+        response = client.post(reverse('map-autosave-flush', kwargs={'pk': test_map.pk}))
+        assert response.status_code == status.HTTP_200_OK
+        return response
+
+    def test_autosave_is_buffered(self, client, test_map):
+        node = test_map.nodes.get()
+        self._autosave(client, test_map, {'changed_nodes': [{'id': node.id, 'latitude': 5}]})
+        node.refresh_from_db()
+        assert node.latitude == 1
+        assert MapAutosaveBuffer.objects.get(map=test_map).edits == 1
+
+    def test_repeated_moves_are_coalesced(self, client, test_map):
+        node = test_map.nodes.get()
+        for step in range(20):
+            self._autosave(client, test_map, {'changed_nodes': [{'id': node.id, 'latitude': step, 'longitude': step}]})
+        self._autosave(client, test_map, {'changed_nodes': [{'id': node.id, 'name': 'Renamed'}]})
+
+        with CaptureQueriesContext(connection) as queries:
+            self._flush(client, test_map)
+        node_updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "MainApp_node"')]
+        assert len(node_updates) == 1
+
+        node.refresh_from_db()
+        assert (node.latitude, node.longitude, node.name) == (19, 19, 'Renamed')
+        test_map.refresh_from_db()
+        assert test_map.version == 1
+
+    def test_new_nodes_and_edges_flush_with_index_map(self, client, test_map):
+        saved = test_map.nodes.get()
+        self._autosave(client, test_map, {'new_nodes': [{'name': 'New', 'latitude': 2, 'longitude': 2, 'temp_id': 7}]})
+        self._autosave(client, test_map, {'new_nodes': [{'name': 'New', 'latitude': 3, 'longitude': 3, 'temp_id': 7}]})
+        self._autosave(client, test_map, {'new_edges': [{'node1': saved.id, 'node2_temp_id': 7}]})
+
+        data = self._flush(client, test_map).data
+        new_id = data['client_index_map']['7']
+        assert Node.objects.get(id=new_id).latitude == 3
+        assert test_map.nodes.count() == 2
+        edge = test_map.edges.get()
+        assert {edge.node1_id, edge.node2_id} == {saved.id, new_id}
+        assert MapAutosaveBuffer.objects.get(map=test_map).node_ids == {}
+
+    def test_timer_flush_keeps_temp_ids_for_later_edits(self, client, test_map):
+        self._autosave(client, test_map, {'new_nodes': [{'name': 'New', 'latitude': 2, 'longitude': 2, 'temp_id': 7}]})
+        call_command('flush_autosave_buffers', max_age=0)
+        assert test_map.nodes.count() == 2
+
+        response = self._autosave(client, test_map, {'new_nodes': [{'name': 'New', 'latitude': 4, 'longitude': 4, 'temp_id': 7}]})
+        new_id = response.data['client_index_map']['7']
+        flush_autosave(test_map.id)
+        assert test_map.nodes.count() == 2
+        assert Node.objects.get(id=new_id).latitude == 4
+
+    def test_delete_drops_buffered_changes(self, client, test_map):
+        node = test_map.nodes.get()
+        other = Node.objects.create(name='Other', latitude=2, longitude=2)
+        test_map.nodes.add(other)
+        self._autosave(client, test_map, {
+            'changed_nodes': [{'id': node.id, 'latitude': 9}],
+            'new_edges': [{'node1': node.id, 'node2': other.id}],
+        })
+        self._autosave(client, test_map, {'deleted_node_ids': [node.id]})
+        self._flush(client, test_map)
+        assert list(test_map.nodes.all()) == [other]
+        assert not test_map.edges.exists()
+
+    def test_new_node_deleted_before_flush_is_not_created(self, client, test_map):
+        saved = test_map.nodes.get()
+        self._autosave(client, test_map, {
+            'new_nodes': [{'name': 'Temp', 'latitude': 2, 'longitude': 2, 'temp_id': 7}],
+            'new_edges': [{'node1': saved.id, 'node2_temp_id': 7}],
+        })
+        self._autosave(client, test_map, {'deleted_node_temp_ids': [7]})
+        data = self._flush(client, test_map).data
+        assert data['client_index_map'] == {}
+        assert list(test_map.nodes.all()) == [saved]
+        assert not test_map.edges.exists()
+
+    def test_flushed_new_node_is_deleted_by_temp_id(self, client, test_map):
+        self._autosave(client, test_map, {'new_nodes': [{'name': 'Temp', 'latitude': 2, 'longitude': 2, 'temp_id': 7}]})
+        call_command('flush_autosave_buffers', max_age=0)
+        assert test_map.nodes.count() == 2
+        self._autosave(client, test_map, {'deleted_node_temp_ids': [7]})
+        self._flush(client, test_map)
+        assert test_map.nodes.count() == 1
+
+    def test_read_flushes_buffer(self, client, test_map):
+        node = test_map.nodes.get()
+        self._autosave(client, test_map, {'title': 'Autosaved', 'changed_nodes': [{'id': node.id, 'latitude': 8}]})
+        response = client.get(reverse('map-detail', kwargs={'pk': test_map.pk}))
+        assert response.json()['title'] == 'Autosaved'
+        assert response.json()['nodes'][0]['latitude'] == 8
+
+    @override_settings(MAP_AUTOSAVE_MAX_EDITS=3)
+    def test_buffer_flushes_after_max_edits(self, client, test_map):
+        node = test_map.nodes.get()
+        for step in range(3):
+            response = self._autosave(client, test_map, {'changed_nodes': [{'id': node.id, 'latitude': step}]})
+        assert response.data['edits'] == 0
+        node.refresh_from_db()
+        assert node.latitude == 2
+
+    def test_invalid_node_is_rejected(self, client, test_map):
+        response = client.post(
+            reverse('map-autosave', kwargs={'pk': test_map.pk}),
+            {'new_nodes': [{'name': 'Bad', 'latitude': 500, 'longitude': 1, 'temp_id': 1}]},
+            format='json'
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not MapAutosaveBuffer.objects.filter(map=test_map).exists()
+
+    def test_rejected_changes_do_not_block_buffer(self, client, test_map):
+        node = test_map.nodes.get()
+        # Петля проходит проверку автосохранения, но отклоняется при записи в карту
+        bad_edge = {'node1': node.id, 'node2': node.id}
+        self._autosave(client, test_map, {'new_edges': [bad_edge]})
+        call_command('flush_autosave_buffers', max_age=0)
+        buffer = MapAutosaveBuffer.objects.get(map=test_map)
+        assert buffer.buffered_at is None and buffer.changes == {}
+        # Повторный запуск команды не спотыкается о тот же буфер
+        call_command('flush_autosave_buffers', max_age=0)
+
+        # Следующий запрос узнает об отклоненных изменениях, а не молча дописывает буфер
+        payload = {'changed_nodes': [{'id': node.id, 'latitude': 7}]}
+        response = client.post(reverse('map-autosave', kwargs={'pk': test_map.pk}), payload, format='json')
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['rejected'] == {'new_edges': [bad_edge]}
+        assert response.data['details']
+
+        self._autosave(client, test_map, payload)
+        self._flush(client, test_map)
+        node.refresh_from_db()
+        assert node.latitude == 7
+
+    def test_explicit_flush_reports_rejected_changes(self, client, test_map):
+        node = test_map.nodes.get()
+        self._autosave(client, test_map, {'title': 'Kept?', 'new_edges': [{'node1': node.id, 'node2': node.id}]})
+        response = client.post(reverse('map-autosave-flush', kwargs={'pk': test_map.pk}))
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['rejected']['title'] == 'Kept?'
+        test_map.refresh_from_db()
+        assert test_map.title == 'Autosave Map'
+        self._flush(client, test_map)
+
+    def test_discard_buffer(self, client, test_map):
+        node = test_map.nodes.get()
+        self._autosave(client, test_map, {'changed_nodes': [{'id': node.id, 'latitude': 9}]})
+        response = client.delete(reverse('map-autosave', kwargs={'pk': test_map.pk}))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        self._flush(client, test_map)
+        node.refresh_from_db()
+        assert node.latitude == 1
+
+    def test_merge_replaces_edge_endpoint_reference(self):
+        changes = merge_changes({}, {'changed_edges': [{'id': 1, 'node1_temp_id': 5}]})
+        changes = merge_changes(changes, {'changed_edges': [{'id': 1, 'node1': 10}]})
+        assert changes['changed_edges']['1'] == {'id': 1, 'node1': 10}
@@ -0,0 +1,108 @@
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node, Edge
+from MainApp.clustering import MAX_CLUSTER_ZOOM, ClusterPyramid, build_pyramid, cell_key, get_level, _load_changes
+
+
+def pyramid_state(pyramid):
+    levels = [
+        {key: (count, round(sum_lat, 6), round(sum_lon, 6), sum_id) for key, (count, sum_lat, sum_lon, sum_id) in cells.items()}
+        for cells in pyramid.levels
+    ]
+    return levels, pyramid.links
+
+
+@pytest.mark.django_db
+class TestMapClusters:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Cluster Map', owner=user)
+        # Две плотные группы (Москва и Новосибирск) и одиночный узел
+        nodes = [Node(name=f'M{i}', latitude=55.75 + i * 0.001, longitude=37.6 + i * 0.001) for i in range(20)]
+        nodes += [Node(name=f'N{i}', latitude=55.0 + i * 0.001, longitude=82.9 + i * 0.001) for i in range(10)]
+        nodes.append(Node(name='Alone', latitude=-33.9, longitude=151.2))
+        nodes = Node.objects.bulk_create(nodes)
+        test_map.nodes.add(*nodes)
+        edges = [Edge.objects.create(node1=nodes[i], node2=nodes[i + 1]) for i in range(19)]
+        edges.append(Edge.objects.create(node1=nodes[0], node2=nodes[20]))
+        edges.append(Edge.objects.create(node1=nodes[20], node2=nodes[30]))
+        test_map.edges.add(*edges)
+        return test_map
+
+    def _get(self, client, test_map, **params):
+        return client.get(reverse('map-clusters', kwargs={'pk': test_map.pk}), params)
+
+    def test_low_zoom_groups_nodes(self, client, test_map):
+        response = self._get(client, test_map, zoom=3)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] == f'"v{test_map.version}"'
+        clusters = {cluster['count']: cluster for cluster in response.data['clusters']}
+        assert sorted(clusters) == [1, 10, 20]
+        assert clusters[1]['node_id'] == test_map.nodes.get(name='Alone').id
+        assert clusters[20]['node_id'] is None
+        assert clusters[20]['latitude'] == pytest.approx(55.7595)
+        links = sorted((link['count'], {link['source'], link['target']}) for link in response.data['edges'])
+        assert links == [
+            (1, {clusters[20]['id'], clusters[10]['id']}),
+            (1, {clusters[10]['id'], clusters[1]['id']}),
+        ]
+
+    def test_bbox_and_zoom_limits(self, client, test_map):
+        response = self._get(client, test_map, zoom=5, bbox='30,50,40,60')
+        assert [cluster['count'] for cluster in response.data['clusters']] == [20]
+        assert len(response.data['edges']) == 1
+
+        response = self._get(client, test_map, zoom=40)
+        assert response.data['zoom'] == MAX_CLUSTER_ZOOM
+        assert sum(cluster['count'] for cluster in response.data['clusters']) == 31
+        for zoom in ['', '-1', 'x']:
+            assert self._get(client, test_map, zoom=zoom).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_cells_nest_between_levels(self):
+        for latitude, longitude in [(55.75, 37.6), (-33.9, 151.2), (89, -180), (0, 0)]:
+            for zoom in range(MAX_CLUSTER_ZOOM):
+                fine, coarse = cell_key(latitude, longitude, zoom + 1), cell_key(latitude, longitude, zoom)
+                n = 4 << zoom
+                assert (fine // (2 * n) // 2) * n + (fine % (2 * n)) // 2 == coarse
+
+    def test_incremental_update_matches_rebuild(self, client, test_map):
+        self._get(client, test_map, zoom=4)
+        moved, removed = test_map.nodes.get(name='M0'), test_map.nodes.get(name='N0')
+        response = client.patch(reverse('map-detail', kwargs={'pk': test_map.pk}), {
+            'new_nodes': [{'name': 'New', 'latitude': 40.7, 'longitude': -74.0, 'temp_id': 1}],
+            'changed_nodes': [{'id': moved.id, 'latitude': 59.9, 'longitude': 30.3}],
+            'deleted_node_ids': [removed.id],
+            'new_edges': [{'node1': moved.id, 'node2_temp_id': 1}],
+        }, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        test_map.refresh_from_db()
+
+        response = self._get(client, test_map, zoom=4)
+        assert sum(cluster['count'] for cluster in response.data['clusters']) == 31
+        incremental = build_pyramid(test_map)
+        fresh = ClusterPyramid()
+        fresh.apply(*_load_changes(test_map, None))
+        assert incremental.version == test_map.version
+        assert pyramid_state(incremental) == pyramid_state(fresh)
+        assert incremental.node_edges.get(removed.id, set()) == set()
+
+    def test_cached_level_skips_rebuild(self, client, test_map, django_assert_num_queries):
+        assert self._get(client, test_map, zoom=2).status_code == status.HTTP_200_OK
+        cache.delete(f'map_clusters:{test_map.id}:3')
+        # Уровень берется из кеша без чтения узлов
+        with django_assert_num_queries(0):
+            assert get_level(test_map, 2)['version'] == test_map.version
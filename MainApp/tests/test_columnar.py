@@ -0,0 +1,103 @@
+import math
+from array import array
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node, Edge
+from MainApp.columnar import map_columns, pack_column
+from MainApp.serializers import MapColumnarSerializer, MapSerializer
+
+
+def unpack(column):
+    values = array('i' if column['dtype'] == 'int32' else 'd')
+    values.frombytes(column['data'])
+    return [None if isinstance(value, float) and math.isnan(value) else value for value in values]
+
+
+@pytest.mark.django_db
+class TestMapColumnar:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Columnar Map', owner=user)
+        nodes = [
+            Node.objects.create(name='A', latitude=1.5, longitude=2.25, temp_id=3),
+            Node.objects.create(name='B', latitude=-3, longitude=4, description='A', z_coordinate=7.5),
+            Node.objects.create(name='A', latitude=5, longitude=6),
+        ]
+        test_map.nodes.add(*nodes)
+        test_map.edges.add(
+            Edge.objects.create(node1=nodes[0], node2=nodes[2], style={'color': '#000000'}),
+            Edge.objects.create(node1=nodes[2], node2=nodes[1], style={}, description='edge'),
+            Edge.objects.create(node1=nodes[1], node2=nodes[0], style={'color': '#000000'}),
+        )
+        return test_map
+
+    def test_pack_column_dtypes(self):
+        assert pack_column([1, 2])['dtype'] == 'int32'
+        assert pack_column([1, None])['dtype'] == 'float64'
+        assert pack_column([2 ** 40])['dtype'] == 'float64'
+        assert unpack(pack_column([1.5, None])) == [1.5, None]
+
+    def test_columns_match_map_serializer(self, test_map):
+        expected = MapSerializer(test_map).data
+        columns = map_columns(test_map)
+        nodes, edges, strings = columns['nodes'], columns['edges'], columns['strings']
+
+        assert nodes['count'] == len(expected['nodes'])
+        node_ids = unpack(nodes['id'])
+        for index, node in enumerate(expected['nodes']):
+            assert node_ids[index] == node['id']
+            assert unpack(nodes['latitude'])[index] == node['latitude']
+            assert unpack(nodes['longitude'])[index] == node['longitude']
+            assert unpack(nodes['z_coordinate'])[index] == node['z_coordinate']
+            assert unpack(nodes['temp_id'])[index] == node['temp_id']
+            assert strings[unpack(nodes['name'])[index]] == node['name']
+            description = unpack(nodes['description'])[index]
+            assert (strings[description] if description >= 0 else None) == node['description']
+
+        for index, edge in enumerate(expected['edges']):
+            assert node_ids[unpack(edges['node1'])[index]] == edge['node1']
+            assert node_ids[unpack(edges['node2'])[index]] == edge['node2']
+            assert columns['styles'][unpack(edges['style'])[index]] == edge['style']
+
+    def test_strings_and_styles_are_shared(self, test_map):
+        columns = map_columns(test_map)
+        assert sorted(columns['strings']) == ['A', 'B', 'edge']
+        assert len(columns['styles']) == 2
+
+    def test_empty_map(self, user):
+        columns = map_columns(Map.objects.create(title='Empty', owner=user))
+        assert columns['nodes']['count'] == 0 and columns['edges']['count'] == 0
+        assert columns['nodes']['id'] == {'dtype': 'int32', 'data': b''}
+
+    def test_serializer_keeps_map_fields(self, test_map):
+        data = MapColumnarSerializer(test_map).data
+        assert data['layout'] == 'columnar'
+        assert (data['title'], data['version']) == ('Columnar Map', test_map.version)
+
+    def test_msgpack_response(self, test_map, user):
+        msgpack = pytest.importorskip('msgpack')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get(reverse('map-detail', kwargs={'pk': test_map.pk}), HTTP_ACCEPT='application/msgpack')
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/msgpack'
+        assert response['ETag'] == f'"v{test_map.version}.msgpack"'
+        data = msgpack.unpackb(response.content)
+        assert data['layout'] == 'columnar'
+        assert unpack(data['nodes']['id']) == list(test_map.nodes.values_list('id', flat=True))
+
+    def test_json_stays_default(self, test_map, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get(reverse('map-detail', kwargs={'pk': test_map.pk}))
+        assert response['Content-Type'] == 'application/json'
+        assert 'Accept' in response['Vary']
+        assert 'layout' not in response.json()
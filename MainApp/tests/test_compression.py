@@ -0,0 +1,94 @@
+import gzip
+import json
+
+import brotli
+import pytest
+import zstandard
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory
+from django.urls import reverse
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node
+from MainApp.compression import CompressionMiddleware, negotiate_encoding
+from MainApp.representations import VARIANTS_KEY, get_cache
+
+
+@pytest.mark.django_db
+class TestResponseCompression:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Large Map', owner=user)
+        test_map.nodes.add(*Node.objects.bulk_create(
+            Node(name=f'Node {i}', latitude=i / 100, longitude=i / 100) for i in range(100)
+        ))
+        return test_map
+
+    def test_negotiate_encoding(self):
+        assert negotiate_encoding('gzip, deflate, br, zstd') == 'br'
+        assert negotiate_encoding('gzip;q=1.0, br;q=0.5') == 'gzip'
+        assert negotiate_encoding('zstd, br;q=0') == 'zstd'
+        assert negotiate_encoding('*;q=0.1, gzip;q=0') == 'br'
+        assert negotiate_encoding('identity') is None
+        assert negotiate_encoding('') is None
+
+    def test_map_variants_are_cached(self, client, test_map):
+        url = reverse('map-detail', kwargs={'pk': test_map.pk})
+        plain = client.get(url)
+        assert 'Content-Encoding' not in plain
+        assert plain['Vary'] == 'Accept, Accept-Encoding'
+
+        response = client.get(url, HTTP_ACCEPT_ENCODING='br, gzip')
+        assert response['Content-Encoding'] == 'br'
+        assert response['ETag'] == f'W/"v{test_map.version}"'
+        assert brotli.decompress(response.content) == plain.content
+
+        response = client.get(url, HTTP_ACCEPT_ENCODING='zstd')
+        assert zstandard.ZstdDecompressor().decompress(response.content) == plain.content
+        variants = get_cache().get(VARIANTS_KEY % {'key': f'map_representation:{test_map.id}:{test_map.version}:json'})
+        assert set(variants) == {'br', 'zstd'}
+
+        # Условный GET со слабым ETag сжатого ответа
+        response = client.get(url, HTTP_IF_NONE_MATCH=f'W/"v{test_map.version}"', HTTP_ACCEPT_ENCODING='br')
+        assert response.status_code == 304
+
+    def test_not_modified_etag_matches_compressed_response(self, client, test_map):
+        url = reverse('map-detail', kwargs={'pk': test_map.pk})
+        full = client.get(url, HTTP_ACCEPT_ENCODING='br')
+        assert full['ETag'] == f'W/"v{test_map.version}"'
+
+        # If-None-Match сравнивается слабо: подходят и W/"v<n>", и "v<n>"
+        for etag in (full['ETag'], f'"v{test_map.version}"'):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING='br')
+            assert response.status_code == 304
+            assert response['ETag'] == full['ETag']
+            assert 'Accept-Encoding' in response['Vary']
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=full['ETag'])
+        assert response.status_code == 304
+        assert response['ETag'] == client.get(url)['ETag'] == f'"v{test_map.version}"'
+
+    def test_small_and_html_responses_are_not_compressed(self, client, test_map):
+        response = client.get(reverse('map-nodes', kwargs={'pk': test_map.pk}), {'bbox': '0,0,0.001,0.001'},
+                              HTTP_ACCEPT_ENCODING='gzip')
+        assert 'Content-Encoding' not in response
+        response = client.get(reverse('main'), HTTP_ACCEPT_ENCODING='gzip')
+        assert 'Content-Encoding' not in response
+
+    def test_streaming_response_is_compressed_by_chunks(self):
+        rows = [json.dumps({'id': i}).encode() + b'\n' for i in range(1000)]
+        response = StreamingHttpResponse(iter(rows), content_type='application/x-ndjson')
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = CompressionMiddleware(lambda request: response)(request)
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(b''.join(response.streaming_content)) == b''.join(rows)
@@ -0,0 +1,225 @@
+import os
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node, Edge, MapOperation
+from MainApp import operations
+from MainApp.operations import compact_map_operations
+
+@pytest.mark.django_db
+class TestMapOperations:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        return Map.objects.create(title='Ops Map', owner=user)
+
+    def _post(self, client, test_map, operations):
+        return client.post(
+            reverse('map-operations', kwargs={'pk': test_map.pk}),
+            {'operations': operations},
+            format='json'
+        )
+
+    def _ops(self, *ops):
+        return [{'seq': seq, 'op_type': op_type, 'data': data} for seq, (op_type, data) in enumerate(ops, start=1)]
+
+    def test_ingest_only_appends(self, client, test_map):
+        response = self._post(client, test_map, self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+        ))
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data['last_seq'] == 1
+        assert test_map.operations.filter(applied_at__isnull=True).count() == 1
+        assert not test_map.nodes.exists()
+
+    def test_duplicate_seq_is_ignored(self, client, test_map):
+        ops = self._ops(('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}))
+        self._post(client, test_map, ops)
+        self._post(client, test_map, ops)
+        assert test_map.operations.count() == 1
+
+    def test_invalid_operation_rejected(self, client, test_map):
+        response = self._post(client, test_map, self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 91, 'longitude': 1}),
+        ))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not test_map.operations.exists()
+
+    @pytest.mark.parametrize('op', [
+        ('add_node', {'temp_id': 1, 'name': ['A'], 'latitude': 1, 'longitude': 1}),
+        ('add_node', {'temp_id': 1, 'name': 'A' * 101, 'latitude': 1, 'longitude': 1}),
+        ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1, 'description': {}}),
+        ('move_node', {'id': 1, 'latitude': 1, 'z_coordinate': 'high'}),
+        ('add_edge', {'node1': 1, 'node2': 2, 'description': []}),
+        ('add_edge', {'node1': 1, 'node2': 2, 'style': {'width': 50}}),
+    ])
+    def test_operation_fields_are_validated(self, client, test_map, op):
+        response = self._post(client, test_map, self._ops(op))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not test_map.operations.exists()
+
+    def test_body_must_be_object(self, client, test_map):
+        response = client.post(reverse('map-operations', kwargs={'pk': test_map.pk}), [], format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_received_counts_only_new_operations(self, client, test_map):
+        ops = self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+            ('move_node', {'temp_id': 1, 'latitude': 2}),
+        )
+        assert self._post(client, test_map, ops[:1]).data['received'] == 1
+        response = self._post(client, test_map, ops + ops[1:])
+        assert response.data == {'received': 1, 'last_seq': 2}
+
+    def test_late_operation_is_rejected(self, client, test_map):
+        self._post(client, test_map, [
+            {'seq': 1, 'op_type': 'add_node', 'data': {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}},
+            {'seq': 3, 'op_type': 'move_node', 'data': {'temp_id': 1, 'latitude': 3}},
+        ])
+        compact_map_operations(test_map.id)
+        response = self._post(client, test_map, [
+            {'seq': 2, 'op_type': 'move_node', 'data': {'temp_id': 1, 'latitude': 2}},
+            {'seq': 4, 'op_type': 'move_node', 'data': {'temp_id': 1, 'latitude': 4}},
+        ])
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['late_seq'] == [2]
+        assert not test_map.operations.filter(seq__in=[2, 4]).exists()
+        # Повтор уже примененной операции не считается опоздавшим
+        response = self._post(client, test_map, self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+        ))
+        assert response.status_code == status.HTTP_202_ACCEPTED
+
+    def test_bad_operation_is_skipped_by_compaction(self, client, test_map):
+        self._post(client, test_map, self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+            ('add_node', {'temp_id': 2, 'name': 'B', 'latitude': 1, 'longitude': 1}),
+        ))
+        # Операция, записанная в журнал в обход проверки при приеме
+        test_map.operations.filter(seq=2).update(data={'temp_id': 2, 'name': 'B' * 500, 'latitude': 1, 'longitude': 1})
+        MapOperation.objects.create(map=test_map, seq=3, op_type='move_node', data={'temp_id': 1, 'latitude': 5})
+
+        assert compact_map_operations(test_map.id) == 3
+        assert list(test_map.nodes.values_list('name', 'latitude')) == [('A', 5)]
+        rejected = test_map.operations.get(seq=2)
+        assert rejected.applied_at is not None and rejected.error
+        response = client.get(reverse('map-detail', kwargs={'pk': test_map.pk}))
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_failing_batch_is_applied_op_by_op(self, client, test_map, monkeypatch):
+        self._post(client, test_map, self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+            ('add_node', {'temp_id': 2, 'name': 'B', 'latitude': 1, 'longitude': 1}),
+            ('add_node', {'temp_id': 3, 'name': 'C', 'latitude': 1, 'longitude': 1}),
+        ))
+        fold = operations.fold_operations
+
+        def failing_fold(batch, *args):
+            if any(op.seq == 2 for op in batch):
+                raise ValueError('broken')
+            return fold(batch, *args)
+
+        monkeypatch.setattr(operations, 'fold_operations', failing_fold)
+        assert compact_map_operations(test_map.id) == 3
+        assert sorted(test_map.nodes.values_list('name', flat=True)) == ['A', 'C']
+        assert test_map.operations.get(seq=2).error == 'broken'
+
+    def test_other_user_cannot_post(self, test_map):
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        response = self._post(client, test_map, [])
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_compaction_folds_operations(self, client, test_map):
+        existing = Node.objects.create(name='Old', latitude=5, longitude=5)
+        gone = Node.objects.create(name='Gone', latitude=6, longitude=6)
+        test_map.nodes.add(existing, gone)
+        self._post(client, test_map, self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+            ('move_node', {'temp_id': 1, 'latitude': 2}),
+            ('move_node', {'temp_id': 1, 'latitude': 3}),
+            ('add_node', {'temp_id': 2, 'name': 'B', 'latitude': 1, 'longitude': 1}),
+            ('delete_node', {'temp_id': 2}),
+            ('move_node', {'id': existing.id, 'longitude': 7}),
+            ('add_edge', {'temp_id': 10, 'node1_temp_id': 1, 'node2': existing.id}),
+            ('add_edge', {'node1_temp_id': 2, 'node2': existing.id}),
+            ('delete_node', {'id': gone.id}),
+        ))
+
+        assert compact_map_operations(test_map.id) == 9
+        new_node = test_map.nodes.get(name='A')
+        assert new_node.latitude == 3
+        assert set(test_map.nodes.values_list('name', flat=True)) == {'A', 'Old'}
+        existing.refresh_from_db()
+        assert existing.longitude == 7
+        edge = test_map.edges.get()
+        assert (edge.node1_id, edge.node2_id) == (new_node.id, existing.id)
+        assert not test_map.operations.filter(applied_at__isnull=True).exists()
+        assert test_map.operations.get(seq=1).target_id == new_node.id
+
+    def test_later_batches_resolve_earlier_temp_ids(self, client, test_map):
+        self._post(client, test_map, self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+            ('add_node', {'temp_id': 2, 'name': 'B', 'latitude': 1, 'longitude': 1}),
+            ('add_edge', {'temp_id': 5, 'node1_temp_id': 1, 'node2_temp_id': 2}),
+            ('move_node', {'temp_id': 2, 'latitude': 9}),
+            ('delete_edge', {'temp_id': 5}),
+        ))
+        # Пакеты по 3 операции: перемещение и удаление ребра попадают во второй пакет
+        assert compact_map_operations(test_map.id, batch_size=3) == 5
+        assert test_map.nodes.get(name='B').latitude == 9
+        assert not test_map.edges.exists()
+
+    def test_map_read_compacts_pending_operations(self, client, test_map):
+        self._post(client, test_map, self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+        ))
+        response = client.get(reverse('map-detail', kwargs={'pk': test_map.pk}))
+        assert [node['name'] for node in response.json()['nodes']] == ['A']
+
+    def test_history_after_seq(self, client, test_map):
+        self._post(client, test_map, self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+            ('move_node', {'temp_id': 1, 'latitude': 2}),
+        ))
+        response = client.get(reverse('map-operations', kwargs={'pk': test_map.pk}), {'after': 1})
+        assert [op['seq'] for op in response.data] == [2]
+
+    def test_compact_command(self, client, test_map):
+        self._post(client, test_map, self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+        ))
+        call_command('compact_map_operations')
+        assert test_map.nodes.count() == 1
+
+    def test_pruned_seq_is_not_reapplied(self, client, test_map):
+        ops = self._ops(
+            ('add_node', {'temp_id': 1, 'name': 'A', 'latitude': 1, 'longitude': 1}),
+            ('add_node', {'temp_id': 2, 'name': 'B', 'latitude': 1, 'longitude': 1}),
+        )
+        self._post(client, test_map, ops)
+        compact_map_operations(test_map.id)
+        # Все примененные операции старше нуля дней и удаляются
+        call_command('compact_map_operations', prune_days=0, stdout=open(os.devnull, 'w'))
+        assert not test_map.operations.exists()
+        test_map.save()
+
+        response = self._post(client, test_map, ops)
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['late_seq'] == [1, 2]
+        assert response.data['last_applied_seq'] == 2
+        compact_map_operations(test_map.id)
+        assert test_map.nodes.count() == 2
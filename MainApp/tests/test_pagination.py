@@ -0,0 +1,74 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node, Edge
+
+
+@pytest.mark.django_db
+class TestMapObjectPages:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Paged Map', owner=user)
+        nodes = Node.objects.bulk_create(Node(name=str(i), latitude=i, longitude=i) for i in range(25))
+        test_map.nodes.add(*nodes)
+        test_map.edges.add(*Edge.objects.bulk_create(
+            Edge(node1=nodes[i], node2=nodes[i + 1]) for i in range(24)
+        ))
+        # Узел другой карты не попадает в выдачу
+        Node.objects.create(name='other', latitude=0, longitude=0)
+        return test_map
+
+    def _url(self, name, test_map):
+        return reverse(name, kwargs={'pk': test_map.pk})
+
+    def test_pages_cover_all_nodes_once(self, client, test_map):
+        ids, url, params = [], self._url('map-nodes', test_map), {'limit': 10}
+        while url:
+            response = client.get(url, params)
+            assert response.status_code == status.HTTP_200_OK
+            assert response.data['count'] == 25
+            ids += [node['id'] for node in response.data['results']]
+            url, params = response.data['next'], None
+        assert ids == sorted(test_map.nodes.values_list('id', flat=True))
+
+        # Узлы из следующих страниц, добавленные между запросами, не теряются
+        last = ids[9]
+        new = Node.objects.create(name='new', latitude=1, longitude=1)
+        test_map.nodes.add(new)
+        response = client.get(self._url('map-nodes', test_map), {'after': last, 'limit': 100})
+        assert response.data['results'][-1]['id'] == new.id
+        assert response.data['next'] is None
+
+    def test_edges_page_and_ids_filter(self, client, test_map):
+        edge_ids = sorted(test_map.edges.values_list('id', flat=True))
+        response = client.get(self._url('map-edges', test_map), {'limit': 5, 'after': edge_ids[4]})
+        assert [edge['id'] for edge in response.data['results']] == edge_ids[5:10]
+        assert response.data['results'][0]['style']
+        assert f'after={edge_ids[9]}' in response.data['next']
+
+        wanted = edge_ids[3:6] + [10 ** 9]
+        response = client.get(self._url('map-edges', test_map), {'ids': ','.join(map(str, wanted))})
+        assert sorted(edge['id'] for edge in response.data) == edge_ids[3:6]
+
+    def test_page_size_limits(self, client, test_map, settings):
+        settings.MAP_OBJECTS_MAX_PAGE_SIZE = 20
+        response = client.get(self._url('map-nodes', test_map), {'limit': 1000})
+        assert len(response.data['results']) == 20
+        settings.MAP_OBJECTS_PAGE_SIZE = 7
+        response = client.get(self._url('map-nodes', test_map), {'after': 0})
+        assert len(response.data['results']) == 7
+        for params in [{'limit': 0}, {'limit': 'x'}, {'after': -1}, {'ids': '1,a'}]:
+            response = client.get(self._url('map-nodes', test_map), params)
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.autosave import buffer_changes
+from MainApp.serializers import MapAutosaveSerializer
+from MainApp.models import Map, MapAutosaveBuffer, MapOperation, Node
+from MainApp.public_cache import cache_file_path, cache_keys
+
+
+@pytest.mark.django_db
+class TestPublishedMapAPI:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Public Map', owner=user, is_published=True)
+        test_map.nodes.add(Node.objects.create(name='A', latitude=1, longitude=1))
+        return test_map
+
+    def _url(self, test_map):
+        return reverse('public-map', kwargs={'pk': test_map.pk})
+
+    def test_anonymous_read_is_cacheable(self, test_map):
+        client = Client()
+        response = client.get(self._url(test_map))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['nodes'][0]['name'] == 'A'
+        cache_control = set(response['Cache-Control'].split(', '))
+        assert {'public', 'max-age=0', 's-maxage=10'} <= cache_control
+        assert 'Cookie' not in response['Vary']
+        assert not response.cookies
+
+        response = client.get(self._url(test_map), HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert 'public' in response['Cache-Control']
+
+    def test_session_is_not_used(self, test_map, user):
+        client = Client()
+        client.force_login(user)
+        response = client.get(self._url(test_map))
+        assert response.status_code == status.HTTP_200_OK
+        assert 'Cookie' not in response['Vary']
+
+    def test_read_does_not_write_pending_changes(self, test_map):
+        MapOperation.objects.create(
+            map=test_map, seq=1, op_type='add_node', data={'temp_id': 1, 'name': 'B', 'latitude': 2, 'longitude': 2}
+        )
+        serializer = MapAutosaveSerializer(data={'new_nodes': [{'temp_id': 2, 'name': 'C', 'latitude': 3, 'longitude': 3}]})
+        assert serializer.is_valid(), serializer.errors
+        buffer_changes(test_map, serializer.validated_data)
+        response = Client().get(self._url(test_map))
+        assert response.status_code == status.HTTP_200_OK
+        assert [node['name'] for node in response.json()['nodes']] == ['A']
+        assert test_map.operations.get().applied_at is None
+        assert MapAutosaveBuffer.objects.filter(map=test_map).exists()
+        test_map.refresh_from_db()
+        assert test_map.nodes.count() == 1
+
+    def test_unpublished_map_is_forbidden(self, test_map):
+        test_map.is_published = False
+        test_map.save()
+        client = APIClient()
+        response = client.get(self._url(test_map))
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert 'Cache-Control' not in response
+        response = client.get(self._url(test_map), HTTP_IF_NONE_MATCH=f'"v{test_map.version}"')
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_edit_and_unpublish_purge_nginx_cache(self, settings, tmp_path, test_map, user,
+                                                 django_capture_on_commit_callbacks):
+        settings.MAP_PUBLIC_CACHE_ROOT = str(tmp_path)
+
+        def fill_cache():
+            for key in cache_keys(test_map.id):
+                path = cache_file_path(key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, 'wb').close()
+
+        fill_cache()
+        assert cache_file_path(f'/api/v1/public/maps/{test_map.id}/|application/json|br').startswith(str(tmp_path))
+        client = APIClient()
+        client.force_authenticate(user=user)
+        with django_capture_on_commit_callbacks(execute=True):
+            client.patch(reverse('map-detail', kwargs={'pk': test_map.pk}), {'title': 'Edited'}, format='json')
+        assert not any(os.path.exists(cache_file_path(key)) for key in cache_keys(test_map.id))
+
+        fill_cache()
+        client = Client()
+        client.force_login(user)
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(reverse('unpublish_map', kwargs={'map_id': test_map.id}))
+        assert not any(os.path.exists(cache_file_path(key)) for key in cache_keys(test_map.id))
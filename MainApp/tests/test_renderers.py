@@ -0,0 +1,90 @@
+import datetime
+import decimal
+import io
+import pytest
+from django.urls import reverse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from MainApp import parsers, renderers
+from MainApp.parsers import FastJSONParser
+from MainApp.renderers import FastJSONRenderer
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node
+
+PAYLOADS = [
+    {'latitude': 55.921708, 'longitude': 37.814387, 'z': 0.0, 'neg': -0.0},
+    [1e-05, 2.5e-05, 1e-07, 1e16, 1.5e16, 1e+22, 1.7976931348623157e308, 5e-324, 10.00001, 1e15],
+    {'name': 'Узел "1e5" 0.00001 \\     \x01', 'values': [1, True, None, 'x']},
+    {'at': datetime.datetime(2026, 10, 18, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc),
+     'day': datetime.date(2026, 10, 18), 'price': decimal.Decimal('1.10'), 'ids': {1, 2}},
+    {1: 'int key', 'big': 2 ** 70},
+    1e16,
+    -1e-05,
+    {'color': '#e91e63', 'note': 'a:0.00001,b:[1e5]', 'small': [-0.00005, 0.0001, 0.00011]},
+]
+
+
+class TestFastJSONRenderer:
+    @pytest.mark.parametrize('data', PAYLOADS)
+    def test_output_matches_json_renderer(self, data):
+        assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+    def test_indent_uses_json_renderer(self):
+        data = {'a': [1, 2]}
+        context = {'indent': 2}
+        assert FastJSONRenderer().render(data, renderer_context=context) == JSONRenderer().render(data, renderer_context=context)
+
+    def test_fallback_without_orjson(self, monkeypatch):
+        monkeypatch.setattr(renderers, 'orjson', None)
+        assert FastJSONRenderer().render(PAYLOADS[1]) == JSONRenderer().render(PAYLOADS[1])
+
+    def test_nan_is_rejected(self):
+        with pytest.raises(ValueError):
+            JSONRenderer().render({'x': float('nan')})
+
+
+class TestFastJSONParser:
+    @pytest.mark.parametrize('raw', [
+        b'{"latitude": 55.921708, "name": "\\u0416", "list": [1, 2.5e-05, null, true]}',
+        b'{"id": 123456789012345678901234567890}',
+        '{"name": "Узел"}'.encode('utf-8'),
+    ])
+    def test_result_matches_json_parser(self, raw):
+        assert FastJSONParser().parse(io.BytesIO(raw)) == JSONParser().parse(io.BytesIO(raw))
+
+    @pytest.mark.parametrize('raw', [b'{"a": NaN}', b'{"a": ', b''])
+    def test_errors_match_json_parser(self, raw):
+        with pytest.raises(ParseError) as fast_error:
+            FastJSONParser().parse(io.BytesIO(raw))
+        with pytest.raises(ParseError) as json_error:
+            JSONParser().parse(io.BytesIO(raw))
+        assert fast_error.value.detail == json_error.value.detail
+
+    def test_fallback_without_orjson(self, monkeypatch):
+        monkeypatch.setattr(parsers, 'orjson', None)
+        assert FastJSONParser().parse(io.BytesIO(b'{"a": 1.5}')) == {'a': 1.5}
+
+
+@pytest.mark.django_db
+class TestMapDetailRendering:
+    def test_map_api_uses_fast_renderer(self):
+        user = UserFactory()
+        test_map = Map.objects.create(title='Render Map', owner=user)
+        test_map.nodes.add(Node.objects.create(name='A', latitude=1e-05, longitude=37.814387))
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        # GET карты целиком отдает закодированное представление из кеша
+        response = client.get(reverse('map-detail', kwargs={'pk': test_map.pk}))
+        assert response.content == JSONRenderer().render(response.json())
+
+        response = client.patch(
+            reverse('map-detail', kwargs={'pk': test_map.pk}),
+            b'{"new_nodes": [{"name": "B", "latitude": 2.5, "longitude": 3, "temp_id": 1}]}',
+            content_type='application/json',
+        )
+        assert response.status_code == 200
+        assert isinstance(response.accepted_renderer, FastJSONRenderer)
+        assert test_map.nodes.count() == 2
@@ -0,0 +1,111 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node
+from MainApp.representations import HIT, MISS, STALE, LOCK_KEY, cached_representation, get_cache
+
+
+@pytest.mark.django_db
+class TestMapRepresentationCache:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Popular Map', owner=user, is_published=True)
+        test_map.nodes.add(Node.objects.create(name='A', latitude=1, longitude=1))
+        return test_map
+
+    def _url(self, test_map):
+        return reverse('map-detail', kwargs={'pk': test_map.pk})
+
+    def _patch(self, client, test_map, title, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.patch(self._url(test_map), {'title': title}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        test_map.refresh_from_db()
+
+    def test_second_read_is_served_from_cache(self, client, test_map, django_assert_num_queries):
+        first = client.get(self._url(test_map))
+        assert first['Map-Cache'] == MISS
+        # Из базы читается только строка карты с версией
+        with django_assert_num_queries(3):
+            second = client.get(self._url(test_map))
+        assert second['Map-Cache'] == HIT
+        assert second.content == first.content
+        assert second['ETag'] == first['ETag'] == f'"v{test_map.version}"'
+
+        binary = client.get(self._url(test_map), HTTP_ACCEPT='application/msgpack')
+        assert binary['Map-Cache'] == MISS
+        assert binary['Content-Type'] == 'application/msgpack'
+        assert binary['ETag'] == f'"v{test_map.version}.msgpack"'
+
+    def test_update_serves_new_version(self, client, test_map, django_capture_on_commit_callbacks):
+        client.get(self._url(test_map))
+        self._patch(client, test_map, 'Renamed', django_capture_on_commit_callbacks)
+        response = client.get(self._url(test_map))
+        assert response['Map-Cache'] == MISS
+        assert response.json()['title'] == 'Renamed'
+
+    def test_stale_version_is_served_while_rebuilding(self, client, test_map, django_capture_on_commit_callbacks):
+        client.get(self._url(test_map))
+        old_version = test_map.version
+        self._patch(client, test_map, 'Renamed', django_capture_on_commit_callbacks)
+
+        # Новую версию уже строит другой запрос
+        get_cache().add(LOCK_KEY % {'map_id': test_map.id, 'format': 'json'}, test_map.version)
+        response = client.get(reverse('public-map', kwargs={'pk': test_map.pk}))
+        assert response['Map-Cache'] == STALE
+        assert response['ETag'] == f'"v{old_version}"'
+        assert 'Last-Modified' not in response
+        assert response.json()['title'] == 'Popular Map'
+
+    def test_owner_never_reads_stale_version(self, client, test_map, django_capture_on_commit_callbacks):
+        client.get(self._url(test_map))
+        self._patch(client, test_map, 'Renamed', django_capture_on_commit_callbacks)
+
+        # Пока новую версию строит другой запрос, редактор владельца
+        # получает записанную им версию, а не предыдущую
+        get_cache().add(LOCK_KEY % {'map_id': test_map.id, 'format': 'json'}, test_map.version)
+        response = client.get(self._url(test_map))
+        assert response['Map-Cache'] == MISS
+        assert response['ETag'] == f'"v{test_map.version}"'
+        assert response.json()['title'] == 'Renamed'
+
+    def test_unpublish_and_delete_drop_representations(self, client, user, test_map, django_capture_on_commit_callbacks):
+        client.get(self._url(test_map))
+        client.force_login(user)
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(reverse('unpublish_map', kwargs={'map_id': test_map.id}))
+        test_map.refresh_from_db()
+        get_cache().add(LOCK_KEY % {'map_id': test_map.id, 'format': 'json'}, test_map.version)
+        # Старое представление опубликованной карты не отдается даже при блокировке
+        assert client.get(self._url(test_map))['Map-Cache'] == MISS
+
+        test_map.delete()
+        assert get_cache().get(f'map_representation:{test_map.id}:json:latest') is None
+
+    def test_file_based_cache(self, settings, tmp_path, test_map):
+        settings.CACHES = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'representations': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': str(tmp_path),
+            },
+        }
+        settings.MAP_REPRESENTATION_CACHE = 'representations'
+        render = lambda: {'content': b'{}', 'content_type': 'application/json', 'etag': '"v1"'}
+        assert cached_representation(test_map, 'json', render)[1] == MISS
+        entry, state = cached_representation(test_map, 'json', render)
+        assert state == HIT
+        assert entry == dict(render(), version=test_map.version, key=entry['key'])
+        assert any(tmp_path.iterdir())
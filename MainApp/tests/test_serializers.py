@@ -1,5 +1,7 @@
 import pytest
-from MainApp.serializers import MapSerializer, NodeSerializer, EdgeSerializer
+from rest_framework.renderers import JSONRenderer
+from MainApp.serializers import MapSerializer, NodeSerializer, EdgeSerializer, MapReadSerializer
+from MainApp.renderers import FastJSONRenderer
 from MainApp.tests.factories import UserFactory, HashTagFactory
 from MainApp.models import Map, Node, Edge
 
@@ -29,6 +31,14 @@ class TestSerializers:
         node = serializer.save()
         assert node.name == data['name']
 
+    def test_node_serializer_version_is_read_only(self):
+        """Test NodeSerializer ignores a client-supplied version."""
+        data = {'name': 'Versioned Node', 'latitude': 1.0, 'longitude': 1.0, 'version': 99}
+        serializer = NodeSerializer(data=data)
+        assert serializer.is_valid(), serializer.errors
+        assert 'version' not in serializer.validated_data
+        assert serializer.save().version != 99
+
     def test_node_serializer_invalid_latitude(self):
         """Test NodeSerializer with invalid latitude."""
         data = {'name': 'Invalid Lat Node', 'latitude': 91.0, 'longitude': 1.0}
@@ -86,4 +96,40 @@ class TestSerializers:
         is_valid = serializer.is_valid()
         assert not is_valid, f"Serializer should be invalid due to missing title, but it was valid. Errors: {serializer.errors}"
         assert 'title' in serializer.errors, f"'title' should be in serializer errors, but errors are: {serializer.errors}"
-        assert 'owner' not in serializer.errors, f"'owner' should not be in serializer errors as it is read-only, but errors are: {serializer.errors}" 
\ No newline at end of file
+        assert 'owner' not in serializer.errors, f"'owner' should not be in serializer errors as it is read-only, but errors are: {serializer.errors}" 
+
+@pytest.mark.django_db
+class TestMapReadSerializer:
+    @pytest.fixture
+    def test_map(self):
+        user = UserFactory()
+        test_map = Map.objects.create(title='Read Map', owner=user, description='Описание "в кавычках"')
+        test_map.hashtags.add(HashTagFactory(), HashTagFactory())
+        nodes = [
+            Node.objects.create(name='A ', latitude=10.123456789, longitude=-11, temp_id=5),
+            Node.objects.create(name='Б', latitude=0, longitude=1e-7, description='', z_coordinate=2.5, version=3),
+            Node.objects.create(name='C', latitude=-90, longitude=180, description=None),
+        ]
+        test_map.nodes.add(*nodes)
+        test_map.edges.add(
+            Edge.objects.create(node1=nodes[0], node2=nodes[1], style={'color': '#FF0000', 'width': 5}),
+            Edge.objects.create(node1=nodes[1], node2=nodes[2], style={}, description='edge', temp_id=9),
+            Edge.objects.create(node1=nodes[2], node2=nodes[0], style=None),
+        )
+        return test_map
+
+    @pytest.mark.parametrize('renderer_class', [JSONRenderer, FastJSONRenderer])
+    def test_output_is_byte_identical(self, test_map, renderer_class):
+        renderer = renderer_class()
+        expected = renderer.render(MapSerializer(test_map).data)
+        assert renderer.render(MapReadSerializer(test_map).data) == expected
+
+    def test_empty_map_is_byte_identical(self):
+        test_map = Map.objects.create(title='Empty', owner=UserFactory())
+        renderer = JSONRenderer()
+        assert renderer.render(MapReadSerializer(test_map).data) == renderer.render(MapSerializer(test_map).data)
+
+    def test_nodes_and_edges_take_two_queries(self, test_map, django_assert_num_queries):
+        # Шапка карты (хештеги), узлы, ребра
+        with django_assert_num_queries(3):
+            MapReadSerializer(test_map).data
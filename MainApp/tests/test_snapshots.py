@@ -0,0 +1,96 @@
+import gzip
+import json
+import os
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+from django.urls import reverse
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node
+from MainApp.snapshots import read_manifest
+
+
+@pytest.mark.django_db
+class TestMapSnapshots:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Snapshot Map', owner=user)
+        test_map.nodes.add(Node.objects.create(name='A', latitude=55.75, longitude=37.6))
+        return test_map
+
+    def _path(self, settings, test_map, name):
+        return os.path.join(settings.MAP_SNAPSHOTS_ROOT, str(test_map.id), name)
+
+    def _build(self):
+        call_command('generate_map_snapshots', delay=0, stdout=open(os.devnull, 'w'))
+
+    def _publish(self, client, test_map, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(reverse('publish_map', kwargs={'map_id': test_map.id}))
+        # Публикация только ставит снимок в очередь
+        assert read_manifest(test_map.id) is None
+        self._build()
+        test_map.refresh_from_db()
+        return read_manifest(test_map.id)
+
+    def test_publish_writes_snapshot_used_by_view_page(self, client, test_map, settings, django_capture_on_commit_callbacks):
+        manifest = self._publish(client, test_map, django_capture_on_commit_callbacks)
+        assert manifest['version'] == test_map.version
+        name = f"{manifest['hash']}.json"
+        assert manifest['url'] == f'/media/snapshots/{test_map.id}/{name}'
+
+        with open(self._path(settings, test_map, name), 'rb') as snapshot:
+            content = snapshot.read()
+        with open(self._path(settings, test_map, name + '.gz'), 'rb') as snapshot:
+            assert gzip.decompress(snapshot.read()) == content
+        api = APIClient()
+        api.force_authenticate(user=test_map.owner)
+        assert json.loads(content) == api.get(reverse('map-detail', kwargs={'pk': test_map.pk})).json()
+
+        response = Client().get(reverse('view_map', kwargs={'map_id': test_map.id}))
+        assert f'data-url="{manifest["url"]}"' in response.content.decode()
+
+    def test_edit_switches_snapshot_and_unpublish_removes(self, client, test_map, user, settings,
+                                                        django_capture_on_commit_callbacks):
+        first = self._publish(client, test_map, django_capture_on_commit_callbacks)['hash']
+        api = APIClient()
+        api.force_authenticate(user=user)
+        for title in ('Second', 'Third'):
+            with django_capture_on_commit_callbacks(execute=True):
+                api.patch(reverse('map-detail', kwargs={'pk': test_map.pk}), {'title': title}, format='json')
+            self._build()
+        manifest = read_manifest(test_map.id)
+        assert manifest['hash'] != first
+        # Остаются текущий и предыдущий снимки
+        names = os.listdir(os.path.join(settings.MAP_SNAPSHOTS_ROOT, str(test_map.id)))
+        assert len({name.split('.')[0] for name in names if name != 'snapshot.json'}) == 2
+        assert not any(name.startswith(first) for name in names)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(reverse('unpublish_map', kwargs={'map_id': test_map.id}))
+        assert read_manifest(test_map.id) is None
+        assert not os.path.exists(os.path.join(settings.MAP_SNAPSHOTS_ROOT, str(test_map.id)))
+
+    def test_command_writes_missing_snapshots(self, test_map, settings):
+        Map.objects.filter(pk=test_map.pk).update(is_published=True)
+        call_command('generate_map_snapshots', all=True, stdout=open(os.devnull, 'w'))
+        assert read_manifest(test_map.id)['version'] == test_map.version
+
+    def test_view_page_falls_back_to_api_without_current_snapshot(self, client, test_map, django_capture_on_commit_callbacks):
+        self._publish(client, test_map, django_capture_on_commit_callbacks)
+        # Версия изменилась, снимок еще не записан
+        Map.objects.filter(pk=test_map.pk).update(version=test_map.version + 1)
+        response = Client().get(reverse('view_map', kwargs={'map_id': test_map.id}))
+        assert f'data-url="{reverse("public-map", kwargs={"pk": test_map.id})}"' in response.content.decode()
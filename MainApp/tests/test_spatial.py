@@ -0,0 +1,114 @@
+import random
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node, Edge
+from MainApp.spatial import MAX_GRID_RANGES, bbox_query, grid_cell, parse_bbox
+
+
+@pytest.mark.django_db
+class TestMapViewportQueries:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Spatial Map', owner=user)
+        rng = random.Random(16)
+        nodes = [
+            Node(name=str(i), latitude=round(rng.uniform(50, 60), 3), longitude=round(rng.uniform(30, 40), 3))
+            for i in range(300)
+        ]
+        # Узлы точно на границах окна и ячеек
+        nodes += [Node(name='edge', latitude=55.0, longitude=35.0), Node(name='corner', latitude=56.3, longitude=36.1)]
+        for node in nodes:
+            node.update_grid_cell()
+        test_map.nodes.add(*Node.objects.bulk_create(nodes))
+        return test_map
+
+    def _get(self, client, test_map, name, bbox):
+        return client.get(reverse(name, kwargs={'pk': test_map.pk}), {'bbox': bbox})
+
+    def assert_grid_cells_current(self, test_map):
+        for node_id, latitude, longitude, cell in test_map.nodes.values_list('id', 'latitude', 'longitude', 'grid_cell'):
+            assert cell == grid_cell(latitude, longitude), node_id
+
+    def test_nodes_in_bbox(self, client, test_map):
+        for bbox in ['35,55,36.1,56.3', '30.5,50.5,30.9,51', '0,0,1,1', '-180,-90,180,90']:
+            min_lon, min_lat, max_lon, max_lat = parse_bbox(bbox)
+            expected = set(
+                test_map.nodes.filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+                .values_list('id', flat=True)
+            )
+            response = self._get(client, test_map, 'map-nodes', bbox)
+            assert response.status_code == status.HTTP_200_OK
+            assert {node['id'] for node in response.data} == expected
+
+    def test_small_bbox_uses_grid_cell(self, client, test_map):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._get(client, test_map, 'map-nodes', '35,55,35.5,55.5')
+        assert response.data
+        assert any('grid_cell' in query['sql'] for query in queries.captured_queries)
+        assert set(response.data[0]) == {'id', 'name', 'latitude', 'longitude', 'description', 'z_coordinate', 'version', 'temp_id'}
+
+    def test_large_bbox_uses_grid_cell_ranges(self, client, test_map):
+        # Окно на 200 строк сетки: строки объединяются в полосы
+        for bbox in ['30,45,40,65', '-180,45,180,65']:
+            sql = str(Node.objects.filter(bbox_query(parse_bbox(bbox))).query)
+            assert 0 < sql.count('"grid_cell" BETWEEN') <= MAX_GRID_RANGES
+            min_lon, min_lat, max_lon, max_lat = parse_bbox(bbox)
+            expected = set(
+                test_map.nodes.filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+                .values_list('id', flat=True)
+            )
+            assert expected
+            assert {node['id'] for node in self._get(client, test_map, 'map-nodes', bbox).data} == expected
+        # Окно на всю ширину карты - один диапазон
+        assert str(Node.objects.filter(bbox_query(parse_bbox('-180,45,180,65'))).query).count('"grid_cell" BETWEEN') == 1
+
+    def test_edges_touching_bbox(self, client, user):
+        test_map = Map.objects.create(title='Edges', owner=user)
+        west = Node.objects.create(name='W', latitude=10, longitude=0)
+        east = Node.objects.create(name='E', latitude=10, longitude=20)
+        far = Node.objects.create(name='F', latitude=40, longitude=40)
+        test_map.nodes.add(west, east, far)
+        crossing = Edge.objects.create(node1=west, node2=east)
+        outside = Edge.objects.create(node1=east, node2=far)
+        test_map.edges.add(crossing, outside)
+
+        response = self._get(client, test_map, 'map-edges', '9,9,11,11')
+        assert [edge['id'] for edge in response.data] == [crossing.id]
+        response = self._get(client, test_map, 'map-edges', '19,9,41,41')
+        assert {edge['id'] for edge in response.data} == {crossing.id, outside.id}
+
+    def test_invalid_bbox(self, client, test_map):
+        for bbox in ['1,2,3', '3,0,1,1', 'a,b,c,d', 'nan,0,1,1']:
+            assert self._get(client, test_map, 'map-nodes', bbox).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_grid_cell_follows_writes(self, client, test_map):
+        node = test_map.nodes.first()
+        response = client.patch(reverse('map-detail', kwargs={'pk': test_map.pk}), {
+            'new_nodes': [{'name': 'New', 'latitude': -33.9, 'longitude': 151.2}],
+            'changed_nodes': [{'id': node.id, 'latitude': 1.05, 'longitude': -1.05}],
+        }, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        response = client.post(reverse('map-bulk-edit', kwargs={'pk': test_map.pk}), {
+            'selector': {'bbox': [50, 30, 60, 40]},
+            'operations': [{'type': 'rotate', 'angle': 45, 'center_latitude': 55, 'center_longitude': 35}],
+        }, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        node = Node.objects.create(name='Saved', latitude=89.99, longitude=180)
+        assert node.grid_cell == grid_cell(89.99, 180)
+        self.assert_grid_cells_current(test_map)
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node, Edge
+from MainApp.renderers import NDJSONRenderer
+from django.db import connection
+from MainApp.streaming import map_records, stream_map
+
+NDJSON = 'application/x-ndjson'
+
+
+@pytest.mark.django_db
+class TestMapNDJSONExport:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Streamed Map', owner=user)
+        nodes = Node.objects.bulk_create(Node(name=f'N{i}', latitude=i, longitude=-i) for i in range(30))
+        test_map.nodes.add(*nodes)
+        test_map.edges.add(*Edge.objects.bulk_create(Edge(node1=nodes[i], node2=nodes[i + 1]) for i in range(29)))
+        return test_map
+
+    def _url(self, test_map):
+        return reverse('map-detail', kwargs={'pk': test_map.pk})
+
+    def test_stream_matches_full_map(self, client, test_map, django_assert_num_queries):
+        full = client.get(self._url(test_map)).json()
+        # Узлы и ребра читаются из базы только при чтении потока
+        with django_assert_num_queries(3):
+            response = client.get(self._url(test_map), HTTP_ACCEPT=NDJSON)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        assert response['Content-Type'] == NDJSON
+        assert response['ETag'] == f'"v{test_map.version}.ndjson"'
+
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        header, *rows, end = records
+        assert header['type'] == 'map' and header['title'] == 'Streamed Map'
+        assert [row.pop('type') for row in rows] == ['node'] * 30 + ['edge'] * 29
+        assert rows[:30] == sorted(full['nodes'], key=lambda node: node['id'])
+        assert rows[30:] == sorted(full['edges'], key=lambda edge: edge['id'])
+        assert end == {'type': 'end', 'version': test_map.version, 'nodes': 30, 'edges': 29}
+
+        response = client.get(self._url(test_map), HTTP_ACCEPT=NDJSON, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_header_is_sent_first_and_rows_in_blocks(self, test_map, monkeypatch):
+        monkeypatch.setattr('MainApp.streaming.BLOCK_RECORDS', 10)
+        chunks = list(stream_map(test_map, NDJSONRenderer(), chunk_size=7))
+        assert json.loads(chunks[0])['type'] == 'map'
+        assert len(chunks) == 1 + 6
+        assert all(chunk.endswith(b'\n') for chunk in chunks)
+        assert sum(chunk.count(b'\n') for chunk in chunks) == 1 + 30 + 29 + 1
+
+    @pytest.mark.django_db(transaction=True)
+    def test_stream_reads_one_snapshot(self, test_map):
+        stale = Map.objects.get(pk=test_map.pk)
+        test_map.bump_version()
+        records = map_records(stale, chunk_size=7)
+        header = next(records)
+        # Записи читаются в одной транзакции, начатой до чтения карты
+        assert connection.in_atomic_block
+        assert header['version'] == test_map.version
+        *rows, end = records
+        assert not connection.in_atomic_block
+        assert end == {'type': 'end', 'version': test_map.version, 'nodes': 30, 'edges': 29}
+
+        test_map.delete()
+        assert list(stream_map(stale, NDJSONRenderer())) == []
+
+    def test_block_encoding_matches_record_encoding(self):
+        renderer = NDJSONRenderer()
+        for records in [
+            [{'id': 1, 'name': 'A\u2028B', 'latitude': 55.75}, {'id': 2, 'name': None}],
+            [{'id': 1, 'latitude': 1e-7}, {'id': 2, 'longitude': 1e16}],
+        ]:
+            assert renderer.render_lines(records) == b''.join(renderer.render(record) for record in records)
@@ -0,0 +1,134 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map
+from MainApp.throttling import MapWriteThrottle
+
+RATES = {
+    'user': {'capacity': 10, 'rate': 1},
+    'map': {'capacity': 6, 'rate': 0.5},
+}
+
+@pytest.mark.django_db
+class TestMapWriteThrottle:
+    @pytest.fixture(autouse=True)
+    def clock(self, monkeypatch, settings):
+        settings.MAP_WRITE_THROTTLE_RATES = RATES
+        now = [1000.0]
+        monkeypatch.setattr(MapWriteThrottle, 'timer', lambda self: now[0])
+        return now
+
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    def _map(self, user):
+        return Map.objects.create(title='Throttled Map', owner=user)
+
+    def _patch(self, client, test_map, nodes=0):
+        return client.patch(
+            reverse('map-detail', kwargs={'pk': test_map.pk}),
+            {'new_nodes': [{'name': f'N{i}', 'latitude': 1, 'longitude': 1} for i in range(nodes)]},
+            format='json'
+        )
+
+    def test_cost_is_charged_per_operation(self, client, user):
+        test_map = self._map(user)
+        assert self._patch(client, test_map, nodes=4).status_code == status.HTTP_200_OK
+        response = self._patch(client, test_map, nodes=1)
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        # В корзине карты остался 1 токен из 6, запросу нужно 2: ждать 2 секунды
+        assert response['Retry-After'] == '2'
+
+    def test_bucket_refills_over_time(self, client, user, clock):
+        test_map = self._map(user)
+        assert self._patch(client, test_map, nodes=5).status_code == status.HTTP_200_OK
+        assert self._patch(client, test_map).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        clock[0] += 2
+        assert self._patch(client, test_map).status_code == status.HTTP_200_OK
+
+    def test_user_bucket_spans_maps(self, client, user):
+        assert self._patch(client, self._map(user), nodes=5).status_code == status.HTTP_200_OK
+        assert self._patch(client, self._map(user), nodes=3).status_code == status.HTTP_200_OK
+        response = self._patch(client, self._map(user), nodes=1)
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    def test_heavy_editor_does_not_block_other_users(self, client, user):
+        assert self._patch(client, self._map(user), nodes=9).status_code == status.HTTP_200_OK
+        assert self._patch(client, self._map(user)).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+        other = UserFactory()
+        other_client = APIClient()
+        other_client.force_authenticate(user=other)
+        assert self._patch(other_client, self._map(other), nodes=3).status_code == status.HTTP_200_OK
+
+    def test_oversized_request_is_allowed_on_full_bucket(self, client, user, clock):
+        test_map = self._map(user)
+        assert self._patch(client, test_map, nodes=20).status_code == status.HTTP_200_OK
+        response = self._patch(client, test_map)
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(response['Retry-After']) > 10
+
+    def test_reads_are_not_throttled(self, client, user):
+        test_map = self._map(user)
+        self._patch(client, test_map, nodes=5)
+        for _ in range(3):
+            assert client.get(reverse('map-detail', kwargs={'pk': test_map.pk})).status_code == status.HTTP_200_OK
+
+    def test_replay_is_not_charged(self, client, user):
+        test_map = self._map(user)
+        url = reverse('map-detail', kwargs={'pk': test_map.pk})
+        payload = {'new_nodes': [{'name': f'N{i}', 'latitude': 1, 'longitude': 1} for i in range(4)]}
+        response = client.patch(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        assert response.status_code == status.HTTP_200_OK
+        for _ in range(3):
+            response = client.patch(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+            assert response.status_code == status.HTTP_200_OK
+            assert response['Idempotent-Replayed'] == 'true'
+        # Повторы не списывались: в корзине карты остался 1 токен
+        assert self._patch(client, test_map).status_code == status.HTTP_200_OK
+
+    def test_operations_and_autosave_are_throttled(self, client, user):
+        test_map = self._map(user)
+        operations = [
+            {'seq': i, 'op_type': 'add_node', 'data': {'temp_id': i, 'name': f'N{i}', 'latitude': 1, 'longitude': 1}}
+            for i in range(1, 5)
+        ]
+        response = client.post(
+            reverse('map-operations', kwargs={'pk': test_map.pk}), {'operations': operations}, format='json'
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        response = client.post(
+            reverse('map-autosave', kwargs={'pk': test_map.pk}),
+            {'new_nodes': [{'name': 'A', 'latitude': 1, 'longitude': 1}]},
+            format='json'
+        )
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        response = client.post(reverse('map-autosave-flush', kwargs={'pk': test_map.pk}))
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_local_cache_disables_throttle(self, client, user, settings):
+        settings.MAP_WRITE_THROTTLE_CACHE = 'default'
+        test_map = self._map(user)
+        for _ in range(3):
+            assert self._patch(client, test_map, nodes=5).status_code == status.HTTP_200_OK
+
+    def test_other_users_do_not_drain_owner_budget(self, client, user):
+        test_map = self._map(user)
+        other_client = APIClient()
+        other_client.force_authenticate(user=UserFactory())
+        # Чужие запросы дороже, чем осталось бы в корзине карты после них
+        for _ in range(2):
+            assert self._patch(other_client, test_map, nodes=3).status_code == status.HTTP_403_FORBIDDEN
+        assert self._patch(APIClient(), test_map, nodes=5).status_code in (
+            status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN,
+        )
+        assert self._patch(client, test_map, nodes=5).status_code == status.HTTP_200_OK
@@ -0,0 +1,179 @@
+import json
+import os
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+from django.urls import reverse
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node, Edge, MapRebuild
+from MainApp.serializers import MapReadSerializer
+from MainApp.spatial import mercator
+from MainApp.tiles import EDGE_BUFFER, clip_segment, generate_tiles, read_manifest, segment_tiles
+
+
+def decode(tiles):
+    return {key: json.loads(content)['features'] for key, content in tiles.items()}
+
+
+@pytest.mark.django_db
+class TestMapTiles:
+    @pytest.fixture(autouse=True)
+    def tiles_root(self, settings, tmp_path):
+        settings.MAP_TILES_ROOT = str(tmp_path)
+        settings.MAP_TILES_MAX_ZOOM = 6
+        return tmp_path
+
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Tiles Map', owner=user)
+        nodes = [
+            Node.objects.create(name='A', latitude=55.75, longitude=37.6),
+            Node.objects.create(name='B', latitude=55.7501, longitude=37.6001),
+            Node.objects.create(name='C', latitude=55.0, longitude=82.9),
+        ]
+        test_map.nodes.add(*nodes)
+        test_map.edges.add(
+            Edge.objects.create(node1=nodes[0], node2=nodes[1]),
+            Edge.objects.create(node1=nodes[1], node2=nodes[2]),
+        )
+        return test_map
+
+    def _build(self):
+        call_command('generate_map_tiles', delay=0, stdout=open(os.devnull, 'w'))
+
+    def _rows(self, test_map):
+        return MapReadSerializer.node_rows(test_map.nodes.all()), MapReadSerializer.edge_rows(test_map.edges.all())
+
+    def test_segment_tiles_are_connected(self):
+        tiles = segment_tiles((0.5, 0.5), (3.5, 1.5))
+        assert tiles[0] == (0, 0) and tiles[-1] == (3, 1)
+        assert all(abs(x1 - x2) + abs(y1 - y2) == 1 for (x1, y1), (x2, y2) in zip(tiles, tiles[1:]))
+        assert segment_tiles((2.5, 2.5), (2.7, 2.1)) == [(2, 2)]
+
+    def test_simplification_by_zoom(self, test_map):
+        tiles = decode(generate_tiles(*self._rows(test_map), max_zoom=6))
+        world = tiles[(0, 0, 0)]
+        points = [feature for feature in world if feature['geometry']['type'] == 'Point']
+        lines = [feature for feature in world if feature['geometry']['type'] == 'LineString']
+        # A и B сливаются в один пиксель, ребро между ними короче пикселя
+        assert sorted(point['properties']['count'] for point in points) == [1, 2]
+        assert len(lines) == 1
+        assert world[0]['geometry']['coordinates'] == [37.6, 55.8]
+
+        # Длинное ребро есть во всех тайлах по пути от Москвы до Новосибирска
+        line_tiles = {key for key, features in tiles.items() if key[0] == 6 and any(
+            feature['geometry']['type'] == 'LineString' for feature in features)}
+        assert len(line_tiles) > 2
+        assert sum(len(features) for key, features in tiles.items() if key[0] == 6) > 3
+
+    def test_long_edge_is_clipped_per_tile(self, test_map):
+        tiles = decode(generate_tiles(*self._rows(test_map), max_zoom=6))
+        scale = 1 << 6
+        lines = {key: feature for key, features in tiles.items() if key[0] == 6
+                 for feature in features if feature['geometry']['type'] == 'LineString'}
+        assert len(lines) > 2
+        for (zoom, x, y), feature in lines.items():
+            # В тайле только часть ребра внутри тайла с запасом
+            for longitude, latitude in feature['geometry']['coordinates']:
+                px, py = mercator(latitude, longitude)
+                assert x - EDGE_BUFFER - 0.01 <= px * scale <= x + 1 + EDGE_BUFFER + 0.01
+                assert y - EDGE_BUFFER - 0.01 <= py * scale <= y + 1 + EDGE_BUFFER + 0.01
+        # Концы ребра в крайних тайлах совпадают с узлами (с округлением уровня)
+        ends = [coordinate for feature in lines.values() for coordinate in feature['geometry']['coordinates']]
+        assert [37.6, 55.75] in ends and [82.9, 55.0] in ends
+
+        assert clip_segment((0.5, 0.5), (2.5, 0.5), (1, 0)) == pytest.approx((0.25 - EDGE_BUFFER / 2, 0.75 + EDGE_BUFFER / 2))
+        assert clip_segment((0.5, 0.5), (0.5, 0.9), (1, 0)) is None
+
+    def test_publish_writes_tiles_and_unpublish_removes(self, test_map, user, tiles_root, django_capture_on_commit_callbacks):
+        client = Client()
+        client.force_login(user)
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(reverse('publish_map', kwargs={'map_id': test_map.id}))
+        # Публикация только ставит тайлы в очередь
+        assert read_manifest(test_map.id) is None
+        self._build()
+        test_map.refresh_from_db()
+        manifest = read_manifest(test_map.id)
+        assert manifest['version'] == test_map.version
+        assert manifest['tiles'] == [f"/tiles/{test_map.id}/{manifest['hash']}/{{z}}/{{x}}/{{y}}.json"]
+        assert manifest['bounds'] == [37.6, 55.0, 82.9, 55.7501]
+        with open(tiles_root / str(test_map.id) / manifest['hash'] / '0' / '0' / '0.json') as tile:
+            assert json.load(tile)['type'] == 'FeatureCollection'
+
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(reverse('unpublish_map', kwargs={'map_id': test_map.id}))
+        assert not os.path.exists(tiles_root / str(test_map.id))
+
+    def test_update_of_published_map_switches_tile_set(self, test_map, user, tiles_root, django_capture_on_commit_callbacks):
+        test_map.is_published = True
+        test_map.save()
+        call_command('generate_map_tiles', all=True, stdout=open(os.devnull, 'w'))
+        first = read_manifest(test_map.id)['hash']
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        for latitude in (10, 20):
+            with django_capture_on_commit_callbacks(execute=True):
+                response = client.patch(reverse('map-detail', kwargs={'pk': test_map.pk}), {
+                    'changed_nodes': [{'id': test_map.nodes.get(name='C').id, 'latitude': latitude}],
+                }, format='json')
+            assert response.status_code == 200
+            self._build()
+        manifest = read_manifest(test_map.id)
+        assert manifest['hash'] != first
+        # Остаются текущий и предыдущий наборы
+        assert len(os.listdir(tiles_root / str(test_map.id))) == 3
+        assert first not in os.listdir(tiles_root / str(test_map.id))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            test_map.delete()
+        assert not os.path.exists(tiles_root / str(test_map.id))
+
+    def test_saves_in_a_row_build_tiles_once(self, test_map, user, settings, django_capture_on_commit_callbacks,
+                                             monkeypatch):
+        test_map.is_published = True
+        test_map.save()
+        built = []
+        monkeypatch.setattr('MainApp.tiles.publish_tiles', lambda map_instance: built.append(map_instance.version))
+        client = APIClient()
+        client.force_authenticate(user=user)
+        for latitude in (10, 20, 30):
+            with django_capture_on_commit_callbacks(execute=True):
+                client.patch(reverse('map-detail', kwargs={'pk': test_map.pk}), {
+                    'changed_nodes': [{'id': test_map.nodes.get(name='C').id, 'latitude': latitude}],
+                }, format='json')
+        assert MapRebuild.objects.filter(map=test_map, kind=MapRebuild.TILES).count() == 1
+
+        # Карта менялась только что: построение откладывается
+        call_command('generate_map_tiles', stdout=open(os.devnull, 'w'))
+        assert built == []
+        # Непрерывно меняющаяся карта строится не позже MAP_REBUILD_MAX_DELAY
+        settings.MAP_REBUILD_MAX_DELAY = 0
+        call_command('generate_map_tiles', stdout=open(os.devnull, 'w'))
+        test_map.refresh_from_db()
+        assert built == [test_map.version]
+        assert not MapRebuild.objects.filter(kind=MapRebuild.TILES).exists()
+
+    def test_receiver_error_does_not_fail_committed_save(self, test_map, user, django_capture_on_commit_callbacks,
+                                                          monkeypatch):
+        test_map.is_published = True
+        test_map.save()
+
+        def broken(map_id, kind):
+            raise RuntimeError('queue is down')
+
+        monkeypatch.setattr('MainApp.tiles.request_rebuild', broken)
+        client = APIClient()
+        client.force_authenticate(user=user)
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.patch(reverse('map-detail', kwargs={'pk': test_map.pk}), {'title': 'New'}, format='json')
+        assert response.status_code == 200
+        test_map.refresh_from_db()
+        assert test_map.title == 'New'
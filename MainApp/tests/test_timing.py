@@ -0,0 +1,86 @@
+import logging
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node
+from MainApp.timing import RequestTimer
+
+@pytest.mark.django_db
+class TestMapSaveTiming:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        return Map.objects.create(title='Timed Map', owner=user)
+
+    def _patch(self, client, test_map):
+        return client.patch(
+            reverse('map-detail', kwargs={'pk': test_map.pk}),
+            {
+                'new_nodes': [
+                    {'name': 'A', 'latitude': 1, 'longitude': 1, 'temp_id': 1},
+                    {'name': 'B', 'latitude': 2, 'longitude': 2, 'temp_id': 2},
+                ],
+                'new_edges': [{'node1_temp_id': 1, 'node2_temp_id': 2}],
+            },
+            format='json'
+        )
+
+    def test_stages_are_logged(self, client, test_map, caplog):
+        with caplog.at_level(logging.INFO, logger='MainApp.timing'):
+            response = self._patch(client, test_map)
+        assert response.status_code == status.HTTP_200_OK
+        records = [r.timing for r in caplog.records if hasattr(r, 'timing')]
+        assert len(records) == 1
+        record = records[0]
+        assert record['event'] == 'map_update'
+        assert (record['method'], record['map_id'], record['status']) == ('PATCH', test_map.pk, 200)
+        assert {'load', 'validate', 'save', 'validate_items', 'create_nodes', 'create_edges', 'serialize'} <= set(record['stages'])
+        ms, queries = record['stages']['create_nodes']
+        assert ms >= 0 and queries >= 2
+        assert record['queries'] >= sum(record['stages'][name][1] for name in ('load', 'save', 'serialize'))
+
+    def test_server_timing_header(self, client, test_map, settings):
+        settings.MAP_SERVER_TIMING = True
+        response = self._patch(client, test_map)
+        header = response['Server-Timing']
+        assert 'create_nodes;dur=' in header
+        assert header.split(', ')[-1].startswith('total;dur=')
+
+    def test_server_timing_is_optional(self, client, test_map, settings):
+        settings.MAP_SERVER_TIMING = False
+        assert 'Server-Timing' not in self._patch(client, test_map)
+
+    def test_span_counts_queries(self):
+        with RequestTimer('test') as timer:
+            with timer.span('outer'):
+                Node.objects.count()
+                with timer.span('inner'):
+                    Node.objects.count()
+        assert [(name, queries) for name, _, queries in timer.spans] == [('inner', 1), ('outer', 2)]
+        assert timer.record()['queries'] == 2
+
+    def test_repeated_spans_are_summed(self):
+        with RequestTimer('test') as timer:
+            for _ in range(3):
+                with timer.span('write'):
+                    Node.objects.count()
+            with timer.span('load'):
+                Node.objects.count()
+        record = timer.record()
+        assert list(record['stages']) == ['write', 'load']
+        assert record['stages']['write'][1] == 3
+        assert record['stages']['write'][0] == round(sum(ms for name, ms, _ in timer.spans if name == 'write'), 2)
+        header = timer.server_timing()
+        assert header.count('write;') == 1 and 'desc="3 q"' in header
@@ -0,0 +1,140 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from MainApp.tests.factories import UserFactory
+from MainApp.models import Map, Node, Edge
+from MainApp.transforms import compose, operation_matrix
+
+@pytest.mark.django_db
+class TestMapBulkEdit:
+    @pytest.fixture
+    def user(self):
+        return UserFactory()
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    @pytest.fixture
+    def test_map(self, user):
+        test_map = Map.objects.create(title='Bulk Map', owner=user)
+        nodes = [
+            Node.objects.create(name='A', latitude=10, longitude=10),
+            Node.objects.create(name='B', latitude=10, longitude=20),
+            Node.objects.create(name='Far', latitude=50, longitude=50),
+        ]
+        test_map.nodes.add(*nodes)
+        test_map.edges.add(
+            Edge.objects.create(node1=nodes[0], node2=nodes[1]),
+            Edge.objects.create(node1=nodes[1], node2=nodes[2]),
+        )
+        return test_map
+
+    def _post(self, client, test_map, selector, operations, **headers):
+        return client.post(
+            reverse('map-bulk-edit', kwargs={'pk': test_map.pk}),
+            {'selector': selector, 'operations': operations},
+            format='json',
+            **headers
+        )
+
+    def _coords(self, test_map):
+        return {name: (lat, lng) for name, lat, lng in test_map.nodes.values_list('name', 'latitude', 'longitude')}
+
+    def test_translate_bbox_in_one_update(self, client, test_map):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post(client, test_map, {'bbox': [0, 0, 20, 30]}, [
+                {'type': 'translate', 'delta_latitude': 1, 'delta_longitude': -2},
+            ])
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['nodes_updated'] == 2
+        node_updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "MainApp_node"')]
+        assert len(node_updates) == 1
+        coords = self._coords(test_map)
+        assert coords['A'] == (11, 8) and coords['B'] == (11, 18) and coords['Far'] == (50, 50)
+
+    def test_operations_are_composed(self, client, test_map):
+        response = self._post(client, test_map, {'node_ids': list(test_map.nodes.filter(name__in=['A', 'B']).values_list('id', flat=True))}, [
+            {'type': 'scale', 'factor': 2, 'center_latitude': 10, 'center_longitude': 10},
+            {'type': 'translate', 'delta_latitude': 5},
+        ])
+        assert response.status_code == status.HTTP_200_OK
+        coords = self._coords(test_map)
+        assert coords == {'A': (15, 10), 'B': (15, 30), 'Far': (50, 50)}
+
+    def test_rotation_about_center(self, client, test_map):
+        node = test_map.nodes.get(name='B')
+        response = self._post(client, test_map, {'node_ids': [node.id]}, [
+            {'type': 'rotate', 'angle': 90, 'center_latitude': 0, 'center_longitude': 10},
+        ])
+        assert response.status_code == status.HTTP_200_OK
+        node.refresh_from_db()
+        assert node.latitude == pytest.approx(10)
+        assert node.longitude == pytest.approx(0)
+
+    def test_out_of_bounds_is_rejected(self, client, test_map):
+        response = self._post(client, test_map, {'node_filter': {'name': 'Far'}}, [
+            {'type': 'translate', 'delta_latitude': 45},
+        ])
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert self._coords(test_map)['Far'] == (50, 50)
+        test_map.refresh_from_db()
+        assert test_map.version == 0
+
+    def test_set_style_by_node_selection(self, client, test_map):
+        style = {'color': '#FF0000', 'width': 5, 'lineStyle': 'dashed'}
+        response = self._post(client, test_map, {'bbox': [0, 0, 20, 30]}, [{'type': 'set_style', 'style': style}])
+        assert response.data['edges_updated'] == 1
+        inner, outer = test_map.edges.order_by('id')
+        assert inner.style == style and outer.style != style
+
+        response = self._post(client, test_map, {'edge_filter': {'color': '#FF0000'}}, [
+            {'type': 'set_style', 'style': {'color': '#000000'}},
+        ])
+        assert response.data['edges_updated'] == 1
+
+    def test_changes_bump_version_once(self, client, test_map):
+        response = self._post(client, test_map, {'edge_ids': list(test_map.edges.values_list('id', flat=True))}, [
+            {'type': 'translate', 'delta_longitude': 1},
+            {'type': 'set_style', 'style': {'color': '#000000'}},
+        ])
+        assert response.data == {'nodes_updated': 3, 'edges_updated': 2, 'version': 1}
+        assert response['ETag'] == '"v1"'
+        delta = client.get(reverse('map-detail', kwargs={'pk': test_map.pk}), {'since': 0}).data
+        assert len(delta['nodes']) == 3 and len(delta['edges']) == 2
+
+    def test_stale_if_match_is_rejected(self, client, test_map):
+        response = self._post(client, test_map, {'bbox': [0, 0, 90, 90]}, [
+            {'type': 'translate', 'delta_latitude': 1},
+        ], HTTP_IF_MATCH='"v7"')
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+        assert self._coords(test_map)['A'] == (10, 10)
+
+    @pytest.mark.parametrize('selector, operations', [
+        ({}, [{'type': 'translate', 'delta_latitude': 1}]),
+        ({'bbox': [0, 0, 1, 1], 'node_ids': [1]}, [{'type': 'translate', 'delta_latitude': 1}]),
+        ({'node_filter': {'latitude': 1}}, [{'type': 'translate', 'delta_latitude': 1}]),
+        ({'bbox': [0, 0, 1, 1]}, [{'type': 'rotate', 'angle': 10}]),
+        ({'bbox': [0, 0, 1, 1]}, [{'type': 'scale', 'factor': 0, 'center_latitude': 0, 'center_longitude': 0}]),
+        ({'bbox': [0, 0, 1, 1]}, [{'type': 'set_style', 'style': {'width': 50}}]),
+    ])
+    def test_invalid_requests(self, client, test_map, selector, operations):
+        response = self._post(client, test_map, selector, operations)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_compose_matches_sequential_application(self):
+        first = operation_matrix({'type': 'rotate', 'angle': 30, 'center_latitude': 40, 'center_longitude': 10})
+        second = operation_matrix({'type': 'translate', 'delta_latitude': 1, 'delta_longitude': 2})
+
+        def apply(matrix, point):
+            a, b, c, d, e, f = matrix
+            lng, lat = point
+            return (a * lng + b * lat + c, d * lng + e * lat + f)
+
+        expected = apply(second, apply(first, (12, 41)))
+        assert apply(compose(first, second), (12, 41)) == pytest.approx(expected)
@@ -0,0 +1,87 @@
+import pytest
+from rest_framework import serializers
+from MainApp.serializers import EdgeWriteSerializer, NodeSerializer
+from MainApp.validators import (
+    validate_node, validate_new_nodes, validate_changed_nodes, validate_new_edges, validate_changed_edges,
+)
+
+NODE_CASES = [
+    {'name': 'A', 'latitude': 1, 'longitude': 2},
+    {'name': '  A  ', 'latitude': '1.5', 'longitude': -2, 'description': None, 'z_coordinate': None},
+    {'name': 'A', 'latitude': 91, 'longitude': 181},
+    {'name': '', 'latitude': 'abc', 'longitude': float('inf')},
+    {'name': 'x' * 101, 'latitude': None, 'longitude': True},
+    {'name': ['A'], 'latitude': [], 'longitude': {}},
+    {'name': 'A\x00', 'latitude': 0, 'longitude': 0, 'description': '   '},
+    {'latitude': 0},
+    {'name': 5, 'latitude': 0, 'longitude': 0, 'temp_id': '7.0'},
+    {'name': 'A', 'latitude': 0, 'longitude': 0, 'temp_id': 'x'},
+    {'name': None, 'latitude': 0, 'longitude': 0, 'z_coordinate': '1e400'},
+    'not a dict',
+]
+
+
+class TestNodeValidatorParity:
+    @pytest.mark.parametrize('data', NODE_CASES)
+    @pytest.mark.parametrize('partial', [False, True])
+    def test_matches_node_serializer(self, data, partial):
+        serializer = NodeSerializer(data=data, partial=partial)
+        values, errors = validate_node(data, partial=partial)
+        if serializer.is_valid():
+            assert errors == {}
+            assert values == dict(serializer.validated_data)
+        else:
+            assert errors == serializer.errors
+            assert {
+                key: [detail.code for detail in details] for key, details in errors.items()
+            } == {
+                key: [detail.code for detail in details] for key, details in serializer.errors.items()
+            }
+
+
+class TestPayloadValidators:
+    def test_new_nodes_produce_plain_dicts(self):
+        validated = validate_new_nodes([
+            {'name': 'A', 'latitude': '1', 'longitude': 2, 'temp_id': 3, 'id': 99, 'version': 5},
+        ])
+        assert validated == [(3, {'name': 'A', 'latitude': 1.0, 'longitude': 2.0})]
+        assert type(validated[0][1]) is dict
+
+    def test_first_invalid_node_is_reported(self):
+        with pytest.raises(serializers.ValidationError) as error:
+            validate_new_nodes([
+                {'name': 'A', 'latitude': 1, 'longitude': 1},
+                {'name': 'B', 'latitude': 100, 'longitude': 1},
+            ])
+        assert error.value.detail == {'new_nodes': {'latitude': ['Широта должна быть между -90 и 90']}}
+
+    def test_changed_nodes_skip_missing_ids(self):
+        assert validate_changed_nodes([{'latitude': 1}, {'id': '4', 'latitude': 2}]) == {4: {'latitude': 2.0}}
+
+    def test_edges_resolve_and_reject_self_loops(self):
+        resolve = lambda edge_data, key: int(edge_data[key]) if key in edge_data else None
+        assert validate_new_edges([{'node1': '1', 'node2': 2}, {'node1': 1}], resolve) == [
+            {'node1': 1, 'node2': 2, 'description': '', 'style': {'color': '#1DA1F2', 'width': 3, 'lineStyle': 'solid'}},
+        ]
+        with pytest.raises(serializers.ValidationError):
+            validate_changed_edges([{'id': 5, 'node1': 3, 'node2': '3'}], resolve)
+
+    @pytest.mark.parametrize('fields', [
+        {'description': ['text']},
+        {'description': {'text': 1}},
+        {'style': 'red'},
+        {'style': {'color': 1}},
+        {'style': {'width': 20}},
+        {'style': {'width': 'wide'}},
+        {'style': {'lineStyle': 'wavy'}},
+    ])
+    def test_edge_errors_match_edge_serializer(self, fields):
+        serializer = EdgeWriteSerializer(data={'node1': 1, 'node2': 2, **fields})
+        assert not serializer.is_valid()
+        resolve = lambda edge_data, key: edge_data[key]
+        with pytest.raises(serializers.ValidationError) as error:
+            validate_new_edges([{'node1': 1, 'node2': 2, **fields}], resolve)
+        assert error.value.detail == {'new_edges': serializer.errors}
+        with pytest.raises(serializers.ValidationError) as error:
+            validate_changed_edges([{'id': 5, **fields}], resolve)
+        assert error.value.detail == {'changed_edges': serializer.errors}
@@ -0,0 +1,163 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.throttling import BaseThrottle
+
+from .idempotency import is_replay, request_fingerprint
+from .models import Map
+
+logger = logging.getLogger(__name__)
+
+# Емкость корзины (операций) и скорость пополнения (операций в секунду)
+DEFAULT_RATES = {
+    'user': {'capacity': 20000, 'rate': 200},
+    'map': {'capacity': 10000, 'rate': 100},
+}
+
+DEFAULT_CACHE = 'shared'
+
+# Кеши, которые не видны другим процессам: корзины в них считались бы
+# отдельно в каждом процессе gunicorn
+LOCAL_CACHES = (LocMemCache, DummyCache)
+
+# Поля запроса, каждый элемент которых - отдельная операция над узлом или ребром
+# (запросы карты и автосохранения, журнал операций, массовое изменение)
+COST_FIELDS = (
+    'nodes', 'edges_data', 'new_nodes', 'changed_nodes', 'deleted_node_ids', 'deleted_node_temp_ids',
+    'new_edges', 'changed_edges', 'deleted_edge_ids', 'operations',
+)
+
+_local_cache_warned = False
+
+
+def get_rates():
+    """Возвращает параметры корзин по областям ('user', 'map'); None отключает область."""
+    return getattr(settings, 'MAP_WRITE_THROTTLE_RATES', DEFAULT_RATES)
+
+
+def get_cache():
+    """
+    Возвращает общий для процессов кеш корзин (алиас MAP_WRITE_THROTTLE_CACHE).
+
+    Returns:
+        BaseCache: Кеш или None, если он локален для процесса
+    """
+    global _local_cache_warned
+    alias = getattr(settings, 'MAP_WRITE_THROTTLE_CACHE', DEFAULT_CACHE)
+    cache = caches[alias]
+    if isinstance(cache, LOCAL_CACHES):
+        if not _local_cache_warned:
+            logger.warning(f"Ограничение записи отключено: кеш '{alias}' не общий для процессов")
+            _local_cache_warned = True
+        return None
+    return cache
+
+
+def request_cost(request):
+    """
+    Возвращает стоимость запроса записи: 1 за сам запрос и по 1 за каждую
+    операцию над узлом или ребром в теле запроса.
+    """
+    data = request.data
+    if not hasattr(data, 'get'):
+        return 1
+    return 1 + sum(len(data.get(key)) for key in COST_FIELDS if isinstance(data.get(key), list))
+
+
+class MapWriteThrottle(BaseThrottle):
+    """
+    Ограничение записи в карту по стоимости запросов (token bucket).
+
+    Каждый запрос записи (PATCH/PUT карты, POST журнала операций, массового
+    изменения и автосохранения) списывает из корзин пользователя и карты
+    столько токенов, сколько операций над узлами и ребрами он содержит; корзины
+    пополняются с постоянной скоростью до своей емкости. Запрос пропускается,
+    если в обеих корзинах достаточно токенов. Запрос дороже емкости корзины
+    пропускается при полной корзине и уводит ее в минус, поэтому следующий
+    запрос ждет дольше. Повтор запроса с сохраненным результатом
+    (Idempotency-Key) ничего не записывает и не списывается.
+
+    Состояние корзин хранится в общем кеше (get_cache); как и у
+    SimpleRateThrottle, чтение и запись корзины не атомарны. Если кеш
+    локален для процесса, ограничение отключается: в каждом процессе
+    gunicorn была бы своя корзина, и лимит умножился бы на число процессов.
+
+    Attributes:
+        methods (tuple): Методы, к которым применяется ограничение
+        timer (callable): Источник текущего времени в секундах
+    """
+    methods = ('POST', 'PUT', 'PATCH')
+    timer = time.time
+    cache_format = 'map_write_throttle:%(scope)s:%(ident)s'
+
+    def get_idents(self, request, view):
+        """
+        Возвращает идентификаторы корзин по областям.
+
+        Ограничение проверяется до загрузки карты и проверки прав, поэтому
+        корзина карты используется, только если запрос пришел от владельца:
+        иначе чужие запросы расходовали бы лимит записи владельца. Анонимные
+        и чужие запросы списываются только из корзины пользователя.
+        """
+        user = request.user
+        if not (user and user.is_authenticated):
+            return {'user': self.get_ident(request), 'map': None}
+        map_id = view.kwargs.get('pk')
+        if map_id is not None and not Map.objects.filter(pk=map_id, owner_id=user.pk).exists():
+            map_id = None
+        return {'user': user.pk, 'map': map_id}
+
+    def _refill(self, bucket, capacity, rate, now):
+        tokens, updated_at = bucket if bucket else (capacity, now)
+        return min(capacity, tokens + (now - updated_at) * rate)
+
+    def is_replay(self, request, view):
+        """Проверяет, что запрос - повтор с сохраненным результатом."""
+        key = request.headers.get('Idempotency-Key')
+        return bool(key) and is_replay(view.kwargs.get('pk'), key, request_fingerprint(request))
+
+    def allow_request(self, request, view):
+        self.waits = []
+        if request.method not in self.methods:
+            return True
+        cache = get_cache()
+        if cache is None or self.is_replay(request, view):
+            return True
+        now = self.timer()
+        cost = request_cost(request)
+        rates = get_rates()
+
+        buckets = {}
+        for scope, ident in self.get_idents(request, view).items():
+            params = rates.get(scope)
+            if not params or ident is None:
+                continue
+            capacity, rate = params['capacity'], params['rate']
+            key = self.cache_format % {'scope': scope, 'ident': ident}
+            tokens = self._refill(cache.get(key), capacity, rate, now)
+            needed = min(cost, capacity)
+            if tokens < needed:
+                self.waits.append((needed - tokens) / rate)
+            buckets[key] = (tokens, capacity, rate)
+
+        if self.waits:
+            logger.warning(
+                f"Ограничение записи: пользователь {request.user}, карта ID: {view.kwargs.get('pk')}, "
+                f"стоимость запроса {cost}, ожидание {max(self.waits):.1f} с"
+            )
+            return False
+
+        for key, (tokens, capacity, rate) in buckets.items():
+            tokens -= cost
+            # Запись живет, пока корзина не наполнится снова
+            timeout = int((capacity - tokens) / rate) + 1
+            cache.set(key, (tokens, now), timeout)
+        return True
+
+    def wait(self):
+        """Возвращает время в секундах до пополнения корзин на стоимость запроса."""
+        return max(self.waits) if self.waits else None
@@ -0,0 +1,356 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, используется стандартный json
+    orjson = None
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .files import publish_manifest, read_manifest as read_map_manifest, remove_map_root
+from .models import Map, MapRebuild
+from .rebuilds import cancel_rebuild, request_rebuild
+from .serializers import MapReadSerializer
+from .signals import map_version_changed
+from .spatial import mercator
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+DEFAULT_MAX_ZOOM = 12
+MANIFEST_NAME = 'tiles.json'
+
+# Изменение формата тайлов должно менять хеш набора, иначе nginx отдаст старые тайлы
+TILE_FORMAT_VERSION = 2
+
+# Запас вокруг тайла при обрезке ребер (доля тайла): концы обрезанных
+# линий соседних тайлов перекрываются, и на стыке не видно разрыва
+EDGE_BUFFER = 8 / TILE_SIZE
+
+NODE_PROPERTIES = ('name', 'description')
+EDGE_PROPERTIES = ('description', 'style')
+
+
+def dumps(value):
+    """Возвращает JSON тайла в UTF-8; orjson используется, если установлен."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def get_tiles_root():
+    """Возвращает каталог, из которого nginx отдает тайлы опубликованных карт."""
+    return settings.MAP_TILES_ROOT
+
+
+def get_tiles_url():
+    """Возвращает URL-префикс каталога тайлов."""
+    return getattr(settings, 'MAP_TILES_URL', '/tiles/')
+
+
+def get_max_zoom():
+    """Возвращает наибольший уровень масштаба, для которого строятся тайлы."""
+    return getattr(settings, 'MAP_TILES_MAX_ZOOM', DEFAULT_MAX_ZOOM)
+
+
+def coordinate_digits(zoom):
+    """Возвращает число знаков после запятой, достаточное для точности в пиксель на уровне zoom."""
+    pixel = 360.0 / (TILE_SIZE << zoom)
+    return max(0, math.ceil(-math.log10(pixel))) + 1
+
+
+def segment_tiles(start, end):
+    """
+    Возвращает тайлы, через которые проходит отрезок.
+
+    Обход клеток вдоль отрезка (Amanatides - Woo): каждый следующий тайл
+    соседний с предыдущим по стороне, поэтому тайлов не больше, чем
+    |dx| + |dy| + 1.
+
+    Args:
+        start (tuple): Начало отрезка в единицах тайла уровня
+        end (tuple): Конец отрезка в единицах тайла уровня
+
+    Returns:
+        list[tuple]: Координаты (x, y) тайлов
+    """
+    (x0, y0), (x1, y1) = start, end
+    tx, ty = int(x0), int(y0)
+    last_x, last_y = int(x1), int(y1)
+    dx, dy = x1 - x0, y1 - y0
+    step_x = 1 if dx > 0 else -1
+    step_y = 1 if dy > 0 else -1
+    t_max_x = ((tx + (step_x > 0)) - x0) / dx if dx else math.inf
+    t_max_y = ((ty + (step_y > 0)) - y0) / dy if dy else math.inf
+    t_delta_x = abs(1 / dx) if dx else math.inf
+    t_delta_y = abs(1 / dy) if dy else math.inf
+
+    tiles = [(tx, ty)]
+    for _ in range(abs(last_x - tx) + abs(last_y - ty)):
+        if t_max_x < t_max_y:
+            tx += step_x
+            t_max_x += t_delta_x
+        else:
+            ty += step_y
+            t_max_y += t_delta_y
+        tiles.append((tx, ty))
+    return tiles
+
+
+def clip_segment(start, end, tile):
+    """
+    Обрезает отрезок по тайлу с запасом EDGE_BUFFER (Лиан - Барски).
+
+    Args:
+        start (tuple): Начало отрезка в единицах тайла уровня
+        end (tuple): Конец отрезка в единицах тайла уровня
+        tile (tuple): Координаты (x, y) тайла
+
+    Returns:
+        tuple: Параметры (t0, t1) части отрезка внутри тайла, 0 <= t0 < t1 <= 1,
+            или None, если отрезок тайл не задевает
+    """
+    t0, t1 = 0.0, 1.0
+    for origin, delta, low in ((start[0], end[0] - start[0], tile[0]), (start[1], end[1] - start[1], tile[1])):
+        low, high = low - EDGE_BUFFER, low + 1 + EDGE_BUFFER
+        if not delta:
+            if not low <= origin <= high:
+                return None
+            continue
+        enter, leave = (low - origin) / delta, (high - origin) / delta
+        if enter > leave:
+            enter, leave = leave, enter
+        t0, t1 = max(t0, enter), min(t1, leave)
+        if t0 >= t1:
+            return None
+    return t0, t1
+
+
+def tile_coordinates(x, y, zoom, digits):
+    """Возвращает [долгота, широта] точки, заданной в единицах тайла уровня zoom."""
+    scale = 1 << zoom
+    longitude = x / scale * 360.0 - 180.0
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / scale))))
+    return [round(longitude, digits), round(latitude, digits)]
+
+
+def tile_set_hash(nodes, edges):
+    """Возвращает хеш содержимого набора тайлов: он же часть пути к тайлам."""
+    digest = hashlib.blake2b(digest_size=10)
+    digest.update(json.dumps([TILE_FORMAT_VERSION, get_max_zoom()]).encode('utf-8'))
+    for rows in (nodes, edges):
+        for row in rows:
+            digest.update(json.dumps(row, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def generate_tiles(nodes, edges, max_zoom=None):
+    """
+    Нарезает узлы и ребра карты на тайлы z/x/y.
+
+    Тайл - GeoJSON FeatureCollection. На каждом уровне координаты
+    округляются до пикселя (coordinate_digits), узлы, попавшие в один
+    пиксель, сливаются в один объект с count, а ребра короче пикселя
+    отбрасываются; одинаковые после округления ребра сливаются так же.
+    Ребро попадает во все тайлы, через которые оно проходит, но в каждом
+    тайле лежит только его часть внутри тайла с запасом EDGE_BUFFER
+    (clip_segment): размер тайла не растет от длинных ребер, проходящих
+    через него. Пустые тайлы не создаются.
+
+    Args:
+        nodes (list[dict]): Узлы в виде MapReadSerializer.node_rows()
+        edges (list[dict]): Ребра в виде MapReadSerializer.edge_rows()
+        max_zoom (int): Наибольший уровень масштаба или get_max_zoom()
+
+    Returns:
+        dict: Содержимое тайлов {(z, x, y): bytes}
+    """
+    max_zoom = get_max_zoom() if max_zoom is None else max_zoom
+    positions = {node['id']: mercator(node['latitude'], node['longitude']) for node in nodes}
+    tiles = {}
+
+    for zoom in range(max_zoom + 1):
+        world = TILE_SIZE << zoom
+        last = world - 1
+        digits = coordinate_digits(zoom)
+        features = {}
+
+        node_pixels = {}
+        node_coordinates = {}
+        merged = {}
+        for node in nodes:
+            x, y = positions[node['id']]
+            pixel = node_pixels[node['id']] = (min(int(x * world), last), min(int(y * world), last))
+            coordinates = node_coordinates[node['id']] = [round(node['longitude'], digits), round(node['latitude'], digits)]
+            feature = merged.get(pixel)
+            if feature is not None:
+                feature['properties']['count'] += 1
+                continue
+            feature = merged[pixel] = {
+                'type': 'Feature',
+                'id': node['id'],
+                'geometry': {'type': 'Point', 'coordinates': coordinates},
+                'properties': dict({key: node[key] for key in NODE_PROPERTIES}, count=1),
+            }
+            features.setdefault((pixel[0] // TILE_SIZE, pixel[1] // TILE_SIZE), []).append(feature)
+
+        merged = {}
+        scale = 1 << zoom
+        for edge in edges:
+            start, end = node_pixels.get(edge['node1']), node_pixels.get(edge['node2'])
+            if start is None or end is None or start == end:
+                continue
+            key = (start, end) if start < end else (end, start)
+            properties = merged.get(key)
+            if properties is not None:
+                properties['count'] += 1
+                continue
+            # Объекты ребра во всех тайлах делят properties, поэтому count слитых ребер виден везде
+            properties = merged[key] = dict({key: edge[key] for key in EDGE_PROPERTIES}, count=1)
+            coordinates = [node_coordinates[edge['node1']], node_coordinates[edge['node2']]]
+            start_tile = (start[0] // TILE_SIZE, start[1] // TILE_SIZE)
+            if start_tile == (end[0] // TILE_SIZE, end[1] // TILE_SIZE):
+                edge_tiles = [(start_tile, coordinates)]
+            else:
+                (x0, y0), (x1, y1) = positions[edge['node1']], positions[edge['node2']]
+                x0, y0, x1, y1 = x0 * scale, y0 * scale, x1 * scale, y1 * scale
+                edge_tiles = []
+                for tile in segment_tiles(
+                    ((start[0] + 0.5) / TILE_SIZE, (start[1] + 0.5) / TILE_SIZE),
+                    ((end[0] + 0.5) / TILE_SIZE, (end[1] + 0.5) / TILE_SIZE),
+                ):
+                    clipped = clip_segment((x0, y0), (x1, y1), tile)
+                    if clipped is None:
+                        continue
+                    t0, t1 = clipped
+                    edge_tiles.append((tile, [
+                        coordinates[0] if t0 == 0 else
+                        tile_coordinates(x0 + (x1 - x0) * t0, y0 + (y1 - y0) * t0, zoom, digits),
+                        coordinates[1] if t1 == 1 else
+                        tile_coordinates(x0 + (x1 - x0) * t1, y0 + (y1 - y0) * t1, zoom, digits),
+                    ]))
+            for tile, line in edge_tiles:
+                features.setdefault(tile, []).append({
+                    'type': 'Feature',
+                    'id': edge['id'],
+                    'geometry': {'type': 'LineString', 'coordinates': line},
+                    'properties': properties,
+                })
+
+        for (x, y), tile_features in features.items():
+            tiles[(zoom, x, y)] = dumps({'type': 'FeatureCollection', 'features': tile_features})
+    return tiles
+
+
+def read_manifest(map_id):
+    """Возвращает манифест тайлов карты или None, если тайлов нет."""
+    return read_map_manifest(os.path.join(get_tiles_root(), str(map_id)), MANIFEST_NAME)
+
+
+def publish_tiles(map_instance):
+    """
+    Строит тайлы опубликованной карты и записывает их на диск.
+
+    Тайлы лежат в <MAP_TILES_ROOT>/<map_id>/<hash>/z/x/y.json, где hash -
+    хеш содержимого карты, поэтому nginx отдает их с вечным кешем. Набор
+    сначала пишется во временный каталог и переименовывается целиком,
+    после чего атомарно заменяется манифест tiles.json (TileJSON) со
+    ссылкой на новый набор. Если набор с таким хешем уже есть, тайлы
+    не строятся заново. Кроме текущего остается предыдущий набор, чтобы
+    клиенты, прочитавшие старый манифест, догрузили карту.
+
+    Args:
+        map_instance (Map): Опубликованная карта
+
+    Returns:
+        dict: Манифест тайлов
+    """
+    nodes = MapReadSerializer.node_rows(map_instance.nodes.all())
+    edges = MapReadSerializer.edge_rows(map_instance.edges.all())
+    tile_hash = tile_set_hash(nodes, edges)
+    map_root = os.path.join(get_tiles_root(), str(map_instance.id))
+    tile_set = os.path.join(map_root, tile_hash)
+    os.makedirs(map_root, exist_ok=True)
+
+    if not os.path.isdir(tile_set):
+        tiles = generate_tiles(nodes, edges)
+        tmp_root = tempfile.mkdtemp(dir=map_root, prefix='.tmp-')
+        for (zoom, x, y), content in tiles.items():
+            tile_dir = os.path.join(tmp_root, str(zoom), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            with open(os.path.join(tile_dir, f'{y}.json'), 'wb') as tile:
+                tile.write(content)
+        os.chmod(tmp_root, 0o755)
+        try:
+            os.rename(tmp_root, tile_set)
+        except OSError:
+            # Тот же набор успел записать параллельный процесс
+            shutil.rmtree(tmp_root, ignore_errors=True)
+            if not os.path.isdir(tile_set):
+                raise
+        logger.info(f"Карта ID: {map_instance.id}: записано тайлов: {len(tiles)}, набор {tile_hash}")
+
+    latitudes = [node['latitude'] for node in nodes]
+    longitudes = [node['longitude'] for node in nodes]
+    manifest = {
+        'tilejson': '3.0.0',
+        'name': map_instance.title,
+        'version': map_instance.version,
+        'hash': tile_hash,
+        'tiles': [f'{get_tiles_url()}{map_instance.id}/{tile_hash}/{{z}}/{{x}}/{{y}}.json'],
+        'minzoom': 0,
+        'maxzoom': get_max_zoom(),
+        'bounds': [min(longitudes), min(latitudes), max(longitudes), max(latitudes)] if nodes else None,
+    }
+    publish_manifest(map_root, MANIFEST_NAME, manifest)
+    return manifest
+
+
+def remove_tiles(map_id):
+    """Удаляет тайлы карты, снятой с публикации или удаленной."""
+    if remove_map_root(os.path.join(get_tiles_root(), str(map_id))):
+        logger.info(f"Карта ID: {map_id}: тайлы удалены")
+
+
+def rebuild_map_tiles(map_id):
+    """
+    Приводит тайлы карты в соответствие с ее текущим состоянием: строит
+    их для опубликованной карты и удаляет для неопубликованной или удаленной.
+    """
+    map_instance = Map.objects.filter(pk=map_id).first()
+    if map_instance is None or not map_instance.is_published:
+        remove_tiles(map_id)
+        return
+    publish_tiles(map_instance)
+
+
+@receiver(map_version_changed)
+def update_map_tiles(sender, map_id, version, **kwargs):
+    """
+    Отмечает тайлы опубликованной карты устаревшими после ее изменения.
+
+    Тайлы строит команда generate_map_tiles (rebuild_map_tiles), когда карта
+    перестает меняться. Тайлы неопубликованной карты удаляются сразу,
+    чтобы nginx не отдавал их после снятия с публикации.
+    """
+    if Map.objects.filter(pk=map_id, is_published=True).exists():
+        request_rebuild(map_id, MapRebuild.TILES)
+        return
+    cancel_rebuild(map_id, MapRebuild.TILES)
+    remove_tiles(map_id)
+
+
+@receiver(post_delete, sender=Map)
+def remove_deleted_map_tiles(sender, instance, **kwargs):
+    """Удаляет тайлы удаленной карты после фиксации транзакции."""
+    map_id = instance.pk
+    transaction.on_commit(lambda: remove_tiles(map_id))
@@ -0,0 +1,118 @@
+import json
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimer:
+    """
+    Замер стадий обработки запроса: время и число SQL-запросов на стадию.
+
+    Используется как контекстный менеджер на время запроса: внутри него
+    SQL-запросы считаются через connection.execute_wrapper (работает и при
+    DEBUG=False), а стадии отмечаются через span(). Вложенные стадии
+    учитываются и в своем времени, и во времени внешней стадии.
+
+    Attributes:
+        name (str): Имя замера в структурированной записи
+        fields (dict): Дополнительные поля записи (например, ID карты)
+        spans (list): Завершенные стадии (имя, миллисекунды, запросы)
+        queries (int): Число SQL-запросов с начала замера
+    """
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.spans = []
+        self.queries = 0
+        self.total_ms = None
+        self._started = None
+        self._wrapper = None
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self._count_query)
+        self._wrapper.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.total_ms = (time.perf_counter() - self._started) * 1000
+        self._wrapper.__exit__(*exc_info)
+        return False
+
+    @contextmanager
+    def span(self, name):
+        """Отмечает стадию name."""
+        started = time.perf_counter()
+        queries = self.queries
+        try:
+            yield
+        finally:
+            self.spans.append((name, (time.perf_counter() - started) * 1000, self.queries - queries))
+
+    def stages(self):
+        """
+        Возвращает стадии в порядке первого появления; время и число
+        запросов повторяющихся стадий с одним именем складываются.
+
+        Returns:
+            dict: {имя: [миллисекунды, запросы]}
+        """
+        stages = {}
+        for name, ms, queries in self.spans:
+            stage = stages.setdefault(name, [0, 0])
+            stage[0] += ms
+            stage[1] += queries
+        return stages
+
+    def record(self, **fields):
+        """Возвращает компактную структурированную запись о запросе."""
+        return {
+            'event': self.name,
+            **self.fields,
+            **fields,
+            'total_ms': round(self.total_ms or 0, 2),
+            'queries': self.queries,
+            'stages': {name: [round(ms, 2), queries] for name, (ms, queries) in self.stages().items()},
+        }
+
+    def server_timing(self):
+        """Возвращает значение заголовка Server-Timing."""
+        parts = [f'{name};dur={ms:.2f};desc="{queries} q"' for name, (ms, queries) in self.stages().items()]
+        parts.append(f'total;dur={self.total_ms or 0:.2f};desc="{self.queries} q"')
+        return ', '.join(parts)
+
+    def report(self, response):
+        """
+        Пишет запись о запросе в лог и, если включен MAP_SERVER_TIMING,
+        добавляет к ответу заголовок Server-Timing.
+        """
+        record = self.record(status=response.status_code)
+        logger.info(json.dumps(record, separators=(',', ':')), extra={'timing': record})
+        if getattr(settings, 'MAP_SERVER_TIMING', False):
+            response['Server-Timing'] = self.server_timing()
+        return response
+
+
+class _NullTimer:
+    """Замер-заглушка для вызовов вне запроса (автосохранение, компактор)."""
+
+    def span(self, name):
+        return nullcontext()
+
+
+NULL_TIMER = _NullTimer()
+
+
+def get_timer(context):
+    """Возвращает замер из контекста сериализатора или заглушку."""
+    return context.get('timer') or NULL_TIMER
@@ -0,0 +1,235 @@
+import logging
+import math
+
+from django.db.models import Count, F, Max, Min, Q, Value
+from django.utils import timezone
+from rest_framework import serializers
+
+from .bulk import MapBulkWriter
+from .models import Map, Node, Edge
+from .spatial import bbox_query, grid_cell_expression
+
+logger = logging.getLogger(__name__)
+
+# Аффинное преобразование координат (a, b, c, d, e, f):
+#   longitude' = a * longitude + b * latitude + c
+#   latitude'  = d * longitude + e * latitude + f
+IDENTITY = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+GEOMETRY_OPERATIONS = ('translate', 'rotate', 'scale')
+STYLE_OPERATIONS = ('set_style',)
+
+# Поля, по которым можно отбирать узлы и ребра в селекторе
+NODE_FILTER_FIELDS = ('name', 'description', 'z_coordinate')
+EDGE_FILTER_FIELDS = ('description', 'color', 'width', 'lineStyle')
+
+
+def compose(first, second):
+    """Возвращает преобразование, равное применению first, затем second."""
+    a1, b1, c1, d1, e1, f1 = first
+    a2, b2, c2, d2, e2, f2 = second
+    return (
+        a2 * a1 + b2 * d1, a2 * b1 + b2 * e1, a2 * c1 + b2 * f1 + c2,
+        d2 * a1 + e2 * d1, d2 * b1 + e2 * e1, d2 * c1 + e2 * f1 + f2,
+    )
+
+
+def operation_matrix(operation):
+    """
+    Возвращает аффинное преобразование для геометрической операции.
+
+    Поворот и масштабирование выполняются вокруг точки (center_latitude,
+    center_longitude) в локальной равнопромежуточной проекции: долгота
+    сжимается на cos(широты центра), поэтому при повороте фигура
+    не искажается, как и на карте.
+
+    Args:
+        operation (dict): Проверенная операция из MapBulkEditSerializer
+
+    Returns:
+        tuple: Коэффициенты (a, b, c, d, e, f)
+    """
+    kind = operation['type']
+    if kind == 'translate':
+        return (1.0, 0.0, operation.get('delta_longitude', 0.0), 0.0, 1.0, operation.get('delta_latitude', 0.0))
+
+    cx = operation['center_longitude']
+    cy = operation['center_latitude']
+    if kind == 'scale':
+        k = operation['factor']
+        return (k, 0.0, cx - k * cx, 0.0, k, cy - k * cy)
+
+    angle = math.radians(operation['angle'])
+    cos_a, sin_a = math.cos(angle), math.sin(angle)
+    aspect = math.cos(math.radians(cy))
+    a, b = cos_a, -sin_a / aspect
+    d, e = sin_a * aspect, cos_a
+    return (a, b, cx - a * cx - b * cy, d, e, cy - d * cx - e * cy)
+
+
+def _expressions(matrix):
+    """Возвращает SQL-выражения новых долготы и широты для преобразования."""
+    a, b, c, d, e, f = matrix
+
+    def linear(x, y, const):
+        expression = Value(const)
+        if x:
+            expression = expression + F('longitude') * Value(x)
+        if y:
+            expression = expression + F('latitude') * Value(y)
+        return expression
+
+    return linear(a, b, c), linear(d, e, f)
+
+
+def _style_filter(edge_filter):
+    """Переводит фильтр ребер в условия запроса; ключи стиля ищутся внутри style."""
+    conditions = {}
+    for key, value in edge_filter.items():
+        conditions[key if key == 'description' else f'style__{key}'] = value
+    return conditions
+
+
+class Selection:
+    """
+    Выборка узлов и ребер карты по селектору массовой операции.
+
+    Селектор задает ровно один способ отбора: node_ids, edge_ids, bbox
+    [юг, запад, север, восток], node_filter или edge_filter (точное
+    совпадение полей). Узлы для геометрических операций - отобранные узлы или
+    концы отобранных ребер; ребра для операций стиля - отобранные ребра или
+    ребра, оба конца которых входят в отобранные узлы. Выборка строится
+    подзапросами и вычисляется в базе вместе с UPDATE.
+    """
+
+    def __init__(self, map_instance, selector):
+        self.map = map_instance
+        self.selector = selector
+        self.map_nodes = Node.objects.filter(
+            id__in=Map.nodes.through.objects.filter(map_id=map_instance.id).values('node_id')
+        )
+        self.map_edges = Edge.objects.filter(
+            id__in=Map.edges.through.objects.filter(map_id=map_instance.id).values('edge_id')
+        )
+
+    def _selected_edges(self):
+        if 'edge_ids' in self.selector:
+            return self.map_edges.filter(id__in=self.selector['edge_ids'])
+        if 'edge_filter' in self.selector:
+            return self.map_edges.filter(**_style_filter(self.selector['edge_filter']))
+        return None
+
+    def nodes(self):
+        """Возвращает QuerySet узлов карты, затронутых выборкой."""
+        if 'node_ids' in self.selector:
+            return self.map_nodes.filter(id__in=self.selector['node_ids'])
+        if 'bbox' in self.selector:
+            south, west, north, east = self.selector['bbox']
+            return self.map_nodes.filter(bbox_query((west, south, east, north)))
+        if 'node_filter' in self.selector:
+            return self.map_nodes.filter(**self.selector['node_filter'])
+        edges = self._selected_edges()
+        return self.map_nodes.filter(Q(id__in=edges.values('node1_id')) | Q(id__in=edges.values('node2_id')))
+
+    def edges(self):
+        """Возвращает QuerySet ребер карты, затронутых выборкой."""
+        edges = self._selected_edges()
+        if edges is not None:
+            return edges
+        node_ids = self.nodes().values('id')
+        return self.map_edges.filter(node1_id__in=node_ids, node2_id__in=node_ids)
+
+
+def transform_nodes(writer, nodes, matrix):
+    """
+    Применяет аффинное преобразование к узлам одним UPDATE.
+
+    Новые координаты вычисляются в базе. Перед записью один агрегирующий
+    запрос проверяет, что все узлы остаются в допустимых пределах широты
+    и долготы; иначе ничего не записывается.
+
+    Args:
+        writer (MapBulkWriter): Запись изменений карты (версия, If-Match)
+        nodes (QuerySet): Узлы, к которым применяется преобразование
+        matrix (tuple): Коэффициенты преобразования
+
+    Returns:
+        int: Количество измененных узлов
+
+    Raises:
+        ValidationError: Узлы выходят за пределы допустимых координат
+    """
+    longitude, latitude = _expressions(matrix)
+    bounds = nodes.aggregate(
+        count=Count('id'),
+        min_latitude=Min(latitude), max_latitude=Max(latitude),
+        min_longitude=Min(longitude), max_longitude=Max(longitude),
+    )
+    if not bounds['count']:
+        return 0
+    if bounds['min_latitude'] < -90 or bounds['max_latitude'] > 90:
+        raise serializers.ValidationError({'operations': 'Широта должна быть между -90 и 90'})
+    if bounds['min_longitude'] < -180 or bounds['max_longitude'] > 180:
+        raise serializers.ValidationError({'operations': 'Долгота должна быть между -180 и 180'})
+    return nodes.update(
+        longitude=longitude,
+        latitude=latitude,
+        grid_cell=grid_cell_expression(latitude, longitude),
+        version=writer.ensure_version(),
+    )
+
+
+def restyle_edges(writer, edges, style):
+    """
+    Заменяет стиль ребер одним UPDATE.
+
+    Returns:
+        int: Количество измененных ребер
+    """
+    if not edges.exists():
+        return 0
+    return edges.update(style=style, version=writer.ensure_version())
+
+
+def apply_bulk_edit(map_instance, selector, operations, expected_version=None):
+    """
+    Применяет массовые операции к выборке узлов и ребер карты.
+
+    Выборка вычисляется один раз, до всех операций: сдвиг не меняет
+    того, какие узлы попали в bbox. Поэтому геометрические операции
+    сворачиваются в одно аффинное преобразование и записываются одним
+    UPDATE узлов, а из операций стиля действует последняя - одним UPDATE
+    ребер. Вызывается внутри транзакции.
+
+    Args:
+        map_instance (Map): Карта
+        selector (dict): Проверенный селектор
+        operations (list[dict]): Проверенные операции в порядке применения
+        expected_version (int): Версия из If-Match или None
+
+    Returns:
+        dict: Количество измененных узлов и ребер
+
+    Raises:
+        ValidationError: Узлы выходят за пределы допустимых координат
+        MapVersionConflict: Версия карты не совпала с expected_version
+    """
+    writer = MapBulkWriter(map_instance, expected_version=expected_version)
+    selection = Selection(map_instance, selector)
+    matrix = None
+    style = None
+    for operation in operations:
+        if operation['type'] in GEOMETRY_OPERATIONS:
+            matrix = compose(matrix or IDENTITY, operation_matrix(operation))
+        else:
+            style = operation['style']
+
+    # Стиль применяется первым: выборка ребер по bbox опирается на координаты узлов до сдвига
+    edges_updated = restyle_edges(writer, selection.edges(), style) if style is not None else 0
+    nodes_updated = transform_nodes(writer, selection.nodes(), matrix) if matrix is not None else 0
+    if nodes_updated or edges_updated:
+        Map.objects.filter(pk=map_instance.pk).update(updated_at=timezone.now())
+    logger.info(
+        f"Карта ID: {map_instance.id}: массовое изменение, узлов: {nodes_updated}, ребер: {edges_updated}"
+    )
+    return {'nodes_updated': nodes_updated, 'edges_updated': edges_updated}
@@ -0,0 +1,437 @@
+import logging
+import math
+from collections.abc import Mapping
+
+from django.core.validators import ProhibitNullCharactersValidator
+from rest_framework import fields, serializers
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.validators import ProhibitSurrogateCharactersValidator
+
+from .bulk import DEFAULT_EDGE_STYLE
+from .models import MapOperation
+
+logger = logging.getLogger(__name__)
+
+# Сообщения об ошибках берутся из полей DRF, чтобы совпадать с ответами
+# NodeSerializer (в том числе переводы - ленивые строки вычисляются при ошибке)
+_CHAR_MESSAGES = fields.CharField().error_messages
+_FLOAT_MESSAGES = fields.FloatField().error_messages
+_INTEGER_MESSAGES = fields.IntegerField().error_messages
+_SERIALIZER_MESSAGES = serializers.Serializer.default_error_messages
+_SELF_LOOP_MESSAGE = "Узлы не могут ссылаться сами на себя"
+_PK_MESSAGE = "Некорректный тип. Ожидалось значение первичного ключа."
+
+
+class FieldError(Exception):
+    """Ошибка проверки одного поля; details - список ErrorDetail."""
+
+    def __init__(self, *details):
+        super().__init__(details)
+        self.details = list(details)
+
+
+def _error(messages, code, **params):
+    message = str(messages[code])
+    return ErrorDetail(message.format(**params) if params else message, code=code)
+
+
+class _Field:
+    """Скомпилированная проверка поля: parse() приводит значение или поднимает FieldError."""
+
+    def __init__(self, parse, required=True, allow_null=False):
+        self.parse_value = parse
+        self.required = required
+        self.allow_null = allow_null
+
+    def parse(self, value):
+        if value is None:
+            if self.allow_null:
+                return None
+            raise FieldError(_error(_CHAR_MESSAGES, 'null'))
+        return self.parse_value(value)
+
+
+def string_field(max_length=None, required=True, allow_blank=False, allow_null=False):
+    """Проверка, повторяющая CharField DRF (trim_whitespace=True)."""
+    null_validator = ProhibitNullCharactersValidator()
+    surrogate_validator = ProhibitSurrogateCharactersValidator()
+
+    def parse(value):
+        if value == '' or str(value).strip() == '':
+            if not allow_blank:
+                raise FieldError(_error(_CHAR_MESSAGES, 'blank'))
+            return ''
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise FieldError(_error(_CHAR_MESSAGES, 'invalid'))
+        value = str(value).strip()
+        details = []
+        if max_length is not None and len(value) > max_length:
+            details.append(_error(_CHAR_MESSAGES, 'max_length', max_length=max_length))
+        if '\x00' in value:
+            details.append(ErrorDetail(str(null_validator.message), code=null_validator.code))
+        for char in value:
+            if 0xD800 <= ord(char) <= 0xDFFF:
+                details.append(ErrorDetail(
+                    str(surrogate_validator.message).format(code_point=ord(char)),
+                    code=surrogate_validator.code
+                ))
+                break
+        if details:
+            raise FieldError(*details)
+        return value
+
+    return _Field(parse, required, allow_null)
+
+
+def float_field(required=True, allow_null=False, bounds=None):
+    """
+    Проверка, повторяющая FloatField DRF.
+
+    Args:
+        bounds (tuple): (минимум, максимум, сообщение) для проверки диапазона
+    """
+    def parse(value):
+        if isinstance(value, str) and len(value) > fields.FloatField.MAX_STRING_LENGTH:
+            raise FieldError(_error(_FLOAT_MESSAGES, 'max_string_length'))
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise FieldError(_error(_FLOAT_MESSAGES, 'invalid'))
+        except OverflowError:
+            raise FieldError(_error(_FLOAT_MESSAGES, 'overflow'))
+        if not math.isfinite(value):
+            raise FieldError(_error(_FLOAT_MESSAGES, 'invalid'))
+        if bounds is not None and not (bounds[0] <= value <= bounds[1]):
+            raise FieldError(ErrorDetail(bounds[2], code='invalid'))
+        return value
+
+    return _Field(parse, required, allow_null)
+
+
+def integer_field(required=True, allow_null=False):
+    """Проверка, повторяющая IntegerField DRF."""
+    re_decimal = fields.IntegerField.re_decimal
+
+    def parse(value):
+        if isinstance(value, str) and len(value) > fields.IntegerField.MAX_STRING_LENGTH:
+            raise FieldError(_error(_INTEGER_MESSAGES, 'max_string_length'))
+        try:
+            return int(re_decimal.sub('', str(value)))
+        except (ValueError, TypeError):
+            raise FieldError(_error(_INTEGER_MESSAGES, 'invalid'))
+
+    return _Field(parse, required, allow_null)
+
+
+def compile_schema(schema):
+    """
+    Компилирует схему {поле: проверка} в функцию проверки одного объекта.
+
+    Возвращаемая функция validate(data, partial=False) отдает пару
+    (значения, ошибки) с ошибками в формате Serializer.errors. Поля,
+    отсутствующие в схеме, отбрасываются.
+    """
+    items = tuple(schema.items())
+
+    def validate(data, partial=False):
+        if not isinstance(data, Mapping):
+            return None, {'non_field_errors': [
+                _error(_SERIALIZER_MESSAGES, 'invalid', datatype=type(data).__name__)
+            ]}
+        values = {}
+        errors = {}
+        for name, field in items:
+            if name not in data:
+                if field.required and not partial:
+                    errors[name] = [_error(_CHAR_MESSAGES, 'required')]
+                continue
+            try:
+                values[name] = field.parse(data[name])
+            except FieldError as e:
+                errors[name] = e.details
+        return values, errors
+
+    return validate
+
+
+# Поля узла повторяют NodeSerializer; id и version задаются сервером
+_NODE_FIELDS = {
+    'temp_id': integer_field(required=False),
+    'name': string_field(max_length=100),
+    'latitude': float_field(bounds=(-90, 90, "Широта должна быть между -90 и 90")),
+    'longitude': float_field(bounds=(-180, 180, "Долгота должна быть между -180 и 180")),
+    'description': string_field(required=False, allow_blank=True, allow_null=True),
+    'z_coordinate': float_field(required=False, allow_null=True),
+}
+validate_node = compile_schema(_NODE_FIELDS)
+# Операция move_node меняет только положение узла
+validate_node_position = compile_schema({
+    key: _NODE_FIELDS[key] for key in ('latitude', 'longitude', 'z_coordinate')
+})
+
+
+# Поля ребра повторяют EdgeWriteSerializer; style проверяет check_edge_style
+validate_edge = compile_schema({
+    'description': string_field(required=False, allow_blank=True, allow_null=True),
+})
+
+
+def coerce_id(value):
+    """Приводит ID из запроса к int, возвращает None для некорректных значений."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_new_nodes(nodes_data):
+    """
+    Проверяет новые узлы за один проход.
+
+    Returns:
+        list[tuple]: Пары (временный ID, поля узла для bulk_create)
+
+    Raises:
+        ValidationError: {'new_nodes': ошибки первого некорректного узла}
+    """
+    validated = []
+    for node_data in nodes_data or []:
+        values, errors = validate_node(node_data)
+        if errors:
+            logger.error(f"Ошибка валидации нового узла: {errors}")
+            raise serializers.ValidationError({'new_nodes': errors})
+        temp_id = values.pop('temp_id', None)
+        validated.append((temp_id, values))
+    return validated
+
+
+def validate_changed_nodes(nodes_data):
+    """
+    Проверяет измененные узлы за один проход. Узлы без корректного ID пропускаются.
+
+    Returns:
+        dict: Поля узла для bulk_update по ID узла
+
+    Raises:
+        ValidationError: {'changed_nodes': ошибки первого некорректного узла}
+    """
+    validated = {}
+    for node_data in nodes_data or []:
+        node_id = coerce_id(node_data.get('id')) if isinstance(node_data, Mapping) else None
+        if not node_id:
+            logger.warning(f"Узел {node_data!r} без корректного ID пропущен при обновлении")
+            continue
+        values, errors = validate_node(node_data, partial=True)
+        if errors:
+            logger.error(f"Ошибка валидации измененного узла ID {node_id}: {errors}")
+            raise serializers.ValidationError({'changed_nodes': errors})
+        values.pop('temp_id', None)
+        validated[node_id] = values
+    return validated
+
+
+def check_edge_items(edges_data, key):
+    """
+    Проверяет, что ребра переданы списком объектов, до начала транзакции.
+
+    Raises:
+        ValidationError: {key: {'non_field_errors': [...]}} для первого не-объекта
+    """
+    for edge_data in edges_data or []:
+        if not isinstance(edge_data, Mapping):
+            raise serializers.ValidationError({key: {'non_field_errors': [
+                _error(_SERIALIZER_MESSAGES, 'invalid', datatype=type(edge_data).__name__)
+            ]}})
+
+
+def check_edge_style(style):
+    """
+    Проверяет структуру и значения стиля ребра.
+
+    Raises:
+        ValidationError: {'style' | 'style.<ключ>': сообщение}
+    """
+    if not isinstance(style, dict):
+        raise serializers.ValidationError({'style': 'Должно быть объектом JSON'})
+
+    # Проверка цвета
+    if 'color' in style and not isinstance(style['color'], str):
+        raise serializers.ValidationError({'style.color': 'Должен быть строкой'})
+
+    # Проверка ширины
+    if 'width' in style:
+        try:
+            width = int(style['width'])
+            if not (1 <= width <= 10):
+                raise serializers.ValidationError({'style.width': 'Должен быть числом от 1 до 10'})
+        except (ValueError, TypeError):
+            raise serializers.ValidationError({'style.width': 'Должен быть числом'})
+
+    # Проверка стиля линии
+    if 'lineStyle' in style and style['lineStyle'] not in ['solid', 'dashed', 'dotted']:
+        raise serializers.ValidationError({
+            'style.lineStyle': 'Должен быть одним из: solid, dashed, dotted'
+        })
+
+
+def _check_ref_ids(data, keys):
+    for key in keys:
+        value = data.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int)):
+            raise serializers.ValidationError({'data': {key: 'Должен быть целым числом'}})
+
+
+def _require_ref(data, prefix=''):
+    """Возвращает ссылку на узел ('id' | 'temp', значение) из параметров операции."""
+    id_key = prefix.rstrip('_') or 'id'
+    temp_key = f'{prefix}temp_id'
+    _check_ref_ids(data, (id_key, temp_key))
+    if data.get(id_key) is None and data.get(temp_key) is None:
+        raise serializers.ValidationError({'data': f'Требуется {id_key} или {temp_key}'})
+    if data.get(temp_key) is not None:
+        return ('temp', data[temp_key])
+    return ('id', data[id_key])
+
+
+def validate_operation(op_type, data):
+    """
+    Проверяет параметры операции журнала в зависимости от ее типа.
+
+    Узлы указываются через 'id' (ID в базе) или 'temp_id' (временный ID
+    из add_node), концы ребра - через node1/node2 или
+    node1_temp_id/node2_temp_id. Поля узла и ребра проверяются так же,
+    как в PATCH карты.
+
+    Args:
+        op_type (str): Тип операции (MapOperation.OP_TYPE_CHOICES)
+        data (dict): Параметры операции
+
+    Returns:
+        dict: Параметры с приведенными значениями полей
+
+    Raises:
+        ValidationError: Некорректные параметры операции
+    """
+    if not isinstance(data, Mapping):
+        raise serializers.ValidationError({'data': 'Должно быть объектом JSON'})
+    data = dict(data)
+
+    if op_type == MapOperation.ADD_NODE:
+        if data.get('temp_id') is None:
+            raise serializers.ValidationError({'data': {'temp_id': [_error(_CHAR_MESSAGES, 'required')]}})
+        _check_ref_ids(data, ('temp_id',))
+        values, errors = validate_node(data)
+        if errors:
+            raise serializers.ValidationError({'data': errors})
+        data.update(values)
+    elif op_type == MapOperation.MOVE_NODE:
+        _require_ref(data)
+        if 'latitude' not in data and 'longitude' not in data:
+            raise serializers.ValidationError({'data': 'Требуется latitude или longitude'})
+        values, errors = validate_node_position(data, partial=True)
+        if errors:
+            raise serializers.ValidationError({'data': errors})
+        data.update(values)
+    elif op_type in (MapOperation.DELETE_NODE, MapOperation.DELETE_EDGE):
+        _require_ref(data)
+    elif op_type == MapOperation.ADD_EDGE:
+        _check_ref_ids(data, ('temp_id',))
+        if _require_ref(data, 'node1_') == _require_ref(data, 'node2_'):
+            raise serializers.ValidationError(_SELF_LOOP_MESSAGE)
+        values, errors = validate_edge(data, partial=True)
+        if errors:
+            raise serializers.ValidationError({'data': errors})
+        data.update(values)
+        if data.get('style') is not None:
+            check_edge_style(data['style'])
+    return data
+
+
+def _validate_edge_fields(edge_data, key):
+    """
+    Проверяет описание и стиль ребра так же, как EdgeWriteSerializer.
+
+    Returns:
+        dict: Поля ребра из запроса с приведенными значениями
+
+    Raises:
+        ValidationError: {key: ошибки ребра}
+    """
+    values, errors = validate_edge(edge_data, partial=True)
+    if errors:
+        logger.error(f"Ошибка валидации ребра {edge_data!r}: {errors}")
+        raise serializers.ValidationError({key: errors})
+    if edge_data.get('style'):
+        try:
+            check_edge_style(edge_data['style'])
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError({key: serializers.as_serializer_error(e)})
+    return values
+
+
+def validate_new_edges(edges_data, resolve):
+    """
+    Проверяет новые ребра за один проход и приводит ссылки на узлы к ID из базы.
+
+    Args:
+        edges_data (list): Ребра из запроса
+        resolve (callable): resolve(edge_data, 'node1'|'node2') -> ID узла или None
+
+    Returns:
+        list[dict]: Поля ребер для bulk_create; ребра с ненайденными узлами пропускаются
+
+    Raises:
+        ValidationError: Ребро ссылается само на себя, некорректное описание или стиль
+    """
+    validated = []
+    for edge_data in edges_data or []:
+        values = _validate_edge_fields(edge_data, 'new_edges')
+        node1_id = resolve(edge_data, 'node1')
+        node2_id = resolve(edge_data, 'node2')
+        if node1_id is None or node2_id is None:
+            logger.warning(f"Один или оба узла ребра {edge_data} не найдены для создания нового ребра")
+            continue
+        if node1_id == node2_id:
+            raise serializers.ValidationError({'new_edges': {'non_field_errors': [_SELF_LOOP_MESSAGE]}})
+        validated.append({
+            'node1': node1_id,
+            'node2': node2_id,
+            'description': values.get('description', ''),
+            'style': edge_data.get('style', dict(DEFAULT_EDGE_STYLE)),
+        })
+    return validated
+
+
+def validate_changed_edges(edges_data, resolve):
+    """
+    Проверяет измененные ребра за один проход и приводит ссылки на узлы к ID из базы.
+
+    Args:
+        edges_data (list): Ребра из запроса
+        resolve (callable): resolve(edge_data, 'node1'|'node2') -> ID узла или None
+
+    Returns:
+        dict: Новые значения полей по ID ребра; ребра без корректного ID пропускаются
+
+    Raises:
+        ValidationError: Некорректная ссылка на узел, ребро ссылается само на себя,
+            некорректное описание или стиль
+    """
+    validated = {}
+    for edge_data in edges_data or []:
+        edge_id = coerce_id(edge_data.get('id'))
+        if not edge_id:
+            logger.warning(f"Ребро ID {edge_data.get('id')} не найдено для обновления")
+            continue
+        values = _validate_edge_fields(edge_data, 'changed_edges')
+        for key in ('node1', 'node2'):
+            if key in edge_data or f'{key}_temp_id' in edge_data:
+                values[key] = resolve(edge_data, key)
+                if values[key] is None:
+                    raise serializers.ValidationError({'changed_edges': {key: [_PK_MESSAGE]}})
+        if values.get('node1') is not None and values.get('node1') == values.get('node2'):
+            raise serializers.ValidationError({'changed_edges': {'non_field_errors': [_SELF_LOOP_MESSAGE]}})
+        if 'style' in edge_data:
+            values['style'] = edge_data['style']
+        validated[edge_id] = values
+    return validated
@@ -1,35 +1,378 @@
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
-from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.exceptions import APIException, PermissionDenied, ValidationError
 from rest_framework.response import Response
 from rest_framework import status
 from .forms import UserRegistrationForm, NodeForm, EdgeForm, CreateMapForm, UserProfileForm, AvatarUpdateForm, MapImportForm
-from .models import Node, Edge, Map, CustomUser, HashTag
-from django.http import JsonResponse, HttpResponseForbidden
+from .models import Node, Edge, Map, CustomUser, HashTag, MapOperation, MapVersionConflict, MapAutosaveBuffer
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.db import transaction
 from django.db.models import Max
-from .serializers import MapSerializer
-from .permissions import IsMapOwner
+from .serializers import MapSerializer, MapOperationSerializer, MapDeltaSerializer, MapAutosaveSerializer, MapBulkEditSerializer, MapReadSerializer, MapColumnarSerializer
+from .operations import compact_map_operations, get_batch_size
+from .autosave import buffer_changes, flush_autosave, flush_pending_autosave, pop_rejected_autosave
+from .transforms import apply_bulk_edit
+from .idempotency import claim_key, store_response, release_key, replay_data, request_fingerprint
+from .permissions import IsMapOwner, IsPublishedMap
+from .throttling import MapWriteThrottle
+from .renderers import BINARY_RENDERER_CLASSES, FastJSONRenderer, NDJSONRenderer
+from .columnar import COLUMNAR_FORMATS
+from .spatial import bbox_query, parse_bbox
+from .pagination import KeysetPagination, get_max_page_size
+from .clustering import MAX_CLUSTER_ZOOM, map_clusters
+from .representations import CACHED_FORMATS, STALE, cached_representation
+from .public_cache import patch_public_cache
+from .snapshots import snapshot_url
+from .streaming import stream_map
+from django.db.models.functions import Greatest, Least
+from rest_framework.settings import api_settings
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.db.models import Exists, OuterRef
+from .timing import RequestTimer
 from rest_framework import generics
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
 import json
+import re
 
 
 import logging
 
 logger = logging.getLogger(__name__)
 
-class MapDetailAPI(generics.RetrieveUpdateDestroyAPIView):
+ETAG_VERSION_RE = re.compile(r'^"v(\d+)(?:\.[a-z]+)?"$')
+
+
+def map_etag(map_instance, format=None):
+    """
+    Возвращает сильный ETag карты, построенный по ее версии.
+
+    Для бинарных представлений и NDJSON к версии добавляется формат
+    ("v5.msgpack"), чтобы разные представления одной версии не совпадали по ETag.
+    """
+    if format in COLUMNAR_FORMATS or format == NDJSONRenderer.format:
+        return f'"v{map_instance.version}.{format}"'
+    return f'"v{map_instance.version}"'
+
+
+def map_last_modified(map_instance):
+    """Возвращает значение заголовка Last-Modified карты."""
+    return http_date(map_instance.updated_at.timestamp())
+
+
+def map_validators(map_id):
+    """
+    Загружает поля карты, нужные для условного GET, одним запросом по первичному ключу.
+
+    Вместе с версией и временем изменения запрос проверяет, есть ли
+    у карты несвернутые операции журнала или несброшенный буфер
+    автосохранения: тогда версия в строке карты еще не окончательная.
+
+    Returns:
+        Map: Карта с полями id, owner_id, is_published, version, updated_at
+            и признаками pending_operations, pending_autosave или None, если карты нет
+    """
+    return (
+        Map.objects.filter(pk=map_id)
+        .only('id', 'owner_id', 'is_published', 'version', 'updated_at')
+        .annotate(
+            pending_operations=Exists(MapOperation.objects.filter(map=OuterRef('pk'), applied_at__isnull=True)),
+            pending_autosave=Exists(MapAutosaveBuffer.objects.filter(map=OuterRef('pk'), buffered_at__isnull=False)),
+        )
+        .first()
+    )
+
+
+class ConditionalMapMixin:
+    """
+    Условный GET карты (If-None-Match, If-Modified-Since).
+
+    Если представление у клиента актуально, ответ 304 собирается после
+    одного запроса по первичному ключу карты, без загрузки узлов и ребер
+    и без сворачивания отложенных изменений. Карты с отложенными
+    изменениями всегда идут по полному пути: после их записи версия
+    изменится.
+    """
+
+    def not_modified(self, request):
+        """Возвращает ответ 304 или None, если ответ нужно собирать полностью."""
+        if 'HTTP_IF_NONE_MATCH' not in request.META and 'HTTP_IF_MODIFIED_SINCE' not in request.META:
+            return None
+        instance = map_validators(self.kwargs['pk'])
+        if instance is None or instance.pending_operations or instance.pending_autosave:
+            return None
+        self.check_object_permissions(request, instance)
+        conditional = get_conditional_response(
+            request,
+            etag=map_etag(instance, request.accepted_renderer.format),
+            last_modified=int(instance.updated_at.timestamp()),
+        )
+        if conditional is None or conditional.status_code != status.HTTP_304_NOT_MODIFIED:
+            return None
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        self.set_validators(response, instance)
+        return response
+
+    def set_validators(self, response, instance):
+        """Добавляет в ответ ETag, Last-Modified и Vary."""
+        response['ETag'] = map_etag(instance, self.request.accepted_renderer.format)
+        response['Last-Modified'] = map_last_modified(instance)
+        patch_vary_headers(response, ['Accept'])
+
+
+def parse_if_match(header):
+    """
+    Разбирает заголовок If-Match.
+
+    Args:
+        header (str): Значение заголовка или None
+
+    Returns:
+        tuple: (any_version, versions), где any_version - True для "*",
+            versions - список версий из сильных ETag вида "v<версия>".
+            Слабые (W/) и чужие ETag пропускаются: для If-Match
+            используется сильное сравнение.
+    """
+    if not header:
+        return False, []
+    versions = []
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True, []
+        match = ETAG_VERSION_RE.match(tag)
+        if match:
+            versions.append(int(match.group(1)))
+    return False, versions
+
+
+def apply_pending_changes(instance):
+    """
+    Записывает в карту отложенные изменения перед чтением или записью:
+    сворачивает накопленные операции журнала и сбрасывает буфер автосохранения.
+    """
+    if instance.operations.filter(applied_at__isnull=True).exists():
+        compact_map_operations(instance.id)
+    if flush_pending_autosave(instance):
+        instance.refresh_from_db()
+
+
+class MapObjectMixin:
+    """Загружает карту с записанными отложенными изменениями (apply_pending_changes)."""
+
+    def get_object(self):
+        instance = super().get_object()
+        apply_pending_changes(instance)
+        return instance
+
+
+class MapRepresentationMixin:
+    """
+    Отдает карту целиком: закодированное представление берется из кеша представлений.
+
+    Предыдущая версия карты (stale-while-revalidate) отдается только при
+    serve_stale: ответ владельцу должен содержать все, что он записал.
+    """
+
+    serve_stale = False
+
+    def map_response(self, instance):
+        """
+        Возвращает ответ с картой целиком.
+
+        Закодированная карта хранится в кеше представлений по версии
+        (MainApp/representations.py); запросы с параметрами формата
+        (indent) кодируются каждый раз. В NDJSON карта отдается потоком
+        записей (MainApp/streaming.py) без сборки ответа в памяти.
+        """
+        renderer = self.request.accepted_renderer
+        if renderer.format == NDJSONRenderer.format:
+            response = StreamingHttpResponse(
+                stream_map(instance, renderer, self.get_serializer_context()), content_type=renderer.media_type
+            )
+            self.set_validators(response, instance)
+            return response
+        if renderer.format in CACHED_FORMATS and self.request.accepted_media_type == renderer.media_type:
+            entry, state = cached_representation(
+                instance, renderer.format, lambda: self.render_map(instance), allow_stale=self.serve_stale
+            )
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+            response['ETag'] = entry['etag']
+            if state != STALE:
+                response['Last-Modified'] = map_last_modified(instance)
+            patch_vary_headers(response, ['Accept'])
+            response['Map-Cache'] = state
+            if state != STALE:
+                # Сжатые варианты хранятся рядом с записью (CompressionMiddleware)
+                response.representation_key = entry['key']
+            return response
+        response = Response(self.get_map_serializer(instance).data)
+        self.set_validators(response, instance)
+        return response
+
+    def get_map_serializer(self, instance):
+        """
+        Возвращает сериализатор карты целиком: узлы и ребра собираются без
+        полей DRF на каждую строку, для msgpack/CBOR - по столбцам.
+        """
+        if self.request.accepted_renderer.format in COLUMNAR_FORMATS:
+            return MapColumnarSerializer(instance, context=self.get_serializer_context())
+        return MapReadSerializer(instance, context=self.get_serializer_context())
+
+    def render_map(self, instance):
+        """Кодирует карту целиком в формат запроса для кеша представлений."""
+        renderer = self.request.accepted_renderer
+        content = renderer.render(
+            self.get_map_serializer(instance).data, self.request.accepted_media_type, self.get_renderer_context()
+        )
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        return {'content': content, 'content_type': content_type, 'etag': map_etag(instance, renderer.format)}
+
+
+class MapDetailAPI(ConditionalMapMixin, MapRepresentationMixin, MapObjectMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Map.objects.all()
     serializer_class = MapSerializer
     permission_classes = [IsMapOwner]
-    http_method_names = ['get', 'patch', 'delete', 'head', 'options']
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + BINARY_RENDERER_CLASSES + [NDJSONRenderer]
+    # PATCH и PUT списывают токены по числу операций над узлами и ребрами
+    throttle_classes = [MapWriteThrottle]
+    http_method_names = ['get', 'put', 'patch', 'delete', 'head', 'options']
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Возвращает карту целиком или, при ?since=<версия>, только изменения
+        после этой версии вместе с ID удаленных узлов и ребер.
+
+        Если у клиента актуальная версия (If-None-Match, If-Modified-Since),
+        отвечает 304 без загрузки карты.
+        """
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        instance = self.get_object()
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError({'since': 'Должен быть целым числом'})
+            # Версия из будущего (например, после восстановления базы) - отдаем карту целиком
+            if 0 <= since <= instance.version:
+                context = self.get_serializer_context()
+                context['since'] = since
+                response = Response(MapDeltaSerializer(instance, context=context).data)
+                self.set_validators(response, instance)
+                return response
+        return self.map_response(instance)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # PUT присылает полное состояние карты, которое синхронизируется по разнице
+        context['full_sync'] = self.request.method == 'PUT'
+        context['expected_version'] = getattr(self, 'expected_version', None)
+        context['timer'] = getattr(self, 'timer', None)
+        return context
+
+    def precondition_failed(self, instance, client_version):
+        """
+        Ответ 412 на запись поверх устаревшей версии карты.
+
+        Тело содержит текущую версию и изменения после версии клиента, чтобы
+        клиент мог слить их со своими правками и повторить запрос без
+        полной перезагрузки карты. Если версия клиента неизвестна, вместо
+        изменений возвращается карта целиком.
+        """
+        instance.refresh_from_db()
+        logger.warning(
+            f"Конфликт версий карты ID: {instance.id}: клиент {client_version}, сервер {instance.version}"
+        )
+        context = self.get_serializer_context()
+        if client_version is not None and 0 <= client_version <= instance.version:
+            context['since'] = client_version
+            data = MapDeltaSerializer(instance, context=context).data
+        else:
+            data = MapSerializer(instance, context=context).data
+        response = Response(
+            {
+                'error': 'Карта была изменена после загрузки',
+                'version': instance.version,
+                'changes': data,
+            },
+            status=status.HTTP_412_PRECONDITION_FAILED,
+        )
+        response['ETag'] = map_etag(instance)
+        return response
 
     def update(self, request, *args, **kwargs):
+        """
+        Применяет PATCH или PUT с замером стадий (MainApp/timing.py).
+
+        По каждому запросу в лог пишется запись с временем и числом
+        SQL-запросов стадий; при MAP_SERVER_TIMING они же отдаются
+        в заголовке Server-Timing.
+        """
+        with RequestTimer('map_update', method=request.method, map_id=self.kwargs.get('pk')) as timer:
+            self.timer = timer
+            response = self.idempotent_update(request, *args, **kwargs)
+        return timer.report(response)
+
+    def idempotent_update(self, request, *args, **kwargs):
+        """
+        Применяет PATCH или PUT.
+
+        С заголовком Idempotency-Key результат запроса сохраняется по ключу
+        (карта, ключ) на MAP_IDEMPOTENCY_TTL секунд, а повтор с тем же ключом
+        получает текущую карту с client_index_map исходного запроса без
+        повторного применения изменений. Ключ резервируется в одной
+        транзакции с записью в карту. Ответы с ошибками не сохраняются:
+        изменения в них не применены, и такой запрос можно повторить.
+        """
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return self.apply_update(request, *args, **kwargs)
+        if len(key) > 255:
+            raise ValidationError({'Idempotency-Key': 'Не длиннее 255 символов'})
+
+        with transaction.atomic():
+            with self.timer.span('idempotency'):
+                instance = get_object_or_404(self.get_queryset(), pk=self.kwargs['pk'])
+                self.check_object_permissions(request, instance)
+                fingerprint = request_fingerprint(request)
+                record, created = claim_key(instance, key, fingerprint)
+            if not created:
+                if record.request_hash != fingerprint:
+                    return Response(
+                        {'error': 'Ключ идемпотентности уже использован для другого запроса'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                return self.replay(record)
+
+            response = self.apply_update(request, *args, **kwargs)
+            if response.status_code >= 400:
+                release_key(record)
+            else:
+                store_response(record, response)
+        return response
+
+    def replay(self, record):
+        """Ответ на повтор запроса: текущая карта с сохраненным client_index_map."""
+        instance = self.get_object()
+        logger.info(f"Карта ID: {instance.id}: повтор запроса с ключом {record.key}, возвращен сохраненный результат")
+        data = MapSerializer(instance, context=self.get_serializer_context()).data
+        response = Response(replay_data(record, data), status=record.status_code)
+        response['ETag'] = map_etag(instance)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def apply_update(self, request, *args, **kwargs):
         try:
-            instance = self.get_object()
+            with self.timer.span('load'):
+                instance = self.get_object()
             logger.info(f"Запрос на обновление карты ID: {instance.id}")
             logger.debug(f"Данные запроса: {request.data}")
             
@@ -37,18 +380,44 @@ class MapDetailAPI(generics.RetrieveUpdateDestroyAPIView):
             if instance.owner != request.user:
                 logger.warning(f"Отказ в доступе: пользователь {request.user} пытается редактировать карту пользователя {instance.owner}")
                 raise PermissionDenied("Вы не можете изменять эту карту")
+
+            # If-Match: запись разрешена, только если клиент видел текущую версию.
+            # Здесь отсекаются заведомо устаревшие запросы, а гонку между проверкой
+            # и записью закрывает условное увеличение версии в MapBulkWriter
+            any_version, versions = parse_if_match(request.headers.get('If-Match'))
+            self.expected_version = None
+            if versions:
+                if instance.version not in versions:
+                    return self.precondition_failed(instance, max(versions))
+                self.expected_version = instance.version
+            elif request.headers.get('If-Match') and not any_version:
+                return self.precondition_failed(instance, None)
             
-            # Всегда используем partial=True, так как используется только PATCH
+            # Всегда используем partial=True: PATCH присылает изменения, а PUT - только
+            # узлы и ребра без остальных полей карты
             serializer = self.get_serializer(instance, data=request.data, partial=True)
             
-            if not serializer.is_valid():
+            with self.timer.span('validate'):
+                is_valid = serializer.is_valid()
+            if not is_valid:
                 logger.error(f"Ошибка валидации: {serializer.errors}")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
-            self.perform_update(serializer)
+            try:
+                with self.timer.span('save'):
+                    self.perform_update(serializer)
+            except MapVersionConflict:
+                return self.precondition_failed(instance, self.expected_version)
             logger.info(f"Карта ID: {instance.id} успешно обновлена")
-            return Response(serializer.data)
-            
+            with self.timer.span('serialize'):
+                data = serializer.data
+            response = Response(data)
+            response['ETag'] = map_etag(instance)
+            return response
+
+        except (APIException, Http404):
+            # Отказ в доступе и отсутствующая карта - ответы 403 и 404, а не ошибка сервера
+            raise
         except Exception as e:
             logger.exception("Ошибка при обновлении карты")
             return Response(
@@ -59,6 +428,364 @@ class MapDetailAPI(generics.RetrieveUpdateDestroyAPIView):
     def perform_update(self, serializer):
         serializer.save()
 
+
+class PublishedMapAPI(ConditionalMapMixin, MapRepresentationMixin, generics.RetrieveAPIView):
+    """
+    Опубликованная карта целиком для просмотра без входа в систему.
+
+    Запрос не читает сессию и не зависит от cookie, поэтому ответ
+    одинаков для всех и кешируется в nginx (Cache-Control public,
+    s-maxage; MainApp/public_cache.py). Формат выбирается по Accept
+    так же, как в MapDetailAPI; изменения по ?since= не поддерживаются.
+
+    Запрос только читает базу: отложенные изменения (журнал операций,
+    буфер автосохранения) не записываются, и карта отдается в последнем
+    записанном состоянии. Их запишут фоновые команды или запрос владельца,
+    после чего изменится версия карты.
+    """
+    queryset = Map.objects.all()
+    authentication_classes = []
+    permission_classes = [IsPublishedMap]
+    renderer_classes = [FastJSONRenderer] + BINARY_RENDERER_CLASSES
+    serve_stale = True
+
+    def retrieve(self, request, *args, **kwargs):
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        return self.map_response(self.get_object())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            patch_public_cache(response)
+        return response
+
+class MapOperationsAPI(generics.GenericAPIView):
+    """
+    Журнал операций карты.
+
+    POST принимает пачку операций с порядковыми номерами и только дописывает их
+    в журнал; в таблицы узлов и ребер они сворачиваются фоновым компактором
+    (команда compact_map_operations) или при следующем обращении к карте.
+    Повторная отправка операции с тем же seq игнорируется, поэтому запросы
+    можно безопасно повторять; received - число новых операций. Новая
+    операция с seq не больше последней примененной отклоняется с 409: она
+    пришла слишком поздно и нарушила бы порядок применения. GET возвращает
+    историю операций после ?after=<seq>.
+    """
+    queryset = Map.objects.all()
+    serializer_class = MapOperationSerializer
+    permission_classes = [IsMapOwner]
+    throttle_classes = [MapWriteThrottle]
+
+    def get(self, request, *args, **kwargs):
+        instance = self.get_object()
+        try:
+            after = int(request.query_params.get('after', 0))
+        except ValueError:
+            raise ValidationError({'after': 'Должен быть целым числом'})
+        operations = instance.operations.filter(seq__gt=after).order_by('seq')[:get_batch_size()]
+        return Response(self.get_serializer(operations, many=True).data)
+
+    def post(self, request, *args, **kwargs):
+        instance = self.get_object()
+        if not isinstance(request.data, dict):
+            raise ValidationError({'operations': 'Ожидается объект JSON с полем operations'})
+        serializer = self.get_serializer(data=request.data.get('operations', []), many=True)
+        if not serializer.is_valid():
+            logger.error(f"Ошибка валидации операций карты ID {instance.id}: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Повторы одного seq в пачке: остается первая операция
+        items = {}
+        for item in serializer.validated_data:
+            items.setdefault(item['seq'], item)
+        # Блокировка строки карты, как в компакторе: операция не попадет
+        # в журнал между проверкой номеров и сворачиванием более поздних
+        with transaction.atomic():
+            last_applied_seq = (
+                Map.objects.select_for_update()
+                .filter(pk=instance.pk)
+                .values_list('last_applied_seq', flat=True)
+                .first()
+            )
+            existing = set(instance.operations.filter(seq__in=items).values_list('seq', flat=True))
+            late = sorted(seq for seq in items if seq not in existing and seq <= last_applied_seq)
+            if late:
+                logger.warning(f"Карта ID {instance.id}: операции {late} пришли после применения #{last_applied_seq}")
+                return Response(
+                    {
+                        'seq': f'Операции до #{last_applied_seq} включительно уже применены',
+                        'late_seq': late,
+                        'last_applied_seq': last_applied_seq,
+                    },
+                    status=status.HTTP_409_CONFLICT,
+                )
+            new_operations = [
+                MapOperation(map=instance, author=request.user, **item)
+                for seq, item in items.items() if seq not in existing
+            ]
+            MapOperation.objects.bulk_create(new_operations, ignore_conflicts=True)
+            last_seq = max(instance.operations.aggregate(last_seq=Max('seq'))['last_seq'] or 0, last_applied_seq)
+        logger.info(f"Карта ID {instance.id}: получено операций: {len(new_operations)}")
+        return Response({'received': len(new_operations), 'last_seq': last_seq}, status=status.HTTP_202_ACCEPTED)
+
+
+class MapNodesAPI(ConditionalMapMixin, MapObjectMixin, generics.GenericAPIView):
+    """
+    Узлы карты, попадающие в окно ?bbox=minLon,minLat,maxLon,maxLat.
+
+    Выборка идет по индексу ключа ячейки сетки (Node.grid_cell,
+    MainApp/spatial.py), поэтому клиент может подгружать большие карты
+    по мере перемещения по ним. Без bbox возвращаются все узлы карты.
+    Узлы отдаются в том же виде, что и в карте целиком.
+
+    ?ids=1,2,3 оставляет только узлы с этими ID. С параметрами ?limit=
+    и ?after= узлы отдаются страницами по ID (KeysetPagination,
+    MainApp/pagination.py), иначе - списком.
+    """
+    queryset = Map.objects.all()
+    permission_classes = [IsMapOwner]
+    pagination_class = KeysetPagination
+
+    def get_bbox(self):
+        value = self.request.query_params.get('bbox')
+        if value is None:
+            return None
+        try:
+            return parse_bbox(value)
+        except ValueError:
+            raise ValidationError({'bbox': 'Ожидается minLon,minLat,maxLon,maxLat'})
+
+    def get_ids(self):
+        value = self.request.query_params.get('ids')
+        if value is None:
+            return None
+        try:
+            ids = [int(part) for part in value.split(',') if part.strip()]
+        except ValueError:
+            raise ValidationError({'ids': 'Ожидается список ID через запятую'})
+        if len(ids) > get_max_page_size():
+            raise ValidationError({'ids': f'Не больше {get_max_page_size()} ID'})
+        return ids
+
+    def filter_objects(self, instance, bbox):
+        nodes = instance.nodes.all()
+        if bbox is not None:
+            nodes = nodes.filter(bbox_query(bbox))
+        return nodes
+
+    def object_rows(self, queryset):
+        return MapReadSerializer.node_rows(queryset)
+
+    def get(self, request, *args, **kwargs):
+        bbox, ids = self.get_bbox(), self.get_ids()
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        instance = self.get_object()
+        queryset = self.filter_objects(instance, bbox)
+        if ids is not None:
+            queryset = queryset.filter(id__in=ids)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response(page)
+        else:
+            response = Response(self.object_rows(queryset))
+        self.set_validators(response, instance)
+        return response
+
+
+class MapEdgesAPI(MapNodesAPI):
+    """
+    Ребра карты, касающиеся окна ?bbox=minLon,minLat,maxLon,maxLat:
+    прямоугольник, описанный вокруг ребра, пересекается с окном. Так в окно
+    попадают и длинные ребра, оба конца которых лежат за его пределами.
+    Фильтр ?ids= и страницы - как у MapNodesAPI.
+    """
+
+    def filter_objects(self, instance, bbox):
+        edges = instance.edges.all()
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            edges = edges.annotate(
+                south=Least('node1__latitude', 'node2__latitude'),
+                north=Greatest('node1__latitude', 'node2__latitude'),
+                west=Least('node1__longitude', 'node2__longitude'),
+                east=Greatest('node1__longitude', 'node2__longitude'),
+            ).filter(south__lte=max_lat, north__gte=min_lat, west__lte=max_lon, east__gte=min_lon)
+        return edges
+
+    def object_rows(self, queryset):
+        return MapReadSerializer.edge_rows(queryset)
+
+
+class MapClustersAPI(MapNodesAPI):
+    """
+    Кластеры узлов карты для уровня масштаба ?zoom=<уровень>&bbox=....
+
+    Узлы сгруппированы по ячейкам сетки экрана (MainApp/clustering.py),
+    ребра - в связи между кластерами с числом ребер. Пирамида кластеров
+    хранится в кеше и дополняется изменениями карты по версиям. Уровни
+    больше MAX_CLUSTER_ZOOM отдаются как MAX_CLUSTER_ZOOM.
+    """
+
+    def get_zoom(self):
+        try:
+            zoom = int(self.request.query_params.get('zoom', ''))
+        except ValueError:
+            raise ValidationError({'zoom': 'Ожидается целый уровень масштаба'})
+        if zoom < 0:
+            raise ValidationError({'zoom': 'Уровень масштаба не может быть отрицательным'})
+        return min(zoom, MAX_CLUSTER_ZOOM)
+
+    def get(self, request, *args, **kwargs):
+        zoom, bbox = self.get_zoom(), self.get_bbox()
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        instance = self.get_object()
+        response = Response(map_clusters(instance, zoom, bbox))
+        self.set_validators(response, instance)
+        return response
+
+
+class MapBulkEditAPI(MapObjectMixin, generics.GenericAPIView):
+    """
+    Массовые геометрические операции и изменение стиля для выборки карты.
+
+    POST принимает селектор (node_ids, edge_ids, bbox, node_filter или
+    edge_filter) и список операций (translate, rotate, scale, set_style).
+    Новые координаты вычисляются в базе, изменения записываются одним
+    UPDATE узлов и одним UPDATE ребер независимо от размера выборки
+    (MainApp/transforms.py). Поддерживает If-Match, как и PATCH карты;
+    измененные узлы и ребра получают новую версию и попадают в ?since=.
+    """
+    queryset = Map.objects.all()
+    serializer_class = MapBulkEditSerializer
+    permission_classes = [IsMapOwner]
+    throttle_classes = [MapWriteThrottle]
+
+    def post(self, request, *args, **kwargs):
+        instance = self.get_object()
+        any_version, versions = parse_if_match(request.headers.get('If-Match'))
+        expected_version = None
+        if versions:
+            if instance.version not in versions:
+                return self.precondition_failed(instance)
+            expected_version = instance.version
+        elif request.headers.get('If-Match') and not any_version:
+            return self.precondition_failed(instance)
+
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            logger.error(f"Ошибка валидации массового изменения карты ID {instance.id}: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                result = apply_bulk_edit(
+                    instance,
+                    serializer.validated_data['selector'],
+                    serializer.validated_data['operations'],
+                    expected_version=expected_version,
+                )
+        except MapVersionConflict:
+            return self.precondition_failed(instance)
+        instance.refresh_from_db()
+        response = Response(dict(result, version=instance.version))
+        response['ETag'] = map_etag(instance)
+        return response
+
+    def precondition_failed(self, instance):
+        instance.refresh_from_db()
+        response = Response(
+            {'error': 'Карта была изменена после загрузки', 'version': instance.version},
+            status=status.HTTP_412_PRECONDITION_FAILED,
+        )
+        response['ETag'] = map_etag(instance)
+        return response
+
+
+class MapAutosaveAPI(generics.GenericAPIView):
+    """
+    Автосохранение карты через буфер отложенной записи.
+
+    POST принимает изменения в формате PATCH-запроса карты и сливает их
+    в буфер карты (MapAutosaveBuffer) без записи в таблицы узлов и ребер.
+    Повторные правки одного узла объединяются, а буфер сбрасывается одним
+    пакетом по таймеру (команда flush_autosave_buffers), при накоплении
+    MAP_AUTOSAVE_MAX_EDITS изменений, при явном сохранении
+    (POST .../autosave/flush/) или перед обращением к карте.
+    DELETE отбрасывает несохраненные изменения.
+
+    Если изменения из буфера не прошли проверку при сбросе, следующий POST
+    не принимает новые правки и отвечает 409 с ошибкой и отклоненными
+    изменениями (pop_rejected_autosave): клиент должен сверить свое
+    состояние с картой и прислать правки заново.
+    """
+    queryset = Map.objects.all()
+    serializer_class = MapAutosaveSerializer
+    permission_classes = [IsMapOwner]
+    throttle_classes = [MapWriteThrottle]
+
+    def post(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            logger.error(f"Ошибка валидации автосохранения карты ID {instance.id}: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        rejected = pop_rejected_autosave(instance)
+        if rejected is not None:
+            return Response(rejected, status=status.HTTP_409_CONFLICT)
+        buffer = buffer_changes(instance, serializer.validated_data)
+        return Response(
+            {
+                'edits': buffer.edits,
+                'buffered_at': buffer.buffered_at,
+                'client_index_map': buffer.node_ids,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    def delete(self, request, *args, **kwargs):
+        instance = self.get_object()
+        MapAutosaveBuffer.objects.filter(map=instance).delete()
+        logger.info(f"Карта ID {instance.id}: буфер автосохранения очищен")
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MapAutosaveFlushAPI(generics.GenericAPIView):
+    """
+    Явное сохранение карты: сбрасывает буфер автосохранения и возвращает
+    карту целиком вместе с client_index_map для всех узлов, созданных
+    из буфера с момента предыдущего явного сохранения.
+
+    Если изменения из буфера отклонены (сейчас или при предыдущем сбросе),
+    отвечает 409 с ошибкой и отклоненными изменениями.
+    """
+    queryset = Map.objects.all()
+    serializer_class = MapSerializer
+    permission_classes = [IsMapOwner]
+    throttle_classes = [MapWriteThrottle]
+
+    def post(self, request, *args, **kwargs):
+        instance = self.get_object()
+        rejected = pop_rejected_autosave(instance)
+        if rejected is None:
+            try:
+                node_ids = flush_autosave(instance.id, forget_ids=True)
+            except ValidationError as e:
+                rejected = pop_rejected_autosave(instance) or {'details': e.detail}
+        if rejected is not None:
+            return Response(rejected, status=status.HTTP_409_CONFLICT)
+        instance.refresh_from_db()
+        data = self.get_serializer(instance).data
+        data['client_index_map'] = node_ids
+        response = Response(data)
+        response['ETag'] = map_etag(instance)
+        return response
+
 @login_required
 def main_page(request):
     """
@@ -206,18 +933,24 @@ def edit_map(request, map_id):
         if 'node_submit' in request.POST:
             node_form = NodeForm(request.POST)
             if node_form.is_valid():
-                new_node = node_form.save()
                 map_instance = Map.objects.get(id=map_id)
-                map_instance.nodes.add(new_node)
+                with transaction.atomic():
+                    new_node = node_form.save(commit=False)
+                    new_node.version = map_instance.bump_version()
+                    new_node.save()
+                    map_instance.nodes.add(new_node)
             else:
                 errors.append("Node save error.")
 
         elif 'edge_submit' in request.POST:
             edge_form = EdgeForm(request.POST)
             if edge_form.is_valid():
-                new_edge = edge_form.save()
                 map_instance = Map.objects.get(id=map_id)
-                map_instance.edges.add(new_edge)
+                with transaction.atomic():
+                    new_edge = edge_form.save(commit=False)
+                    new_edge.version = map_instance.bump_version()
+                    new_edge.save()
+                    map_instance.edges.add(new_edge)
             else:
                 errors.append("Edge save error.")
                 
@@ -238,6 +971,8 @@ def edit_map(request, map_id):
                     tag, created = HashTag.objects.get_or_create(name=tag_name)
                     map_obj.hashtags.add(tag)
             
+            map_obj.bump_version()
+
             # Update the hashtags string for the form
             hashtags_str = ' '.join([f"#{tag.name}" for tag in map_obj.hashtags.all()])
             messages.success(request, 'Хештеги успешно обновлены!')
@@ -345,8 +1080,10 @@ def custom_logout(request):
 def publish_map(request, map_id):
     map_obj = get_object_or_404(Map, id=map_id, owner=request.user)
     if request.method == 'POST':
-        map_obj.is_published = True
-        map_obj.save()
+        with transaction.atomic():
+            map_obj.is_published = True
+            map_obj.save()
+            map_obj.bump_version()
         messages.success(request, 'Карта успешно опубликована!')
     return redirect('user_maps')
 
@@ -354,8 +1091,10 @@ def publish_map(request, map_id):
 def unpublish_map(request, map_id):
     map_obj = get_object_or_404(Map, id=map_id, owner=request.user)
     if request.method == 'POST':
-        map_obj.is_published = False
-        map_obj.save()
+        with transaction.atomic():
+            map_obj.is_published = False
+            map_obj.save()
+            map_obj.bump_version()
         messages.success(request, 'Карта снята с публикации!')
     return redirect('user_maps')
 
@@ -382,7 +1121,9 @@ def view_map(request, map_id):
     
     return render(request, 'view_map.html', {
         'map': map_instance,
-        'is_owner': request.user.is_authenticated and map_instance.owner == request.user
+        'is_owner': request.user.is_authenticated and map_instance.owner == request.user,
+        # Опубликованная карта загружается клиентом из статического снимка
+        'snapshot_url': snapshot_url(map_instance) if map_instance.is_published else None,
     })
 
 @login_required
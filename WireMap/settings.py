@@ -55,6 +55,7 @@ if not os.path.exists(MEDIA_ROOT):
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Добавлен WhiteNoise
+    'MainApp.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -95,6 +96,25 @@ DATABASES = {
     )
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# default - локальный кеш процесса (представления карт). shared - общий для
+# процессов gunicorn кеш (лимиты записи): Redis, если задан REDIS_URL, иначе
+# таблица в базе (создается командой createcachetable)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    } if os.getenv('REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'wiremap_cache',
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -155,6 +175,94 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'MainApp/media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# JSON API кодируется и разбирается через orjson, если он установлен
+# (MainApp/renderers.py, MainApp/parsers.py), иначе - стандартным json
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'MainApp.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'MainApp.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# Размер пакета операций журнала карты, сворачиваемых в узлы и ребра за одну транзакцию
+MAP_OPERATIONS_BATCH_SIZE = int(os.getenv('MAP_OPERATIONS_BATCH_SIZE', 500))
+
+# Буфер автосохранения: сброс по таймеру (секунды) и по числу накопленных изменений
+MAP_AUTOSAVE_FLUSH_INTERVAL = int(os.getenv('MAP_AUTOSAVE_FLUSH_INTERVAL', 30))
+MAP_AUTOSAVE_MAX_EDITS = int(os.getenv('MAP_AUTOSAVE_MAX_EDITS', 200))
+
+# Время хранения ответов на запросы с заголовком Idempotency-Key (секунды)
+MAP_IDEMPOTENCY_TTL = int(os.getenv('MAP_IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+# Ограничение записи в карту по стоимости запросов (MainApp/throttling.py):
+# емкость корзины в операциях над узлами и ребрами и скорость ее пополнения
+# (операций в секунду) для каждого пользователя и каждой карты. Корзины хранятся
+# в кеше MAP_WRITE_THROTTLE_CACHE из CACHES; если он локален для процесса
+# (LocMemCache), ограничение отключается
+MAP_WRITE_THROTTLE_CACHE = os.getenv('MAP_WRITE_THROTTLE_CACHE', 'shared')
+MAP_WRITE_THROTTLE_RATES = {
+    'user': {
+        'capacity': int(os.getenv('MAP_WRITE_THROTTLE_USER_CAPACITY', 20000)),
+        'rate': float(os.getenv('MAP_WRITE_THROTTLE_USER_RATE', 200)),
+    },
+    'map': {
+        'capacity': int(os.getenv('MAP_WRITE_THROTTLE_MAP_CAPACITY', 10000)),
+        'rate': float(os.getenv('MAP_WRITE_THROTTLE_MAP_RATE', 100)),
+    },
+}
+
+# Заголовок Server-Timing со стадиями сохранения карты (MainApp/timing.py);
+# запись о стадиях пишется в лог MainApp.timing независимо от этой настройки
+MAP_SERVER_TIMING = os.getenv('MAP_SERVER_TIMING', str(DEBUG)).lower() == 'true'
+
+# Страницы узлов и ребер в /api/v1/maps/<id>/nodes/ и /edges/ (MainApp/pagination.py):
+# размер страницы по умолчанию и наибольший размер, который может запросить клиент
+MAP_OBJECTS_PAGE_SIZE = int(os.getenv('MAP_OBJECTS_PAGE_SIZE', 1000))
+MAP_OBJECTS_MAX_PAGE_SIZE = int(os.getenv('MAP_OBJECTS_MAX_PAGE_SIZE', 10000))
+
+# Потоковая выгрузка карты в NDJSON (MainApp/streaming.py): число узлов или ребер,
+# читаемых из базы за один раз
+MAP_STREAM_CHUNK_SIZE = int(os.getenv('MAP_STREAM_CHUNK_SIZE', 2000))
+
+# Кеш закодированных представлений карты (MainApp/representations.py): алиас
+# из CACHES, время хранения и окно, в течение которого после изменения карты
+# отдается предыдущая версия, пока строится новая (stale-while-revalidate)
+MAP_REPRESENTATION_CACHE = os.getenv('MAP_REPRESENTATION_CACHE', 'default')
+MAP_REPRESENTATION_TIMEOUT = int(os.getenv('MAP_REPRESENTATION_TIMEOUT', 24 * 60 * 60))
+MAP_REPRESENTATION_STALE_TIMEOUT = int(os.getenv('MAP_REPRESENTATION_STALE_TIMEOUT', 30))
+
+# Сжатие ответов API (MainApp/compression.py): ответы короче порога не сжимаются
+MAP_COMPRESSION_MIN_SIZE = int(os.getenv('MAP_COMPRESSION_MIN_SIZE', 1024))
+
+# Публичное API опубликованных карт (MainApp/public_cache.py): время хранения
+# в кеше nginx и каталог proxy_cache_path с его levels, если он смонтирован
+# в контейнер Django (тогда измененная карта удаляется из кеша сразу)
+MAP_PUBLIC_CACHE_MAX_AGE = int(os.getenv('MAP_PUBLIC_CACHE_MAX_AGE', 10))
+MAP_PUBLIC_CACHE_ROOT = os.getenv('MAP_PUBLIC_CACHE_ROOT') or None
+MAP_PUBLIC_CACHE_LEVELS = os.getenv('MAP_PUBLIC_CACHE_LEVELS', '1:2')
+
+# Файлы опубликованных карт для nginx строятся в фоне (MainApp/rebuilds.py):
+# после того как карта не менялась MAP_REBUILD_DELAY секунд, но не позже
+# MAP_REBUILD_MAX_DELAY секунд после первого изменения
+MAP_REBUILD_DELAY = int(os.getenv('MAP_REBUILD_DELAY', 10))
+MAP_REBUILD_MAX_DELAY = int(os.getenv('MAP_REBUILD_MAX_DELAY', 120))
+
+# Снимки опубликованных карт (MainApp/snapshots.py): JSON карты целиком,
+# который nginx отдает по MAP_SNAPSHOTS_URL без участия Django
+MAP_SNAPSHOTS_ROOT = os.getenv('MAP_SNAPSHOTS_ROOT', os.path.join(MEDIA_ROOT, 'snapshots'))
+MAP_SNAPSHOTS_URL = os.getenv('MAP_SNAPSHOTS_URL', MEDIA_URL + 'snapshots/')
+
+# Тайлы опубликованных карт (MainApp/tiles.py): каталог, который nginx отдает
+# по MAP_TILES_URL без участия Django, и наибольший уровень масштаба
+MAP_TILES_ROOT = os.getenv('MAP_TILES_ROOT', os.path.join(BASE_DIR, 'tiles'))
+MAP_TILES_URL = '/tiles/'
+MAP_TILES_MAX_ZOOM = int(os.getenv('MAP_TILES_MAX_ZOOM', 12))
+
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
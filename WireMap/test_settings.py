@@ -0,0 +1,12 @@
+"""
+Настройки Django для тестов (pytest.ini).
+
+Совпадают с WireMap/settings.py, но лог пишется только в консоль:
+прогон тестов не должен дописывать debug.log в рабочем каталоге.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import LOGGING
+
+LOGGING['handlers'].pop('file', None)
+for logger_config in LOGGING['loggers'].values():
+    logger_config['handlers'] = [handler for handler in logger_config['handlers'] if handler != 'file']
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.views import LoginView
 from django.urls import path
-from MainApp.views import main_page, register, edit_map, create_map, MapDetailAPI, custom_logout, profile, docs_index, video_lesson_view, help_view, import_map, terms_of_use_view, privacy_policy_view
+from MainApp.views import main_page, register, edit_map, create_map, MapDetailAPI, PublishedMapAPI, MapOperationsAPI, MapBulkEditAPI, MapNodesAPI, MapEdgesAPI, MapClustersAPI, MapAutosaveAPI, MapAutosaveFlushAPI, custom_logout, profile, docs_index, video_lesson_view, help_view, import_map, terms_of_use_view, privacy_policy_view
 from MainApp import views
 from django.conf import settings
 from django.conf.urls.static import static
@@ -17,6 +17,14 @@ urlpatterns = [
     path('create_map/', create_map, name='create_map'),
     path('maps/import/', import_map, name='import_map'),
     path('api/v1/maps/<int:pk>/', MapDetailAPI.as_view(), name='map-detail'),
+    path('api/v1/public/maps/<int:pk>/', PublishedMapAPI.as_view(), name='public-map'),
+    path('api/v1/maps/<int:pk>/operations/', MapOperationsAPI.as_view(), name='map-operations'),
+    path('api/v1/maps/<int:pk>/nodes/', MapNodesAPI.as_view(), name='map-nodes'),
+    path('api/v1/maps/<int:pk>/edges/', MapEdgesAPI.as_view(), name='map-edges'),
+    path('api/v1/maps/<int:pk>/clusters/', MapClustersAPI.as_view(), name='map-clusters'),
+    path('api/v1/maps/<int:pk>/bulk/', MapBulkEditAPI.as_view(), name='map-bulk-edit'),
+    path('api/v1/maps/<int:pk>/autosave/', MapAutosaveAPI.as_view(), name='map-autosave'),
+    path('api/v1/maps/<int:pk>/autosave/flush/', MapAutosaveFlushAPI.as_view(), name='map-autosave-flush'),
     path('maps/my-maps/', views.user_maps, name='user_maps'),
     path('delete-map/<int:map_id>/', views.delete_map, name='delete_map'),
     path('maps/gallery/', views.maps_gallery, name='maps_gallery'),
@@ -33,3 +41,4 @@ urlpatterns = [
 # Serving media files in development
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += static(settings.MAP_TILES_URL, document_root=settings.MAP_TILES_ROOT)